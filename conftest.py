@@ -0,0 +1,10 @@
+""" pytest configuration. The tests in "/tests/" run without a NEO4J server. "test_installation.py" checks the
+installation against a running NEO4J server and is therefore not collected. """
+import pathlib
+
+collect_ignore = ["test_installation.py"]
+
+path_repo = pathlib.Path(__file__).parent
+path_jsons = pathlib.Path(path_repo, 'src', 'data', 'JSONs')
+path_data_points = pathlib.Path(path_repo, 'src', 'models', 'Ontologies', 'onto4', 'data_points.json')
+path_onto = pathlib.Path(path_repo, 'src', 'models', 'Ontologies', 'onto4', 'Ontology4.ttl')
@@ -1,9 +1,12 @@
+import json
 import pathlib
 from src.A_read_xbrl import XBRL, XHTMLName
-from src.C_read_data import get_data_dicts
-from src.D_graph_construction import GraphConstruction
+from src.C_read_data import get_data_dicts, ColumnarData, iter_data_dicts
+from src.D_graph_construction import GraphConstruction, hash_input_files, read_checkpoint
 from src.F_graph_bot import GraphBot
 from src.G_graph_queries import GraphQueries, ESRS, Stats, Company, CompProp
+from src.I_sparql_enrichment import SparqlEnrichment, SparqlResponseCache
+from src.K_pipeline_manifest import Manifest
 
 from src.models.Ontologies.onto4.params import unique_node_keys, node_value_props
 from settings import path_base, path_ontos, path_data
@@ -15,12 +18,24 @@ def read_xbrl_into_json(xhtml_name: XHTMLName):
     xbrl.read_xbrl_to_json(xhtml_name=xhtml_name)
 
 
-def load_onto_and_show_schema(onto_file_path_or_url: str, path_is_url: bool = False):
+def read_all_xbrls_into_json(max_workers: int = None):
+    xbrl = XBRL()
+    """ Converts all XHTML-files in the "reports"-folder in parallel. Please see: README-modules.md-file. """
+    xbrl.read_xbrls_to_json(max_workers=max_workers)
+
+
+def extract_xbrl_facts_into_json(xhtml_name: XHTMLName):
+    xbrl = XBRL()
+    """ Writes only the data points of "data_points.json" of the report into a JSON-file in "/src/data/JSONs/". """
+    xbrl.extract_facts_to_json(xhtml_path=pathlib.Path(xbrl.reports_path, xhtml_name).as_posix())
+
+
+def load_onto_and_show_schema(onto_file_path_or_url: str, path_is_url: bool = False, kg: GraphConstruction = None):
     """ Loads ontology and schema into NEO4J.
     Attention: All existing data in the Knowledge-Graph will be deleted !
     """
     print('Loading Ontology ... . This might take a few seconds, please be patient!')
-    kg = GraphConstruction(path_to_onto=onto_file_path_or_url)
+    kg = GraphConstruction(path_to_onto=onto_file_path_or_url) if kg is None else kg
     kg.delete_graph()
     kg.init_graph(handle_vocab_uris="IGNORE", handle_mult_vals="OVERWRITE")
     kg.load_onto_or_rdf(path=onto_file_path_or_url, path_is_url=path_is_url, load_onto_only=True)
@@ -33,46 +48,108 @@ def load_data_into_knowledge_graph(onto_file_path_or_url: str,
                                    path_to_jsons: str,
                                    list_of_json_names: list,
                                    delete_and_init_graph: bool = True,
-                                   show_queries: bool = False):
+                                   show_queries: bool = False,
+                                   batch_size: int = None,
+                                   path_to_checkpoint: str = None,
+                                   incremental: bool = False,
+                                   delete_missing: bool = False,
+                                   columnar: bool = False,
+                                   parallel: bool = False,
+                                   streaming: bool = False,
+                                   kg: GraphConstruction = None):
     """ Loads data into NEO4J. The data must be in JSON-format and located in '/src/data/JSONs/'
     (see: 'README-data.md-file'). The path to these JSON-files and the names of the JSON-files must be provided in
-    'path_to_jsons' and 'list_of_json_names'. Cypher queries can be shown if 'show_queries' is set to 'True' """
+    'path_to_jsons' and 'list_of_json_names'. Cypher queries can be shown if 'show_queries' is set to 'True'.
+    If 'batch_size' is set, Nodes and relationships are loaded in batches of 'batch_size' rows per query.
+    If 'path_to_checkpoint' is set, every batch is written in its own transaction and a checkpoint is stored after each
+    committed batch. A re-run with the same JSON-files then resumes from the checkpoint without deleting the graph.
+    If 'incremental' is set, the graph is not deleted and only the differences between the JSON-files and the graph are
+    written, e.g. only for the new JSON-files in 'list_of_json_names'. If 'delete_missing' is set as well, data that is
+    not in the JSON-files is deleted from the graph, so 'list_of_json_names' must then contain ALL JSON-files.
+    If 'columnar' is set, the JSON-files are read into compact arrays (see: 'ColumnarData' in 'C_read_data.py') and the
+    node_data/rel_data dictionaries are only created batch by batch while loading. If 'parallel' is set as well, the
+    JSON-files are read by a pool of processes (see: 'read_json_files_parallel()' in 'C_read_data.py').
+    If 'streaming' is set, the JSON-files are read one by one while loading (see: 'iter_data_dicts()' in
+    'C_read_data.py'), so that memory does not grow with the number of JSON-files. """
     print('Loading data into NEO4J ... . This might take a few seconds, please be patient!')
-    kg = GraphConstruction(path_to_onto=onto_file_path_or_url)
+    kg = GraphConstruction(path_to_onto=onto_file_path_or_url) if kg is None else kg
     all_json_paths: list = [pathlib.Path(path_to_jsons, item).as_posix() for item in list_of_json_names]
+    if columnar or streaming:
+        batch_size = 1000 if batch_size is None else batch_size
+        if streaming:
+            batches = iter_data_dicts(json_paths=all_json_paths, batch_size=batch_size)
+        else:
+            data = ColumnarData()
+            data.read_json_files(all_json_paths=all_json_paths, parallel=parallel)
+            batches = data.iter_batches(batch_size=batch_size)
+        if delete_and_init_graph:
+            kg.delete_graph()
+            kg.init_graph(handle_vocab_uris="MAP", handle_mult_vals="ARRAY", multi_val_prop_list=["industries"])
+        kg.load_batches(unique_node_keys=unique_node_keys, node_value_props=node_value_props, batches=batches,
+                        show_queries=show_queries)
+        print('Done! Loaded data can now be inspected with this Cypher query: "MATCH (n) RETURN n"')
+        return
     node_data, relation_data = get_data_dicts(all_json_paths=all_json_paths)
+    if incremental:
+        changes: dict = kg.load_data_incrementally(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                                   nodes_data=node_data, rels_data=relation_data,
+                                                   batch_size=1000 if batch_size is None else batch_size,
+                                                   delete_missing=delete_missing, show_queries=show_queries)
+        print(f'Done! Relationships inserted: {changes["inserts"]}, updated: {changes["updates"]}, '
+              f'deleted: {changes["deletes"]}.')
+        return
+    if path_to_checkpoint is not None:
+        batch_size = 1000 if batch_size is None else batch_size
+        input_hash: str = hash_input_files(all_json_paths=all_json_paths, batch_size=batch_size)
+        if read_checkpoint(path_to_checkpoint=path_to_checkpoint, input_hash=input_hash) >= 0:
+            delete_and_init_graph = False
     if delete_and_init_graph:
         kg.delete_graph()
         kg.init_graph(handle_vocab_uris="MAP", handle_mult_vals="ARRAY", multi_val_prop_list=["industries"])
-    kg.load_data_into_knowledge_graph(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
-                                      nodes_data=node_data, rels_data=relation_data, show_queries=show_queries)
+    if path_to_checkpoint is not None:
+        kg.load_data_in_transactions(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                     nodes_data=node_data, rels_data=relation_data, all_json_paths=all_json_paths,
+                                     path_to_checkpoint=path_to_checkpoint, batch_size=batch_size,
+                                     show_queries=show_queries)
+    else:
+        kg.load_data_into_knowledge_graph(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                          nodes_data=node_data, rels_data=relation_data, show_queries=show_queries,
+                                          batch_size=batch_size)
     print('Done! Loaded data can now be inspected with this Cypher query: "MATCH (n) RETURN n"')
 
 
-def load_wikidata_data(onto_file_path_or_url: str):
-    """ Loads external data from wikidata for Company Nodes: Industries, Countries and ISINs """
+def load_wikidata_data(onto_file_path_or_url: str, offline: bool = False, kg: GraphConstruction = None):
+    """ Loads external data from wikidata for Company Nodes: Industries, Countries and ISINs.
+    SPARQL responses are cached in '/src/data/sparql_cache.sqlite'. If 'offline' is set, they are only replayed from
+    this cache and wikidata is not called. """
     """IMPORTANT: This must be run ONLY AFTER a knowledge graph has been created and filled with data !!! """
     print('Enriching NEO4J-Graph with wikidata data ... . This might take a few seconds, please be patient!')
-    kg = GraphConstruction(path_to_onto=onto_file_path_or_url)
-    kg.import_wikidata_id()
+    kg = GraphConstruction(path_to_onto=onto_file_path_or_url) if kg is None else kg
+    cache = SparqlResponseCache(path_to_db=pathlib.Path(path_data, 'sparql_cache.sqlite').as_posix())
+    enrichment = SparqlEnrichment(driver=kg.driver, neo4j_db_name=kg.neo4j_db_name, cache=cache, offline=offline)
+    enrichment.import_wikidata_id()
     industry = {"node_label": "Company", "prop_name": "LEI", "prop_wiki_id": "P1278", "new_prop_name": "industries",
                 "new_prop_wiki_id": "P452", "use_new_prop_label": True, "new_prop_is_list": True}
     country = {"node_label": "Company", "prop_name": "LEI", "prop_wiki_id": "P1278", "new_prop_name": "country",
                "new_prop_wiki_id": "P17", "use_new_prop_label": True, "new_prop_is_list": False}
     isin = {"node_label": "Company", "prop_name": "LEI", "prop_wiki_id": "P1278", "new_prop_name": "ISIN",
             "new_prop_wiki_id": "P946", "use_new_prop_label": True, "new_prop_is_list": False}
-    kg.import_data_from_wikidata(**industry)
-    kg.import_data_from_wikidata(**country)
-    kg.import_data_from_wikidata(**isin)
+    # All three properties are fetched with one combined SPARQL query per chunk of Company Nodes:
+    enrichment.import_multiple_data_from_wikidata(props=[industry, country, isin])
     print('Done! Industries, Countries and ISINs data loaded into NEO4J.')
 
 
-def load_dbpedia_data(onto_file_path_or_url: str):
-    """ Loads external data from dbpedia for Company Nodes: abstract ("Company description") """
+def load_dbpedia_data(onto_file_path_or_url: str, offline: bool = False, kg: GraphConstruction = None):
+    """ Loads external data from dbpedia for Company Nodes: abstract ("Company description").
+    SPARQL responses are cached in '/src/data/sparql_cache.sqlite'. If 'offline' is set, they are only replayed from
+    this cache and wikidata/dbpedia are not called. """
     """IMPORTANT: This must be run ONLY AFTER a knowledge graph has been created and filled with data !!! """
     print('Enriching NEO4J-Graph with dbpedia data ... . This might take a few seconds, please be patient!')
-    kg = GraphConstruction(path_to_onto=onto_file_path_or_url)
-    kg.import_wikidata_id()
+    kg = GraphConstruction(path_to_onto=onto_file_path_or_url) if kg is None else kg
+    cache = SparqlResponseCache(path_to_db=pathlib.Path(path_data, 'sparql_cache.sqlite').as_posix())
+    enrichment = SparqlEnrichment(driver=kg.driver, neo4j_db_name=kg.neo4j_db_name, cache=cache, offline=offline)
+    # Company Nodes that already have a "wikidataID" (see: "load_wikidata_data()") are not looked up again:
+    enrichment.import_wikidata_id()
     company_abstract = {
         "node_label": "Company",
         "prop_name": "wikidataID",
@@ -81,23 +158,111 @@ def load_dbpedia_data(onto_file_path_or_url: str):
         "new_prop_dbp_id": f"dbo:abstract",
         "new_prop_is_list": False
     }
-    kg.import_data_from_dbpedia(**company_abstract)
+    enrichment.import_data_from_dbpedia(**company_abstract)
     print('Done! Abstract ("Company Description") loaded into NEO4J.')
 
 
 def create_text_embedding(onto_file_path_or_url: str, node_label: str,
-                          node_primary_prop_name: str, prop_to_embed: str):
-    """ Creates text embeddings for a string property of a Node. """
+                          node_primary_prop_name: str, prop_to_embed: str,
+                          embedding_cache_dir: str or None = pathlib.Path(path_data, 'embedding_cache').as_posix(),
+                          kg: GraphConstruction = None):
+    """ Creates text embeddings for a string property of a Node. Embeddings of texts that were already embedded are
+    read from the embedding cache in 'embedding_cache_dir' (see: 'EmbeddingCache' in 'embedding_cache.py'). If
+    'embedding_cache_dir' is set to 'None', all texts are embedded again. """
     """IMPORTANT: This must be run ONLY AFTER a knowledge graph has been created and the respective Node ('node_label') 
     has a string/text property ('prop_to_embed') !!! """
     print(f'Creating text embedding for property "{prop_to_embed}" of Node "{node_label}" ... . '
           f'This might take a few seconds, please be patient!')
-    kg = GraphConstruction(path_to_onto=onto_file_path_or_url)
+    kg = GraphConstruction(path_to_onto=onto_file_path_or_url) if kg is None else kg
     kg.create_text_embedding(node_label=node_label, node_primary_prop_name=node_primary_prop_name,
-                             prop_to_embed=prop_to_embed)
+                             prop_to_embed=prop_to_embed, embedding_cache_dir=embedding_cache_dir)
     print(f'Done! Text embedding for property "{prop_to_embed}" of Node "{node_label}" was created.')
 
 
+def run_incremental_pipeline(onto_file_path_or_url: str, path_to_jsons: str, convert_reports: bool = True,
+                             enrich: bool = True, embed: bool = True, offline: bool = False,
+                             path_to_manifest: str = None,
+                             embedding_cache_dir: str or None = pathlib.Path(path_data, 'embedding_cache').as_posix()):
+    """ Runs the stages 0. (XBRL -> JSON), 2. (JSON -> KG), 3./4. (enrichment) and 5. (embedding) below, but only
+    for what has changed since the last run. The content hashes of all inputs and the outputs of each stage are
+    recorded in a manifest (default: '/src/data/pipeline_manifest.json', see: 'K_pipeline_manifest.py'):
+    - XBRL -> JSON: only new or changed reports are converted with 'extract_facts_to_json()' into 'path_to_jsons'.
+    - JSON -> KG: if the ontology or 'params.py' changed (or at the first run), the KG is rebuilt. Otherwise only new
+      or changed JSON-files are loaded with 'incremental=True'. If JSON-files were removed, all JSON-files are compared
+      with the KG and the data missing in them is deleted.
+    - Enrichment and embedding only run if the set of companies (LEIs) or the ontology/params changed. Embeddings
+      of unchanged abstracts are reused from 'embedding_cache_dir' (see: 'EmbeddingCache' in 'embedding_cache.py').
+    A report that fails to convert is reported and retried in the next run. A stage is only recorded in the manifest
+    after it completed, so a run that fails in between repeats the stage next time. All stages share one
+    'GraphConstruction', so the ontology and the query templates are only loaded once per run. """
+    manifest = Manifest(path_to_manifest=path_to_manifest)
+    kg = GraphConstruction(path_to_onto=onto_file_path_or_url)
+
+    if convert_reports:
+        xbrl = XBRL()
+        reports_path = pathlib.Path(xbrl.reports_path)
+        xhtml_paths: list = sorted(path.as_posix() for path in reports_path.glob('*')
+                                   if path.suffix.lower() in ('.xhtml', '.html')) if reports_path.is_dir() else []
+        changed_reports: list = manifest.get_changed_files(stage='xbrl', paths=xhtml_paths)
+        print(f'INFO: XBRL -> JSON: {len(changed_reports)} of {len(xhtml_paths)} reports are new or changed.')
+        for xhtml_path in changed_reports:
+            try:
+                json_paths: list = xbrl.extract_facts_to_json(xhtml_path=xhtml_path, target_path=path_to_jsons)
+            except Exception as error:
+                print(f'INFO: XBRL -> JSON: Report "{xhtml_path}" failed and is retried next run: {error}')
+                continue
+            manifest.set_file_done(stage='xbrl', path=xhtml_path, outputs=json_paths)
+
+    path_to_params: str = pathlib.Path(path_ontos, 'onto4', 'params.py').as_posix()
+    schema_hash: str = manifest.hash_inputs(paths=[onto_file_path_or_url, path_to_params])
+    json_paths: list = sorted(path.as_posix() for path in pathlib.Path(path_to_jsons).glob('*.json'))
+    if not manifest.is_up_to_date(stage='schema', inputs_hash=schema_hash):
+        print('INFO: JSON -> KG: Ontology or params changed, the KG is rebuilt.')
+        manifest.reset_stage(stage='graph')
+        load_data_into_knowledge_graph(onto_file_path_or_url=onto_file_path_or_url, path_to_jsons=path_to_jsons,
+                                       list_of_json_names=[pathlib.Path(path).name for path in json_paths],
+                                       delete_and_init_graph=True, kg=kg)
+        for json_path in json_paths:
+            manifest.set_file_done(stage='graph', path=json_path)
+        manifest.set_up_to_date(stage='schema', inputs_hash=schema_hash)
+    else:
+        removed_jsons: list = manifest.get_removed_files(stage='graph', paths=json_paths)
+        changed_jsons: list = json_paths if removed_jsons else manifest.get_changed_files(stage='graph',
+                                                                                          paths=json_paths)
+        print(f'INFO: JSON -> KG: {len(changed_jsons)} JSON-files to load, {len(removed_jsons)} removed.')
+        if changed_jsons:
+            load_data_into_knowledge_graph(onto_file_path_or_url=onto_file_path_or_url, path_to_jsons=path_to_jsons,
+                                           list_of_json_names=[pathlib.Path(path).name for path in changed_jsons],
+                                           incremental=True, delete_missing=bool(removed_jsons), kg=kg)
+            for json_path in changed_jsons:
+                manifest.set_file_done(stage='graph', path=json_path)
+            manifest.remove_files(stage='graph', paths=removed_jsons)
+
+    leis: list = list()
+    for json_path in json_paths:
+        try:
+            with open(file=json_path, mode="r", encoding="utf-8") as file:
+                leis.append(json.load(file)['LEI'])
+        except (OSError, ValueError, KeyError) as error:
+            print(f'INFO: JSON-file "{json_path}" has no readable LEI and is ignored for the companies: {error}')
+    companies_hash: str = manifest.hash_inputs(values={'schema': schema_hash, 'LEIs': sorted(set(leis))})
+    if enrich:
+        if manifest.is_up_to_date(stage='enrichment', inputs_hash=companies_hash):
+            print('INFO: Enrichment: No new companies, skipped.')
+        else:
+            load_wikidata_data(onto_file_path_or_url=onto_file_path_or_url, offline=offline, kg=kg)
+            load_dbpedia_data(onto_file_path_or_url=onto_file_path_or_url, offline=offline, kg=kg)
+            manifest.set_up_to_date(stage='enrichment', inputs_hash=companies_hash)
+    if embed:
+        if manifest.is_up_to_date(stage='embedding', inputs_hash=companies_hash):
+            print('INFO: Embedding: No new companies, skipped.')
+        else:
+            create_text_embedding(onto_file_path_or_url=onto_file_path_or_url, node_label="Company",
+                                  node_primary_prop_name="LEI", prop_to_embed="abstract",
+                                  embedding_cache_dir=embedding_cache_dir, kg=kg)
+            manifest.set_up_to_date(stage='embedding', inputs_hash=companies_hash)
+
+
 def ask_graph_bot(question: str):
     """ Retrieval Augmented Generation (RAG) of NEO4J Cypher queries with the help of the langchain library.
     Function will make use of OpenAI-API and Large Language Models (LLMs) to convert human-readable questions to
@@ -181,16 +346,24 @@ def execute_graph_queries(esrs_1: ESRS, company: Company, periods: list, return_
     comp_prop_3 = q.get_esrs_by_company_property(esrs=esrs_1, comp_prop=CompProp.Country, periods=periods, stat=stat,
                                                  return_df=True)
     print('Answer:\n', comp_prop_3)
+    print('-------------------------------------------------------------------------------')
+    print(f'Question: What were "{esrs_1.name}" and "{esrs_2.name}" of all companies in {periods} ?')
+    table = q.get_esrs_table(esrs_list=[esrs_1, esrs_2], companies=None, periods=periods)
+    print('Answer:\n', table)
 
 
 if __name__ == '__main__':
     # TODO: UNCOMMENT THOSE FUNCTIONS YOU WANT TO RUN
     """ 0. Read XBRL-file into JSON-file. Please see: README-data.md-file. """
     # read_xbrl_into_json(xhtml_name=XHTMLName.Adidas)
+    # read_all_xbrls_into_json()
+    # extract_xbrl_facts_into_json(xhtml_name=XHTMLName.Adidas)
 
     """ -----------------------------------  NEO4J ----------------------------------------------- """
     # ## This ttl-file is needed for 1. to 5.:
     # onto_file_path_or_url: str = path_ontos.as_posix() + "/onto4/Ontology4.ttl"
+    # ## Optional: Pass the same 'kg=kg' to 1. to 5., so that the ontology and query templates are only loaded once:
+    # kg = GraphConstruction(path_to_onto=onto_file_path_or_url)
 
     """ 1. Load ontology and show schema of knowledge graph in browser. Please see: README-models.md-file. """
     # load_onto_and_show_schema(onto_file_path_or_url=onto_file_path_or_url, path_is_url=False)
@@ -214,6 +387,10 @@ if __name__ == '__main__':
     # create_text_embedding(onto_file_path_or_url=onto_file_path_or_url, node_label="Company",
     #                       node_primary_prop_name="LEI", prop_to_embed="abstract")
 
+    """ 0.-5. Run only the stages/files whose inputs have changed since the last run. """
+    # run_incremental_pipeline(onto_file_path_or_url=onto_file_path_or_url,
+    #                          path_to_jsons=path_data.as_posix() + "/JSONs/")
+
     """ 6. GraphBot: RAG (Retrieval Augmented Generation) with NEO4J Graph """
     # ## Uncomment just ONE question:
     # question = "How much of TotalUseOfLandArea did BASF have in the year 2023?"
@@ -5,4 +5,11 @@ path_base = pathlib.Path("C:/Users/rainer/PycharmProjects/UASFRA-MS-PROJDIGI")
 path_data = pathlib.Path(path_base, "src/data/")
 path_models = pathlib.Path(path_base, "src/models/")
 path_ontos = pathlib.Path(path_models, "Ontologies")
+path_research = pathlib.Path(path_base, "research/")
 
+
+# NEO4J CONNECTION (can be overridden by the environment variables of the same name in upper case, i.e. in "secrets.env")
+neo4j_uri = "neo4j://localhost:7687"
+neo4j_max_connection_pool_size = 100
+neo4j_connection_acquisition_timeout = 60.0  # seconds
+neo4j_max_connection_lifetime = 3600  # seconds
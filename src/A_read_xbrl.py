@@ -1,10 +1,26 @@
+import json
+import os
 import pathlib
+import pickle
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from enum import StrEnum
+from importlib.metadata import version
+from typing import Iterable
 
 from xbrl.cache import HttpCache
 from xbrl.instance import XbrlParser, XbrlInstance
+from xbrl.taxonomy import TaxonomyParser, TaxonomySchema
 
 from settings import path_data
+from src.C_read_data import load_data_points
+
+# Namespaces of inline XBRL (iXBRL) and of the XBRL instance, see: https://www.xbrl.org/specification/inlinexbrl-part1/
+IX_NS = '{http://www.xbrl.org/2013/inlineXBRL}'
+XBRLI_NS = '{http://www.xbrl.org/2003/instance}'
+LEI_SCHEME = 'http://standards.iso.org/iso/17442'
 
 
 class XHTMLName(StrEnum):
@@ -16,23 +32,328 @@ class XHTMLName(StrEnum):
 
 class XBRL:
 
-    def __init__(self):
+    def __init__(self, use_taxonomy_snapshot: bool = True):
         self.source_path: str = pathlib.Path(path_data, 'XBRLs', 'raw').as_posix()
         self.reports_path: str = pathlib.Path(self.source_path, 'reports').as_posix()
         self.target_path: str = pathlib.Path(path_data, 'XBRLs', 'xbrl_to_json').as_posix()
+        self.use_taxonomy_snapshot: bool = use_taxonomy_snapshot
+        # The pickled classes of py-xbrl may change between versions, so every version gets its own snapshot:
+        self.snapshot_path: str = pathlib.Path(self.source_path, 'taxonomy_snapshots',
+                                               f'py-xbrl_{version("py-xbrl")}.pickle').as_posix()
+        # The workers of "read_xbrls_to_json()" write their taxonomies into their own part-file (see: "init_worker()"):
+        self.snapshot_part_path: str or None = None
+        self._parser: XbrlParser or None = None
+        self._snapshot_keys: set[str] = set()
+        self._loaded_keys: set[str] = set()
+
+    @property
+    def parser(self) -> XbrlParser:
+        """ The HttpCache and XbrlParser are created once and reused for all reports, so that taxonomies that were
+        already parsed for a report are not parsed again. If "use_taxonomy_snapshot" is set, the taxonomies parsed
+        in earlier runs are loaded from the snapshot (see: "load_taxonomy_snapshot()"). """
+        if self._parser is None:
+            cache: HttpCache = HttpCache(cache_dir=self.source_path, verify_https=True)
+            # The default of 60 taxonomies is too small for the ESEF/IFRS-taxonomies of several reports:
+            tax_parser: TaxonomyParser = TaxonomyParser(cache=cache, max_taxonomy_cache_size=10000)
+            self._parser = XbrlParser(cache=cache, taxParser=tax_parser)
+            if self.use_taxonomy_snapshot:
+                self.load_taxonomy_snapshot()
+        return self._parser
+
+    def load_taxonomy_snapshot(self):
+        """ Loads the parsed taxonomies (TaxonomySchema-objects with their concepts, labels and linkbases) from the
+        snapshot-file into the taxonomy cache of the parser, so that they are not parsed again. The snapshot is
+        ignored if one of its schema-files was changed after the snapshot was written. """
+        taxonomies: OrderedDict[str, TaxonomySchema] or None = read_taxonomy_snapshot(snapshot_path=self.snapshot_path)
+        if taxonomies is None:
+            return
+        self.parser.taxParser.taxonomy_cache.update(taxonomies)
+        self._snapshot_keys = set(taxonomies)
+        self._loaded_keys = set(taxonomies)
+
+    def save_taxonomy_snapshot(self):
+        """ Writes all taxonomies in the taxonomy cache of the parser into the snapshot-file, if taxonomies were
+        parsed that are not in the snapshot yet. Taxonomies that were written into the snapshot-file by another
+        process in the meantime are merged, so that they are kept. The file is replaced atomically.
+        If "snapshot_part_path" is set (workers of "read_xbrls_to_json()"), only the taxonomies that were not loaded
+        from the snapshot are written into this part-file. The part-files of all workers are merged into the
+        snapshot-file once, after all reports are converted (see: "merge_taxonomy_snapshots()"). """
+        taxonomies: OrderedDict[str, TaxonomySchema] = self.parser.taxParser.taxonomy_cache
+        if not self.use_taxonomy_snapshot or set(taxonomies) <= self._snapshot_keys:
+            return
+        if self.snapshot_part_path is not None:
+            write_taxonomy_snapshot(snapshot_path=self.snapshot_part_path,
+                                    taxonomies=OrderedDict((key, taxonomy) for key, taxonomy in taxonomies.items()
+                                                           if key not in self._loaded_keys))
+        else:
+            on_disk: OrderedDict[str, TaxonomySchema] = read_taxonomy_snapshot(snapshot_path=self.snapshot_path)
+            for key, taxonomy in (on_disk or dict()).items():
+                if key not in taxonomies:
+                    taxonomies[key] = taxonomy
+            write_taxonomy_snapshot(snapshot_path=self.snapshot_path, taxonomies=taxonomies)
+        self._snapshot_keys = set(taxonomies)
 
     def read_xbrl_to_json(self, xhtml_name: XHTMLName):
         print(f'XBRL-File for {xhtml_name.name} will be parsed. This might take a few seconds. Please be patient!')
-        cache: HttpCache = HttpCache(cache_dir=self.source_path, verify_https=True)
-        parser: XbrlParser = XbrlParser(cache=cache)
         xhtml_path: str = pathlib.Path(self.reports_path, xhtml_name).as_posix()
-        instance: XbrlInstance = parser.parse_instance(uri=xhtml_path, encoding="utf-8")
+        instance: XbrlInstance = self.parser.parse_instance(uri=xhtml_path, encoding="utf-8")
         json_path: str = pathlib.Path(self.target_path, f'{xhtml_name.name}.json').as_posix()
         instance.json(file_path=json_path)
+        self.save_taxonomy_snapshot()
         print(f'XBRL-File for {xhtml_name.name} was parsed and the json-file was saved to: {json_path}')
 
+    def convert_report(self, xhtml_path: str) -> dict:
+        """ Parses one report and writes its JSON-file into the "xbrl_to_json"-folder. The JSON-file is named after
+        the XHTMLName of the report (e.g. "BASF.json") or, if the report is not in XHTMLName, after the report file.
+        Errors are not raised but returned, so that one broken report does not stop a batch.
+        Returns the report name, the path of the JSON-file, the number of facts, the duration and the error (if any). """
+        report: str = pathlib.Path(xhtml_path).name
+        json_name: str = next((item.name for item in XHTMLName if item.value == report), pathlib.Path(report).stem)
+        json_path: str = pathlib.Path(self.target_path, f'{json_name}.json').as_posix()
+        result: dict = {'report': report, 'json_path': json_path, 'facts': 0, 'seconds': 0.0, 'error': None}
+        start = time.perf_counter()
+        try:
+            instance: XbrlInstance = self.parser.parse_instance(uri=xhtml_path, encoding="utf-8")
+            instance.json(file_path=json_path)
+            result['facts'] = len(instance.facts)
+            self.save_taxonomy_snapshot()
+        except Exception as error:
+            result['json_path'] = None
+            result['error'] = f'{type(error).__name__}: {error}'
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        return result
+
+    def extract_facts_to_json(self, xhtml_path: str, label: str = None, concepts: list[str] = None,
+                              target_path: str = None, periods: list[str] = None) -> list[str]:
+        """ Extracts only the facts of "concepts" (default: the data points in "data_points.json", see:
+        "load_data_points()" in "C_read_data.py") from the report with "extract_ixbrl_facts()" and writes them in
+        the shape of the JSON-files in "/src/data/JSONs/" (period, label, LEI and one value per data point) into
+        "target_path" (default: "/src/data/JSONs/"). Data points that are not in the report are written as null.
+        Unlike "read_xbrl_to_json()", neither the taxonomies nor the whole report are parsed. Only facts without
+        dimensions are used.
+        "label" is the company name (default: the XHTMLName of the report or the report file). One file per period
+        (year) in "periods" is written (default: only the latest period of the report, i.e. the reporting year).
+        Returns the paths of the JSON-files (none if the report has no facts of "concepts"). """
+        report: str = pathlib.Path(xhtml_path).name
+        if label is None:
+            label = next((item.name for item in XHTMLName if item.value == report), pathlib.Path(report).stem)
+        concepts = list(load_data_points()) if concepts is None else list(concepts)
+        target_path = pathlib.Path(path_data, 'JSONs').as_posix() if target_path is None else target_path
+
+        extracted: dict = extract_ixbrl_facts(xhtml_path=xhtml_path, concepts=set(concepts))
+        companies_periods: dict[tuple:dict] = dict()
+        for fact in extracted['facts']:
+            context: dict = extracted['contexts'].get(fact['context'])
+            if context is None or context['dimensional']:
+                continue
+            key: tuple = (context['lei'], context['period'])
+            if key not in companies_periods:
+                companies_periods[key] = {'period': context['period'], 'label': label, 'LEI': context['lei'],
+                                          **{concept: None for concept in concepts}}
+            # iXBRL-reports may contain the same fact several times, the first one is kept:
+            if companies_periods[key][fact['concept']] is None:
+                companies_periods[key][fact['concept']] = fact['value']
+        if not companies_periods:
+            print(f"INFO: Report '{report}' does not contain any facts of the {len(concepts)} concepts. "
+                  f"No JSON-file was written.")
+            return list()
+        if periods is None:
+            periods = [max(period for _, period in companies_periods)]
+
+        pathlib.Path(target_path).mkdir(parents=True, exist_ok=True)
+        json_paths: list[str] = list()
+        for (lei, period), company_period in companies_periods.items():
+            if period not in periods:
+                continue
+            json_path: str = pathlib.Path(target_path, f'{label}_{period}.json').as_posix()
+            with open(file=json_path, mode="w", encoding="utf-8") as file:
+                json.dump(company_period, file, indent=2)
+            json_paths.append(json_path)
+            found: int = sum(value is not None for value in company_period.values()) - 3
+            print(f'INFO: {found} of {len(concepts)} facts of {report} for {period} were saved to: '
+                  f'{json_path}')
+        return json_paths
+
+    def read_xbrls_to_json(self, reports_path: str = None, target_path: str = None, max_workers: int = None) -> dict:
+        """ Converts all XHTML-reports ("*.xhtml", "*.html") in "reports_path" (default: the "reports"-folder) into
+        JSON-files in "target_path" (default: the "xbrl_to_json"-folder) with a pool of "max_workers" processes
+        (default: number of CPUs). Every process creates its parser (and cache) once and reuses it for all of its
+        reports. The taxonomies that the processes parsed are merged into the taxonomy snapshot once at the end (see:
+        "save_taxonomy_snapshot()"). A run summary with the timings, fact counts and failures is written to
+        "run_summary.json" in "target_path" and returned. """
+        reports_path = self.reports_path if reports_path is None else reports_path
+        target_path = self.target_path if target_path is None else target_path
+        if not pathlib.Path(reports_path).is_dir():
+            raise ValueError(f"Path to reports '{reports_path}' does not exist!")
+        xhtml_paths: list[str] = sorted(path.as_posix() for path in pathlib.Path(reports_path).iterdir()
+                                        if path.suffix.lower() in ('.xhtml', '.html'))
+        print(f'INFO: {len(xhtml_paths)} XBRL-Files will be parsed. This might take a few minutes. Please be patient!')
+        pathlib.Path(target_path).mkdir(parents=True, exist_ok=True)
+
+        start = time.perf_counter()
+        results: list[dict] = list()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                 initargs=(target_path, self.use_taxonomy_snapshot)) as executor:
+            futures = [executor.submit(convert_report_in_worker, xhtml_path) for xhtml_path in xhtml_paths]
+            for future in as_completed(futures):
+                result: dict = future.result()
+                results.append(result)
+                status: str = f"{result['facts']} facts" if result['error'] is None else f"FAILED ({result['error']})"
+                print(f"INFO: {result['report']}: {status} in {result['seconds']} seconds.")
+        if self.use_taxonomy_snapshot:
+            merge_taxonomy_snapshots(snapshot_path=self.snapshot_path)
+
+        failures: list[dict] = [result for result in results if result['error'] is not None]
+        summary: dict = {'reports': len(results),
+                         'converted': len(results) - len(failures),
+                         'failed': len(failures),
+                         'facts': sum(result['facts'] for result in results),
+                         'seconds': round(time.perf_counter() - start, 3),
+                         'results': sorted(results, key=lambda item: item['report'])}
+        with open(file=pathlib.Path(target_path, 'run_summary.json'), mode="w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+        print(f"INFO: {summary['converted']} of {summary['reports']} XBRL-Files converted in {summary['seconds']} "
+              f"seconds ({summary['failed']} failed). See: {pathlib.Path(target_path, 'run_summary.json')}")
+        return summary
+
+
+def get_file_stats(paths: Iterable[str]) -> dict[str:tuple]:
+    """ Returns size and modification time of every file in "paths" (None if the file does not exist). """
+    stats: dict[str:tuple] = dict()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats[path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stats[path] = None
+    return stats
+
+
+def read_taxonomy_snapshot(snapshot_path: str) -> OrderedDict or None:
+    """ Returns the taxonomies of a snapshot-file or None if the file does not exist or if one of its schema-files
+    was changed after the snapshot was written. """
+    if not pathlib.Path(snapshot_path).is_file():
+        return None
+    with open(file=snapshot_path, mode="rb") as file:
+        snapshot: dict = pickle.load(file)
+    if snapshot['files'] != get_file_stats(snapshot['files']):
+        print(f'INFO: Schema-files were changed. The taxonomy snapshot {snapshot_path} will be rebuilt.')
+        return None
+    return snapshot['taxonomies']
+
+
+def write_taxonomy_snapshot(snapshot_path: str, taxonomies: OrderedDict):
+    """ Writes the taxonomies and the stats of their schema-files into a snapshot-file. The file is replaced
+    atomically. """
+    snapshot: dict = {'files': get_file_stats(taxonomies), 'taxonomies': taxonomies}
+    pathlib.Path(snapshot_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path: str = f'{snapshot_path}.{os.getpid()}.tmp'
+    with open(file=tmp_path, mode="wb") as file:
+        pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, snapshot_path)
+
+
+def merge_taxonomy_snapshots(snapshot_path: str):
+    """ Merges the part-files ("<snapshot_path>.<pid>.part") that the workers of "read_xbrls_to_json()" wrote into
+    the snapshot-file with one write and removes them. """
+    part_paths: list[pathlib.Path] = sorted(pathlib.Path(snapshot_path).parent.glob(
+        f'{pathlib.Path(snapshot_path).name}.*.part'))
+    if not part_paths:
+        return
+    taxonomies: OrderedDict = read_taxonomy_snapshot(snapshot_path=snapshot_path) or OrderedDict()
+    for part_path in part_paths:
+        taxonomies.update(read_taxonomy_snapshot(snapshot_path=part_path.as_posix()) or dict())
+        part_path.unlink()
+    write_taxonomy_snapshot(snapshot_path=snapshot_path, taxonomies=taxonomies)
+
+
+def parse_ixbrl_number(text: str, number_format: str = None, scale: str = None, sign: str = None) -> float:
+    """ Converts the displayed text of an "ix:nonFraction"-fact into its value, i.e. applies the transformation in
+    "format" (such as "ixt:num-dot-decimal" or "ixt:num-comma-decimal"), the "scale" (power of ten) and the "sign". """
+    number_format = '' if number_format is None else number_format.split(':')[-1].lower()
+    if 'zero' in number_format or 'dash' in number_format:  # e.g. "ixt:fixed-zero" for a displayed "-"
+        value: float = 0.0
+    else:
+        text = ''.join(text.split())
+        if 'comma' in number_format:  # e.g. "ixt:num-comma-decimal": 1.234,5
+            text = text.replace('.', '').replace("'", '').replace(',', '.')
+        else:  # e.g. "ixt:num-dot-decimal": 1,234.5
+            text = text.replace(',', '').replace("'", '')
+        value: float = float(text)
+    if scale:
+        value *= 10 ** int(scale)
+    return -value if sign == '-' and value != 0 else value
+
+
+def extract_ixbrl_facts(xhtml_path: str, concepts: set[str]) -> dict:
+    """ Reads an inline XBRL-report (XHTML) element by element (xml.etree.ElementTree.iterparse()) and only keeps the
+    "ix:nonFraction"-facts whose concept (without prefix, e.g. "GrossScope1GHGEmissions") is in "concepts" as well as
+    the contexts (LEI, period year and whether the context has dimensions) and units. All other elements are
+    discarded as soon as they are read, so memory does not grow with the size of the report.
+    Returns: {'facts': [{'concept', 'context', 'unit', 'value'}, ...], 'contexts': {id: {...}}, 'units': {id: str}} """
+    facts: list[dict] = list()
+    contexts: dict[str:dict] = dict()
+    units: dict[str:str] = dict()
+    # Elements are only discarded outside of facts, contexts and units, as their content is read at their end:
+    kept_tags: tuple = (f'{IX_NS}nonFraction', f'{XBRLI_NS}context', f'{XBRLI_NS}unit')
+    parents: list[ET.Element] = list()
+    depth_kept: int = 0
+    for event, element in ET.iterparse(xhtml_path, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            depth_kept += element.tag in kept_tags
+            continue
+        parents.pop()
+        if element.tag == f'{IX_NS}nonFraction':
+            concept: str = element.get('name', '').split(':')[-1]
+            nil: bool = element.get('{http://www.w3.org/2001/XMLSchema-instance}nil') == 'true'
+            if concept in concepts and not nil:
+                facts.append({'concept': concept,
+                              'context': element.get('contextRef'),
+                              'unit': element.get('unitRef'),
+                              'value': parse_ixbrl_number(text=''.join(element.itertext()),
+                                                          number_format=element.get('format'),
+                                                          scale=element.get('scale'),
+                                                          sign=element.get('sign'))})
+        elif element.tag == f'{XBRLI_NS}context':
+            identifier: ET.Element = element.find(f'{XBRLI_NS}entity/{XBRLI_NS}identifier')
+            end: ET.Element = element.find(f'{XBRLI_NS}period/{XBRLI_NS}endDate')
+            end = element.find(f'{XBRLI_NS}period/{XBRLI_NS}instant') if end is None else end
+            contexts[element.get('id')] = {
+                'lei': identifier.text.strip() if identifier is not None and
+                identifier.get('scheme') == LEI_SCHEME else None,
+                'period': end.text.strip()[:4] if end is not None else None,
+                'dimensional': element.find(f'.//{XBRLI_NS}segment') is not None or
+                element.find(f'.//{XBRLI_NS}scenario') is not None}
+        elif element.tag == f'{XBRLI_NS}unit':
+            units[element.get('id')] = ' / '.join(measure.text.strip()
+                                                  for measure in element.iter(f'{XBRLI_NS}measure'))
+        depth_kept -= element.tag in kept_tags
+        if depth_kept == 0:
+            element.clear()
+            if parents:
+                parents[-1].remove(element)
+    return {'facts': facts, 'contexts': contexts, 'units': units}
+
+
+# One XBRL-object (and thus one parser and cache) per worker process of "read_xbrls_to_json()":
+worker_xbrl: XBRL or None = None
+
+
+def init_worker(target_path: str, use_taxonomy_snapshot: bool = True):
+    global worker_xbrl
+    worker_xbrl = XBRL(use_taxonomy_snapshot=use_taxonomy_snapshot)
+    worker_xbrl.target_path = target_path
+    worker_xbrl.snapshot_part_path = f'{worker_xbrl.snapshot_path}.{os.getpid()}.part'
+
+
+def convert_report_in_worker(xhtml_path: str) -> dict:
+    return worker_xbrl.convert_report(xhtml_path=xhtml_path)
+
 
 if __name__ == '__main__':
     xbrl = XBRL()
     """ XHTMLName is a StrEnum. Just choose between the Enum.name such as XHTMLName.Adidas or XHTMLName.BASF, etc. """
-    xbrl.read_xbrl_to_json(xhtml_name=XHTMLName.Adidas)
+    # xbrl.read_xbrl_to_json(xhtml_name=XHTMLName.Adidas)
+    """ Or convert all reports in the "reports"-folder at once: """
+    xbrl.read_xbrls_to_json()
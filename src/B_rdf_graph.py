@@ -1,10 +1,17 @@
+import hashlib
 import json
+import os
+import pathlib
 
 from rdflib import Graph
 from rdflib.namespace import RDFS, RDF, OWL
 
 from settings import path_ontos
 
+# Part of the key of cached query templates. Must be increased whenever "create_query_templates()" creates different
+# query templates, so that templates cached by an older version of this module are not used anymore:
+TEMPLATE_CACHE_VERSION: int = 1
+
 
 class RDFGraph:
     """ This class creates cypher query templates based on a given ontology and based on Node properties as described by
@@ -12,16 +19,40 @@ class RDFGraph:
         - unique_node_keys
         - node_value_props
     Please see README-models.md for further details.
+    If a "cache_dir" is provided, the query templates are stored there, keyed by a hash of the ontology file, of the
+    two dictionaries and of "TEMPLATE_CACHE_VERSION". As the ontology is only parsed when needed, a cached call of "create_query_templates()" does not
+    parse the ontology at all.
     """
 
-    def __init__(self, path_to_onto: str, rdf_format: str = "ttl"):
-        self.rdf_graph: Graph = Graph()
+    def __init__(self, path_to_onto: str, rdf_format: str = "ttl", cache_dir: str = None):
+        self.path_to_onto: str = path_to_onto
+        self.rdf_format: str = rdf_format
+        self.cache_dir: str = cache_dir
+        self._rdf_graph: Graph or None = None
+        self._index: dict or None = None
         self.nodes_data_needed = dict()
         self.rels_data_needed = dict()
-        try:
-            self.rdf_graph.parse(path_to_onto, format=rdf_format)
-        except:
-            print('ERROR: rdf_graph could not be parsed!')
+
+    @property
+    def rdf_graph(self) -> Graph:
+        if self._rdf_graph is None:
+            self._rdf_graph = Graph()
+            try:
+                self._rdf_graph.parse(self.path_to_onto, format=self.rdf_format)
+            except:
+                print('ERROR: rdf_graph could not be parsed!')
+        return self._rdf_graph
+
+    def get_template_cache_path(self, unique_node_keys: dict, node_value_props: dict,
+                                unwind_rows: bool) -> pathlib.Path or None:
+        """ Returns the path of the cached query templates for the ontology file and the parameters or None if there
+        is no "cache_dir" or if the ontology is not a local file. """
+        if self.cache_dir is None or not pathlib.Path(self.path_to_onto).is_file():
+            return None
+        sha = hashlib.sha256(pathlib.Path(self.path_to_onto).read_bytes())
+        sha.update(json.dumps([unique_node_keys, node_value_props, unwind_rows, self.rdf_format,
+                               TEMPLATE_CACHE_VERSION], sort_keys=True).encode('utf-8'))
+        return pathlib.Path(self.cache_dir, f'query_templates_{sha.hexdigest()}.json')
 
     def get_local_part(self, uri: str):
         pos = -1
@@ -41,58 +72,98 @@ class RDFGraph:
             pos = uri.rindex(':')
         return uri[0:pos + 1]
 
+    def get_index(self) -> dict:
+        """ Builds (once) an index of the ontology with one pass over all triples:
+            - classes:          list of all Class names (local parts)
+            - node_props:       Class name -> list of its DatatypeProperties
+            - relationships:    list of {'SOURCE': ..., 'TARGET': ..., 'REL': ...} for all ObjectProperties
+            - namespaces:       set of URIs of Classes with DatatypeProperties, of these DatatypeProperties and of all
+                                ObjectProperties
+        All introspection methods below use this index instead of nested "triples()"-scans. """
+        if self._index is not None:
+            return self._index
+        classes, datatype_props, object_props = dict(), dict(), dict()
+        domains, ranges = dict(), dict()
+        for (subj, pred, obj) in self.rdf_graph:
+            if pred == RDF.type:
+                if obj == OWL.Class:
+                    classes[subj] = None
+                elif obj == OWL.DatatypeProperty:
+                    datatype_props[subj] = None
+                elif obj == OWL.ObjectProperty:
+                    object_props[subj] = None
+            elif pred == RDFS.domain:
+                domains.setdefault(subj, list()).append(obj)
+            elif pred == RDFS.range:
+                ranges.setdefault(subj, list()).append(obj)
+
+        node_props: dict[str, list[str]] = dict()
+        namespaces: set = set()
+        for prop in datatype_props:
+            for domain in domains.get(prop, list()):
+                if domain in classes:
+                    node_props.setdefault(self.get_local_part(domain), list()).append(self.get_local_part(prop))
+                    namespaces.add(domain)
+                    namespaces.add(prop)
+        relationships: list[dict] = list()
+        for prop in object_props:
+            namespaces.add(prop)
+            for domain in domains.get(prop, list()):
+                for range_ in ranges.get(prop, list()):
+                    relationships.append({'SOURCE': self.get_local_part(domain), 'TARGET': self.get_local_part(range_),
+                                          'REL': self.get_local_part(prop)})
+        self._index = {'classes': [self.get_local_part(cls) for cls in classes], 'node_props': node_props,
+                       'relationships': relationships, 'namespaces': namespaces}
+        return self._index
+
     def get_nodes_and_node_props(self) -> tuple[dict, list]:
         # Get classes and their DatatypeProperties
-        nodes_with_props = dict()
-        all_nodes = list()
-        for (subj1, pred1, obj1) in self.rdf_graph.triples((None, RDF.type, OWL.Class)):
-            all_nodes.append(self.get_local_part(subj1))
-            for (subj2, pred2, obj2) in self.rdf_graph.triples((None, RDFS.domain, subj1)):
-                for (subj3, pred3, obj3) in self.rdf_graph.triples((subj2, RDF.type, OWL.DatatypeProperty)):
-                    node = self.get_local_part(subj1)
-                    if not node in nodes_with_props:
-                        nodes_with_props[node] = list()
-                    nodes_with_props[node].append(self.get_local_part(subj3))
-        nodes_without_props = [key for key in all_nodes if key not in nodes_with_props]
+        index: dict = self.get_index()
+        nodes_with_props = {node: list(props) for node, props in index['node_props'].items()}
+        nodes_without_props = [node for node in index['classes'] if node not in nodes_with_props]
         return nodes_with_props, nodes_without_props
 
     def get_relationships(self) -> list:
         # Get ObjectProperties (Relationships) for each Class:
-        relationships = list()
-        for (subj1, pred1, obj1) in self.rdf_graph.triples((None, RDF.type, OWL.ObjectProperty)):
-            for (subj2, pred2, obj2) in self.rdf_graph.triples((subj1, RDFS.domain, None)):
-                for (subj3, pred3, obj3) in self.rdf_graph.triples((subj1, RDFS.range, None)):
-                    relationships.append({'SOURCE': self.get_local_part(obj2), 'TARGET': self.get_local_part(obj3),
-                                          'REL': self.get_local_part(subj1)})
-        return relationships
+        return [dict(rel) for rel in self.get_index()['relationships']]
 
     def get_namespaces(self) -> set:
-        namespaces = set()
-        for (subj1, pred1, obj1) in self.rdf_graph.triples((None, RDF.type, OWL.Class)):
-            for (subj2, pred2, obj2) in self.rdf_graph.triples((None, RDFS.domain, subj1)):
-                for (subj3, pred3, obj3) in self.rdf_graph.triples((subj2, RDF.type, OWL.DatatypeProperty)):
-                    namespaces.add(subj1)
-                    namespaces.add(subj3)
-        for (subj11, pred11, obj11) in self.rdf_graph.triples((None, RDF.type, OWL.ObjectProperty)):
-            namespaces.add(subj11)
-        return namespaces
-
-    def create_query_templates(self, unique_node_keys: dict[str: list[str]] = None, node_value_props: dict[str:str] = None):
+        return set(self.get_index()['namespaces'])
+
+    def create_query_templates(self, unique_node_keys: dict[str: list[str]] = None, node_value_props: dict[str:str] = None,
+                               unwind_rows: bool = False):
         """ Creates four types of queries: constraint queries, nodes_and_props queries, node_relationship queries and
         namespace_queries.
+        If 'unwind_rows' is set to 'True', the nodes_and_props queries and node_relationship queries are created as
+        "UNWIND $rows AS ..."-variants that take a whole list of node_data/rel_data dictionaries of the same key per call.
         """
         if unique_node_keys is None or node_value_props is None:
             raise ValueError("Either 'unique_node_keys' or 'node_value_props' or both are not provided!")
 
+        cache_path = self.get_template_cache_path(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                                  unwind_rows=unwind_rows)
+        if cache_path is not None and cache_path.is_file():
+            with open(file=cache_path, mode="r", encoding="utf-8") as file:
+                cached: dict = json.load(file)
+            self.nodes_data_needed = cached['nodes_data_needed']
+            self.rels_data_needed = cached['rels_data_needed']
+            return (cached['constraint_queries'], cached['node_queries'], cached['relationship_queries'],
+                    cached['namespace_queries'])
+
+        index: dict = self.get_index()
+        nodes_and_nodes_props: dict[str, list] = index['node_props']
+        node_prop_sets: dict[str, set] = {node: set(props) for node, props in nodes_and_nodes_props.items()}
+        nodes_without_props: set = {node for node in index['classes'] if node not in nodes_and_nodes_props}
+        relationships: list[dict] = index['relationships']
+
         def check_if_class_keys_are_set():
-            nodes_and_nodes_props, nodes_without_props = self.get_nodes_and_node_props()
             error_messages = list()
             for node, node_props in nodes_and_nodes_props.items():
                 if node in unique_node_keys:
                     if not unique_node_keys[node]:
                         error_messages.append(f'No key property provided for Node "{node}" in unique_node_keys.')
                     for prop in unique_node_keys[node]:
-                        if prop in nodes_and_nodes_props[node]:
+                        if prop in node_prop_sets[node]:
                             pass
                         else:
                             error_messages.append(
@@ -104,8 +175,7 @@ class RDFGraph:
 
         def check_if_node_value_props_are_set():
             # Get target Nodes:
-            targets: list = [rel["TARGET"] for rel in self.get_relationships()]
-            node_and_node_props, nodes_without_props = self.get_nodes_and_node_props()
+            targets: list = list(dict.fromkeys(rel["TARGET"] for rel in relationships))
             nodes_without_props_in_targets = [item for item in targets if item in nodes_without_props]
             if nodes_without_props_in_targets:
                 raise ValueError(
@@ -117,7 +187,7 @@ class RDFGraph:
 
             node_value_props_incorrect = list()
             for node in targets:
-                node_props: list = node_and_node_props[node]
+                node_props: set = node_prop_sets[node]
                 node_prop = node_value_props[node]
                 if node_prop not in node_props:
                     node_value_props_incorrect.append(
@@ -137,21 +207,17 @@ class RDFGraph:
             return contraint_queries
 
         def create_query_template_for_classes_and_their_props() -> (list[str], set):
-            # Get nodes_and_nodes_props for each Class
-            nodes_and_nodes_props, nodes_without_props = self.get_nodes_and_node_props()
             node_queries = dict()
             for node, node_props in nodes_and_nodes_props.items():
                 key_properties: list = unique_node_keys[node]
-                if node in node_value_props:
-                    value_properties: list = node_value_props[node]
-                else:
-                    value_properties: list = list()
+                key_property_set: set = set(key_properties)
+                value_properties: set = {node_value_props[node]} if node in node_value_props else set()
                 props_queries = list()
                 nodes_datapoint_needed = dict()
                 for prop in node_props:
                     if prop not in value_properties:
                         nodes_datapoint_needed[prop] = f"<HERE_{prop}_VALUE>"
-                        if prop not in key_properties:
+                        if prop not in key_property_set:
                             props_queries.append(f'SET n.{prop} = node_data["{node}"]["{prop}"]')
                 self.nodes_data_needed[node] = nodes_datapoint_needed
                 props_queries.append("RETURN count(*) as total")
@@ -160,15 +226,13 @@ class RDFGraph:
                     [f"{key_prop}: node_data['{node}']['{key_prop}']" for key_prop in
                      key_properties]) + ' } ' if key_properties else ''
                 query_part_1 = f"""
-                WITH $node_data AS node_data 
+                {'UNWIND $rows AS node_data' if unwind_rows else 'WITH $node_data AS node_data'} 
                 MERGE (n:{node}{additional_query_part_1})
                 """
                 node_queries[node] = str(query_part_1 + query_part_2)
             return node_queries
 
         def create_query_template_for_class_relationships() -> dict[str:str]:
-            # Get ObjectProperties (Relationships) for each Class:
-            relationships = self.get_relationships()
             # Build the queries:
             relationship_queries = dict()
             for rel in relationships:
@@ -215,7 +279,7 @@ class RDFGraph:
                     rels_datapoint_needed["target"][target][value_prop] = f"<HERE_{value_prop}_VALUE>"
                 self.rels_data_needed[relation] = rels_datapoint_needed
                 query = f"""
-                WITH $rel_data AS rel_data
+                {'UNWIND $rows AS rel_data' if unwind_rows else 'WITH $rel_data AS rel_data'}
                 MATCH (source:{source}{source_properties})
                 MATCH (target:{target}{target_properties})
                 MERGE (source)-[r:{relation_only}{relation_property}]->(target)
@@ -242,9 +306,19 @@ class RDFGraph:
         constraint_queries: list = create_node_property_constraint_queries()
         node_queries: dict[str:str] = create_query_template_for_classes_and_their_props()
         relationship_queries: dict[str:str] = create_query_template_for_class_relationships()
-        namespaces: set = self.get_namespaces()
+        namespaces: set = index['namespaces']
         namespace_queries: list = create_namespace_queries(namespaces=namespaces)
 
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            path_tmp: str = cache_path.as_posix() + '.tmp'
+            with open(file=path_tmp, mode="w", encoding="utf-8") as file:
+                json.dump({'constraint_queries': constraint_queries, 'node_queries': node_queries,
+                           'relationship_queries': relationship_queries, 'namespace_queries': namespace_queries,
+                           'nodes_data_needed': self.nodes_data_needed, 'rels_data_needed': self.rels_data_needed},
+                          file)
+            os.replace(path_tmp, cache_path)
+
         return constraint_queries, node_queries, relationship_queries, namespace_queries
 
     def create_json_files_for_data_needed(self):
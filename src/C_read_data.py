@@ -1,12 +1,37 @@
+import glob
 import json
 import pathlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterator
 
+import numpy as np
 
-def get_data_dicts(all_json_paths: list[str]) -> tuple[list, list]:
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from settings import path_ontos
+from src.models.Ontologies.onto4 import params as onto4_params
+
+
+def has_value(rel_data: dict, node_value_props: dict[str:str]) -> bool:
+    """ Returns False if the value of a relationship (the value property of its target in "node_value_props", e.g.
+    "MWh") is null. """
+    target, target_props = list(list(rel_data.values())[0]['target'].items())[0]
+    return target_props[node_value_props[target]] is not None
+
+
+def get_data_dicts(all_json_paths: list[str], node_value_props: dict[str:str] = None) -> tuple[list, list]:
     """ This method deserializes JSON-files and reads the data into a Python dictionary named "company".
     The "company" dictionary is then read into the "node_template"-list and "relationship_template"-list.
     These lists are later used by the module "D_graph_construction" to read this data into the NEO4J Knowledge-Graph.
+    Data points that are null in a JSON-file (i.e. not reported) get no relationship. Data points that are missing in a
+    JSON-file get no relationship either, but are reported. "node_value_props" defaults to the one of "Ontology4.ttl".
     """
+    node_value_props = onto4_params.node_value_props if node_value_props is None else node_value_props
     
     node_data: list = list()
     relationship_data: list = list()
@@ -57,33 +82,288 @@ def get_data_dicts(all_json_paths: list[str]) -> tuple[list, list]:
             periods_processed.append(company['period'])
 
         relationship_template = [
-            {"Company_consumes_EnergyFromFossilSources": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"EnergyFromFossilSources": {"period": company['period'], "label": "TotalEnergyConsumptionFromFossilSources", "MWh": company["TotalEnergyConsumptionFromFossilSources"]}}}},
-            {"Company_consumes_EnergyFromNuclearSources": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"EnergyFromNuclearSources": {"period": company['period'], "label": "TotalEnergyConsumptionFromNuclearSources", "MWh": company["TotalEnergyConsumptionFromNuclearSources"]}}}},
-            {"Company_consumes_EnergyFromRenewableSources": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"EnergyFromRenewableSources": {"period": company['period'], "label": "TotalEnergyConsumptionFromRenewableSources", "MWh": company["TotalEnergyConsumptionFromRenewableSources"]}}}},
-            {"Company_owns_Asset": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Asset": {"period": company['period'], "label": "AssetsAtMaterialPhysicalRiskBeforeClimateChangeAdaptationActions", "EUR": company["AssetsAtMaterialPhysicalRiskBeforeClimateChangeAdaptationActions"]}}}},
-            {"Company_owns_Asset": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Asset": {"period": company['period'], "label": "AssetsAtMaterialTransitionRiskBeforeClimateMitigationActions", "EUR": company["AssetsAtMaterialTransitionRiskBeforeClimateMitigationActions"]}}}},
-            {"Company_spends_Expenditure": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Expenditure": {"period": company['period'], "label": "FinancialResourcesAllocatedToActionPlanOpEx", "EUR": company["FinancialResourcesAllocatedToActionPlanOpEx"]}}}},
-            {"Company_spends_Expenditure": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Expenditure": {"period": company['period'], "label": "FinancialResourcesAllocatedToActionPlanCapEx", "EUR": company["FinancialResourcesAllocatedToActionPlanCapEx"]}}}},
-            {"Company_receives_Revenue": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Revenue": {"period": company['period'], "label": "NetRevenueUsedToCalculateGHGIntensity", "EUR": company["NetRevenueUsedToCalculateGHGIntensity"]}}}},
-            {"Company_receives_Revenue": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Revenue": {"period": company['period'], "label": "NetRevenue", "EUR": company["NetRevenue"]}}}},
-            {"Company_emits_GHGEmission": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"GHGEmission": {"period": company['period'], "label": "TotalGHGEmissions", "tonsCO2Eq": company["TotalGHGEmissions"]}}}},
-            {"Company_contributesTo_GHGReduction": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"GHGReduction": {"period": company['period'], "label": "AbsoluteValueOfTotalGHGEmissionsReduction", "tonsCO2Eq": company["AbsoluteValueOfTotalGHGEmissionsReduction"]}}}},
-            {"Company_emits_Scope1": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Scope1": {"period": company['period'], "label": "GrossScope1GHGEmissions", "tonsCO2Eq": company["GrossScope1GHGEmissions"]}}}},
-            {"Company_indirectlyEmits_Scope2": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Scope2": {"period": company['period'], "label": "GrossLocationBasedScope2GHGEmissions", "tonsCO2Eq": company["GrossLocationBasedScope2GHGEmissions"]}}}},
-            {"Company_indirectlyEmits_Scope2": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Scope2": {"period": company['period'], "label": "GrossMarketBasedScope2GHGEmissions", "tonsCO2Eq": company["GrossMarketBasedScope2GHGEmissions"]}}}},
-            {"Company_indirectlyEmits_Scope3": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Scope3": {"period": company['period'], "label": "GrossScope3GHGEmissions", "tonsCO2Eq": company["GrossScope3GHGEmissions"]}}}},
-            {"Company_exhausts_Land": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Land": {"period": company['period'], "label": "TotalUseOfLandArea", "hectares": company["TotalUseOfLandArea"]}}}},
-            {"Company_exhausts_Water": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Water": {"period": company['period'], "label": "TotalWaterConsumption", "cubicmetres": company["TotalWaterConsumption"]}}}},
-            {"Company_disposes_Substance": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Substance": {"period": company['period'], "label": "TotalAmountOfSubstancesOfConcernGenerated", "tons": company["TotalAmountOfSubstancesOfConcernGenerated"]}}}},
-            {"Company_disposes_Waste": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Waste": {"period": company['period'], "label": "EmissionsToAirByPollutant", "tons": company["EmissionsToAirByPollutant"]}}}},
-            {"Company_disposes_Waste": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Waste": {"period": company['period'], "label": "EmissionsToSoilByPollutant", "tons": company["EmissionsToSoilByPollutant"]}}}},
-            {"Company_disposes_Waste": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Waste": {"period": company['period'], "label": "EmissionsToWaterByPollutant", "tons": company["EmissionsToWaterByPollutant"]}}}}
+            {"Company_consumes_EnergyFromFossilSources": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"EnergyFromFossilSources": {"period": company['period'], "label": "TotalEnergyConsumptionFromFossilSources", "MWh": company.get("TotalEnergyConsumptionFromFossilSources")}}}},
+            {"Company_consumes_EnergyFromNuclearSources": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"EnergyFromNuclearSources": {"period": company['period'], "label": "TotalEnergyConsumptionFromNuclearSources", "MWh": company.get("TotalEnergyConsumptionFromNuclearSources")}}}},
+            {"Company_consumes_EnergyFromRenewableSources": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"EnergyFromRenewableSources": {"period": company['period'], "label": "TotalEnergyConsumptionFromRenewableSources", "MWh": company.get("TotalEnergyConsumptionFromRenewableSources")}}}},
+            {"Company_owns_Asset": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Asset": {"period": company['period'], "label": "AssetsAtMaterialPhysicalRiskBeforeClimateChangeAdaptationActions", "EUR": company.get("AssetsAtMaterialPhysicalRiskBeforeClimateChangeAdaptationActions")}}}},
+            {"Company_owns_Asset": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Asset": {"period": company['period'], "label": "AssetsAtMaterialTransitionRiskBeforeClimateMitigationActions", "EUR": company.get("AssetsAtMaterialTransitionRiskBeforeClimateMitigationActions")}}}},
+            {"Company_spends_Expenditure": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Expenditure": {"period": company['period'], "label": "FinancialResourcesAllocatedToActionPlanOpEx", "EUR": company.get("FinancialResourcesAllocatedToActionPlanOpEx")}}}},
+            {"Company_spends_Expenditure": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Expenditure": {"period": company['period'], "label": "FinancialResourcesAllocatedToActionPlanCapEx", "EUR": company.get("FinancialResourcesAllocatedToActionPlanCapEx")}}}},
+            {"Company_receives_Revenue": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Revenue": {"period": company['period'], "label": "NetRevenueUsedToCalculateGHGIntensity", "EUR": company.get("NetRevenueUsedToCalculateGHGIntensity")}}}},
+            {"Company_receives_Revenue": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Revenue": {"period": company['period'], "label": "NetRevenue", "EUR": company.get("NetRevenue")}}}},
+            {"Company_emits_GHGEmission": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"GHGEmission": {"period": company['period'], "label": "TotalGHGEmissions", "tonsCO2Eq": company.get("TotalGHGEmissions")}}}},
+            {"Company_contributesTo_GHGReduction": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"GHGReduction": {"period": company['period'], "label": "AbsoluteValueOfTotalGHGEmissionsReduction", "tonsCO2Eq": company.get("AbsoluteValueOfTotalGHGEmissionsReduction")}}}},
+            {"Company_emits_Scope1": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Scope1": {"period": company['period'], "label": "GrossScope1GHGEmissions", "tonsCO2Eq": company.get("GrossScope1GHGEmissions")}}}},
+            {"Company_indirectlyEmits_Scope2": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Scope2": {"period": company['period'], "label": "GrossLocationBasedScope2GHGEmissions", "tonsCO2Eq": company.get("GrossLocationBasedScope2GHGEmissions")}}}},
+            {"Company_indirectlyEmits_Scope2": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Scope2": {"period": company['period'], "label": "GrossMarketBasedScope2GHGEmissions", "tonsCO2Eq": company.get("GrossMarketBasedScope2GHGEmissions")}}}},
+            {"Company_indirectlyEmits_Scope3": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Scope3": {"period": company['period'], "label": "GrossScope3GHGEmissions", "tonsCO2Eq": company.get("GrossScope3GHGEmissions")}}}},
+            {"Company_exhausts_Land": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Land": {"period": company['period'], "label": "TotalUseOfLandArea", "hectares": company.get("TotalUseOfLandArea")}}}},
+            {"Company_exhausts_Water": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Water": {"period": company['period'], "label": "TotalWaterConsumption", "cubicmetres": company.get("TotalWaterConsumption")}}}},
+            {"Company_disposes_Substance": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Substance": {"period": company['period'], "label": "TotalAmountOfSubstancesOfConcernGenerated", "tons": company.get("TotalAmountOfSubstancesOfConcernGenerated")}}}},
+            {"Company_disposes_Waste": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Waste": {"period": company['period'], "label": "EmissionsToAirByPollutant", "tons": company.get("EmissionsToAirByPollutant")}}}},
+            {"Company_disposes_Waste": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Waste": {"period": company['period'], "label": "EmissionsToSoilByPollutant", "tons": company.get("EmissionsToSoilByPollutant")}}}},
+            {"Company_disposes_Waste": {"source": {"Company": {"LEI": company['LEI']}}, "target": {"Waste": {"period": company['period'], "label": "EmissionsToWaterByPollutant", "tons": company.get("EmissionsToWaterByPollutant")}}}}
         ]
-        relationship_data += relationship_template
+        missing_labels: list = [list(list(rel_data.values())[0]['target'].values())[0]['label']
+                                for rel_data in relationship_template]
+        missing_labels = [label for label in missing_labels if label not in company]
+        if missing_labels:
+            print(f'INFO: JSON-file "{json_path}" has no data points {missing_labels}, they are not loaded.')
+        relationship_data += [rel_data for rel_data in relationship_template
+                              if has_value(rel_data=rel_data, node_value_props=node_value_props)]
 
     return node_data, relationship_data
 
 
+def load_data_points(path_to_data_points: str = None) -> dict[str, dict]:
+    """ Reads the data points of an ontology, i.e. the mapping of each data point label in the JSON-files (such as
+    "GrossScope1GHGEmissions") to its Node ("node"), the relationship from the Company ("relationship") and the value
+    property ("unit"). For "Ontology4.ttl", these are in "/src/models/Ontologies/onto4/data_points.json", for generated
+    ontologies, the file is written by "OntologyGenerator" (see: "J_ontology_generation.py"). """
+    path_to_data_points = pathlib.Path(path_ontos, 'onto4/data_points.json') if path_to_data_points is None \
+        else pathlib.Path(path_to_data_points)
+    if not path_to_data_points.is_file():
+        raise ValueError(f"Path to data points '{path_to_data_points}' does not exist!")
+    with open(file=path_to_data_points, mode="r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def get_relation(data_point: dict) -> str:
+    """ Returns the relationship key (see: "create_query_templates()" in "B_rdf_graph.py") of a data point. """
+    return f"Company_{data_point['relationship']}_{data_point['node']}"
+
+
+def create_rel_row(data_point: dict, lei: str, period: str, value: float) -> dict:
+    """ Returns the rel_data dictionary of one fact in the format of "get_data_dicts()". """
+    return {get_relation(data_point=data_point): {
+        "source": {"Company": {"LEI": lei}},
+        "target": {data_point['node']: {"period": period, "label": data_point['label'], data_point['unit']: value}}}}
+
+
+def read_json_file(json_path: str) -> dict:
+    """ Deserializes one JSON-file, with the faster "orjson"-package if it is installed. """
+    if not pathlib.Path(json_path).is_file():
+        raise ValueError(f"Path to json '{json_path}' does not exist!")
+    if orjson is not None:
+        return orjson.loads(pathlib.Path(json_path).read_bytes())
+    with open(file=json_path, mode="r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def validate_company(company: dict, json_path: str):
+    """ Checks that a deserialized JSON-file has the keys "LEI", "label" and "period" and only numeric (or null)
+    data point values (see: "/src/data/JSONs/templates/template.json"). """
+    error_messages = [f'Key "{key}" is missing.' for key in ["LEI", "label", "period"] if key not in company]
+    error_messages += [f'Value of "{key}" is not numeric: "{value}"' for key, value in company.items()
+                       if key not in ["LEI", "label", "period"] and value is not None
+                       and (isinstance(value, bool) or not isinstance(value, (int, float)))]
+    if error_messages:
+        raise ValueError(f"JSON-file '{json_path}' is not valid: {error_messages}")
+
+
+def read_json_chunk(json_paths: list[str], metrics: set[str] = None) -> list[dict]:
+    """ Reads and validates a chunk of JSON-files (executed in a worker process by "read_json_files_parallel()").
+    If "metrics" is set, only these data points (and "LEI", "label", "period") are returned to keep the results that
+    are sent back to the main process small. """
+    companies: list[dict] = list()
+    for json_path in json_paths:
+        company: dict = read_json_file(json_path=json_path)
+        validate_company(company=company, json_path=json_path)
+        if metrics is not None:
+            company = {key: value for key, value in company.items()
+                       if key in metrics or key in ("LEI", "label", "period")}
+        companies.append(company)
+    return companies
+
+
+def read_json_files_parallel(all_json_paths: list[str], metrics: set[str] = None, max_workers: int = None,
+                             chunk_size: int = 64) -> list[dict]:
+    """ Reads and validates the JSON-files in chunks of "chunk_size" files in a pool of "max_workers" processes
+    (default: number of CPUs). The deserialized files are returned in the order of "all_json_paths", i.e. the result
+    is the same as when reading the files one by one. """
+    chunks: list[list[str]] = [all_json_paths[i:i + chunk_size] for i in range(0, len(all_json_paths), chunk_size)]
+    companies: list[dict] = list()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for chunk_companies in executor.map(read_json_chunk, chunks, repeat(metrics)):
+            companies += chunk_companies
+    return companies
+
+
+class ColumnarData:
+    """ Compact, columnar alternative to "get_data_dicts()". Instead of one nested dictionary per fact, every fact
+    (company, period, data point, value) is stored as one row of four arrays: company index, period index, metric
+    index and float64 value. Companies, periods and metrics (data point labels) are stored only once. The structure of
+    the Nodes and relationships is derived from the data points of the ontology (see: "load_data_points()"), not from
+    hard-coded templates. Duplicate facts (same company, period and metric) are skipped via a hash-set, the first fact
+    wins. "iter_batches()" creates the node_data/rel_data dictionaries only batch by batch while loading. """
+
+    def __init__(self, data_points: dict[str, dict] = None):
+        self.data_points: dict[str, dict] = load_data_points() if data_points is None else data_points
+        self.metrics: list[str] = list(self.data_points)
+        self.metric_index: dict[str, int] = {metric: index for index, metric in enumerate(self.metrics)}
+        self.companies: list[tuple[str, str]] = list()
+        self.company_index: dict[str, int] = dict()
+        self.periods: list[str] = list()
+        self.period_index: dict[str, int] = dict()
+        self._company_idx = array('q')
+        self._period_idx = array('q')
+        self._metric_idx = array('q')
+        self._values = array('d')
+        self._facts: set[tuple[int, int, int]] = set()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add_company_period(self, company: dict) -> int:
+        """ Adds the facts of one deserialized JSON-file (one company and period) and returns the number of facts
+        added. Keys that are not data points (such as "LEI", "label" and "period") and missing values are skipped. """
+        lei: str = company['LEI']
+        if lei not in self.company_index:
+            self.company_index[lei] = len(self.companies)
+            self.companies.append((lei, company['label']))
+        period: str = company['period']
+        if period not in self.period_index:
+            self.period_index[period] = len(self.periods)
+            self.periods.append(period)
+        company_idx, period_idx = self.company_index[lei], self.period_index[period]
+        number_before: int = len(self._values)
+        for metric, value in company.items():
+            metric_idx: int = self.metric_index.get(metric, -1)
+            if metric_idx < 0 or value is None or (company_idx, period_idx, metric_idx) in self._facts:
+                continue
+            self._facts.add((company_idx, period_idx, metric_idx))
+            self._company_idx.append(company_idx)
+            self._period_idx.append(period_idx)
+            self._metric_idx.append(metric_idx)
+            self._values.append(float(value))
+        return len(self._values) - number_before
+
+    def read_json_files(self, all_json_paths: list[str], parallel: bool = False, max_workers: int = None,
+                        chunk_size: int = 64):
+        """ Reads and validates the JSON-files. If "parallel" is set, the files are read by a pool of processes (see:
+        "read_json_files_parallel()"). The facts are added in the order of "all_json_paths" in both cases, so that the
+        result (including which duplicate fact is kept) does not depend on the number of processes. """
+        if parallel:
+            companies: list[dict] = read_json_files_parallel(all_json_paths=all_json_paths, metrics=set(self.metrics),
+                                                             max_workers=max_workers, chunk_size=chunk_size)
+            for company in companies:
+                self.add_company_period(company=company)
+            return
+        for json_path in all_json_paths:
+            company: dict = read_json_file(json_path=json_path)
+            validate_company(company=company, json_path=json_path)
+            self.add_company_period(company=company)
+
+    def get_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ Returns the company index, period index, metric index and value arrays (without copying). """
+        return (np.frombuffer(self._company_idx, dtype=np.int64), np.frombuffer(self._period_idx, dtype=np.int64),
+                np.frombuffer(self._metric_idx, dtype=np.int64), np.frombuffer(self._values, dtype=np.float64))
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[tuple[str, list[dict]]]:
+        """ Yields (key, rows)-batches of at most "batch_size" node_data/rel_data dictionaries in the format of
+        "get_data_dicts()": first the Company Nodes, then the data point Nodes (one per period and data point that
+        has facts), grouped by Node label, and finally the relationships, grouped by relationship. The rows can be
+        loaded with the "UNWIND $rows"-query templates (see: "load_batches()" in "D_graph_construction.py"). """
+        if batch_size < 1:
+            raise ValueError(f'"batch_size" must be a positive integer but is: "{batch_size}"')
+        company_idx, period_idx, metric_idx, values = self.get_arrays()
+
+        # Company Nodes:
+        for start in range(0, len(self.companies), batch_size):
+            yield "Company", [{"Company": {"LEI": lei, "label": label}}
+                              for lei, label in self.companies[start:start + batch_size]]
+
+        # Data point Nodes (one per period and metric), grouped by Node label:
+        node_of_metric: np.ndarray = np.array([self.data_points[metric]['node'] for metric in self.metrics] or [''])
+        pairs: np.ndarray = np.unique(period_idx * len(self.metrics) + metric_idx)
+        pair_periods, pair_metrics = pairs // max(len(self.metrics), 1), pairs % max(len(self.metrics), 1)
+        for node in dict.fromkeys(node_of_metric[pair_metrics]):
+            selected: np.ndarray = np.flatnonzero(node_of_metric[pair_metrics] == node)
+            for start in range(0, len(selected), batch_size):
+                yield node, [{node: {"label": self.metrics[pair_metrics[i]], "period": self.periods[pair_periods[i]]}}
+                             for i in selected[start:start + batch_size]]
+
+        # Relationships, grouped by relationship (stable, i.e. in the order of the facts):
+        relation_ids: dict[str, int] = dict()
+        for index in range(len(self.metrics)):
+            relation_ids.setdefault(get_relation(data_point=self.data_points[self.metrics[index]]), len(relation_ids))
+        relations: list[str] = list(relation_ids)
+        relation_of_metric: np.ndarray = np.array([relation_ids[get_relation(data_point=self.data_points[metric])]
+                                                   for metric in self.metrics] or [0])
+        fact_relations: np.ndarray = relation_of_metric[metric_idx]
+        order: np.ndarray = np.argsort(fact_relations, kind='stable')
+        boundaries: np.ndarray = np.flatnonzero(np.diff(fact_relations[order])) + 1
+        for group in np.split(order, boundaries) if len(order) else []:
+            relation: str = relations[fact_relations[group[0]]]
+            for start in range(0, len(group), batch_size):
+                yield relation, [create_rel_row(data_point=self.data_points[self.metrics[metric_idx[i]]],
+                                                lei=self.companies[company_idx[i]][0],
+                                                period=self.periods[period_idx[i]], value=float(values[i]))
+                                 for i in group[start:start + batch_size]]
+
+
+def iter_json_paths(json_paths: str or list[str]) -> Iterator[str]:
+    """ Yields the paths of the JSON-files: "json_paths" is either a list of paths, a directory (all "*.json" files in
+    it) or a glob pattern such as "./data/JSONs/*_2023.json". The files of a directory or glob pattern are yielded in
+    sorted order, so that the load order does not depend on the file system. """
+    if isinstance(json_paths, (list, tuple)):
+        yield from json_paths
+    elif pathlib.Path(json_paths).is_dir():
+        yield from sorted(path.as_posix() for path in pathlib.Path(json_paths).glob('*.json'))
+    else:
+        yield from sorted(glob.glob(json_paths))
+
+
+def iter_data_dicts(json_paths: str or list[str], batch_size: int = 1000,
+                    data_points: dict[str, dict] = None) -> Iterator[tuple[str, list[dict]]]:
+    """ Streaming variant of "get_data_dicts()": Reads the JSON-files one by one (see: "iter_json_paths()") and yields
+    (key, rows)-batches of at most "batch_size" node_data/rel_data dictionaries as soon as a batch is full, which can
+    be loaded directly with "load_batches()" of the module "D_graph_construction.py". The Nodes, relationships and
+    value properties are derived from the data points of the ontology (see: "load_data_points()"). Every Company Node
+    and every shared data point Node (one per period and data point) is yielded exactly once. Node batches are always
+    yielded before the relationship batches that refer to them. Memory is bounded by one open batch per key instead
+    of growing with the number of JSON-files. """
+    if batch_size < 1:
+        raise ValueError(f'"batch_size" must be a positive integer but is: "{batch_size}"')
+    data_points = load_data_points() if data_points is None else data_points
+    companies_processed: set[str] = set()
+    nodes_processed: set[tuple[str, str]] = set()
+    node_batches: dict[str, list[dict]] = dict()
+    rel_batches: dict[str, list[dict]] = dict()
+
+    def flush_nodes() -> Iterator[tuple[str, list[dict]]]:
+        for node_key in list(node_batches):
+            yield node_key, node_batches.pop(node_key)
+
+    for json_path in iter_json_paths(json_paths=json_paths):
+        with open(file=json_path, mode="r", encoding="utf-8") as file:
+            company: dict = json.load(file)
+        lei, period = company['LEI'], company['period']
+        if lei not in companies_processed:
+            companies_processed.add(lei)
+            node_batches.setdefault("Company", list()).append({"Company": {"LEI": lei, "label": company['label']}})
+        for metric, value in company.items():
+            data_point: dict = data_points.get(metric)
+            if data_point is None or value is None:
+                continue
+            node: str = data_point['node']
+            if (period, metric) not in nodes_processed:
+                nodes_processed.add((period, metric))
+                node_batches.setdefault(node, list()).append({node: {"label": data_point['label'], "period": period}})
+            relation: str = get_relation(data_point=data_point)
+            rel_batches.setdefault(relation, list()).append(
+                create_rel_row(data_point=data_point, lei=lei, period=period, value=float(value)))
+            if len(rel_batches[relation]) >= batch_size:
+                yield from flush_nodes()
+                yield relation, rel_batches.pop(relation)
+        for node_key in [key for key, rows in node_batches.items() if len(rows) >= batch_size]:
+            yield node_key, node_batches.pop(node_key)
+
+    yield from flush_nodes()
+    for relation in list(rel_batches):
+        yield relation, rel_batches.pop(relation)
+
+
 if __name__ == '__main__':
     from pprint import pprint
     # Check how the "node_template"-list and "relationship_template"-list look like:
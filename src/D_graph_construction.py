@@ -1,12 +1,129 @@
+import asyncio
+import hashlib
+import json
 import os
 import pathlib
-from dotenv import load_dotenv
+from typing import Iterable
 
-from neo4j import GraphDatabase, Record
+from neo4j import Record
 
-from settings import path_base, path_ontos
+from settings import path_ontos
 from src.B_rdf_graph import RDFGraph
-from src.E_embeddings import Embedder
+from src.neo4j_connection import Neo4jConnection
+
+
+def group_data_by_key(data: list[dict]) -> dict[str, list[dict]]:
+    """ Groups the node_data/rel_data dictionaries created by "get_data_dicts()" of the module "C_read_data.py" by
+    their (only) key, i.e. the Node label such as "Scope1" or the relationship such as "Company_emits_Scope1". The
+    order of the dictionaries within each group is preserved. """
+    grouped_data: dict[str, list[dict]] = dict()
+    for item in data:
+        key = list(item.keys())[0]
+        if key not in grouped_data:
+            grouped_data[key] = list()
+        grouped_data[key].append(item)
+    return grouped_data
+
+
+def chunk_rows(rows: list, batch_size: int) -> list[list]:
+    """ Splits "rows" into consecutive chunks of at most "batch_size" items. """
+    if batch_size < 1:
+        raise ValueError(f'"batch_size" must be a positive integer but is: "{batch_size}"')
+    return [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+
+def create_batches(nodes_data: list[dict], rels_data: list[dict], node_queries: dict[str:str],
+                   rel_queries: dict[str:str], batch_size: int) -> list[tuple[str, str, list[dict]]]:
+    """ Returns the ordered list of (key, "UNWIND $rows"-query, rows)-batches for the node_data/rel_data
+    dictionaries. Nodes come first as the relationship queries MATCH on existing Nodes. """
+    batches: list[tuple[str, str, list[dict]]] = list()
+    for data, queries in [(nodes_data, node_queries), (rels_data, rel_queries)]:
+        for key, rows in group_data_by_key(data=data).items():
+            for batch in chunk_rows(rows=rows, batch_size=batch_size):
+                batches.append((key, queries[key], batch))
+    return batches
+
+
+def hash_input_files(all_json_paths: list[str], batch_size: int) -> str:
+    """ Returns a sha256-hash of the content of the (sorted) input files and the batch size. The hash identifies the
+    sequence of batches created by "create_batches()" and is stored in the checkpoint-file. """
+    sha = hashlib.sha256(f'batch_size={batch_size}'.encode('utf-8'))
+    for json_path in sorted(all_json_paths):
+        sha.update(pathlib.Path(json_path).name.encode('utf-8'))
+        sha.update(pathlib.Path(json_path).read_bytes())
+    return sha.hexdigest()
+
+
+def read_checkpoint(path_to_checkpoint: str, input_hash: str) -> int:
+    """ Returns the index of the last committed batch stored in the checkpoint-file or -1 if there is no
+    checkpoint-file or if the checkpoint-file belongs to other input files. """
+    if not pathlib.Path(path_to_checkpoint).is_file():
+        return -1
+    with open(file=path_to_checkpoint, mode="r", encoding="utf-8") as file:
+        checkpoint: dict = json.load(file)
+    if checkpoint.get('input_hash') != input_hash:
+        return -1
+    return checkpoint['last_committed_batch']
+
+
+def write_checkpoint(path_to_checkpoint: str, input_hash: str, last_committed_batch: int):
+    """ Writes the checkpoint-file atomically, so that a crash never leaves a half written checkpoint behind. """
+    path_tmp: str = path_to_checkpoint + '.tmp'
+    with open(file=path_tmp, mode="w", encoding="utf-8") as file:
+        json.dump({'input_hash': input_hash, 'last_committed_batch': last_committed_batch}, file)
+    os.replace(path_tmp, path_to_checkpoint)
+
+
+def split_relation(relation: str, rel_data: dict) -> tuple[str, str, str]:
+    """ Splits a relation key such as "Company_emits_Scope1" (built as f"{source}_{rel}_{target}" in the module
+    "B_rdf_graph.py") into (source, rel, target) with the help of the source and target Node labels in "rel_data". """
+    source: str = list(rel_data['source'].keys())[0]
+    target: str = list(rel_data['target'].keys())[0]
+    return source, relation[len(source) + 1:len(relation) - len(target) - 1], target
+
+
+def diff_relationships(rels_data: list[dict], existing_rels: list[dict], unique_node_keys: dict[str: list[str]],
+                       node_value_props: dict[str:str],
+                       delete_missing: bool = True) -> tuple[list[dict], list[dict], list[dict]]:
+    """ Compares the rel_data dictionaries created by "get_data_dicts()" of the module "C_read_data.py" with the
+    relationships already stored in the KG ("existing_rels", rows with the keys "relation", "source", "target" and
+    "value") and returns three lists:
+        - inserts:  rel_data dictionaries of relationships that are not yet in the KG
+        - updates:  rows of relationships whose value has changed
+        - deletes:  rows of relationships in the KG that are no longer in "rels_data"
+    Relationships are identified by (relation, key properties of the source, key properties of the target).
+    If "delete_missing" is not set, only relationships of the (source, period)-pairs in "rels_data" are deleted, e.g.
+    a data point that was removed from (or became null in) a changed JSON-file, but not the relationships of other
+    companies or periods. """
+
+    def get_keys(node: str, node_props: dict) -> tuple:
+        return tuple(node_props.get(key) for key in unique_node_keys.get(node, []))
+
+    existing: dict[tuple, dict] = dict()
+    for row in existing_rels:
+        source, rel, target = row['relation'].split('|')
+        existing[(row['relation'], get_keys(source, row['source']), get_keys(target, row['target']))] = row
+
+    inserts, updates, keys_needed, scopes = list(), list(), set(), set()
+    for rel_data in rels_data:
+        relation, rel_props = list(rel_data.items())[0]
+        source, rel, target = split_relation(relation=relation, rel_data=rel_props)
+        source_props: dict = rel_props['source'][source]
+        target_props: dict = rel_props['target'][target]
+        key = (f'{source}|{rel}|{target}', get_keys(source, source_props), get_keys(target, target_props))
+        keys_needed.add(key)
+        scopes.add((source, get_keys(source, source_props), target_props.get('period')))
+        if key not in existing:
+            inserts.append(rel_data)
+        elif target in node_value_props and existing[key]['value'] != target_props[node_value_props[target]]:
+            updates.append({**existing[key], 'value': target_props[node_value_props[target]]})
+    deletes: list[dict] = list()
+    for key, row in existing.items():
+        source: str = row['relation'].split('|')[0]
+        if key not in keys_needed and \
+                (delete_missing or (source, key[1], row['target'].get('period')) in scopes):
+            deletes.append(row)
+    return inserts, updates, deletes
 
 
 class GraphConstruction:
@@ -14,21 +131,35 @@ class GraphConstruction:
     README-data.md), with external data from wikidata/dbpedia and with text embeddings of a Node's text property. The
     methods thereby use parameterized cypher queries. """
 
-    def __init__(self, path_to_onto: str, neo4j_db_name: str = 'neo4j'):
-        path_to_secrets: pathlib.Path = pathlib.Path(path_base, 'secrets.env')
-        try:
-            load_dotenv(dotenv_path=path_to_secrets)  # Load secrets/env variables
-        except:
-            print('secrets could not be loaded!')
-        uri = "neo4j://localhost:7687"
+    def __init__(self, path_to_onto: str, neo4j_db_name: str = 'neo4j', use_template_cache: bool = True):
         self.neo4j_db_name: str = neo4j_db_name
-        auth = (os.getenv('NEO4J_USER'), os.getenv('NEO4J_PW'))
-        self.driver = GraphDatabase.driver(uri, auth=auth)
+        self.driver = Neo4jConnection.get_driver(neo4j_db_name=neo4j_db_name)
         if not pathlib.Path(path_to_onto).is_file():
             raise ValueError(f"Provided path to Ontology '{path_to_onto}' does not exist!")
         self.path_to_onto: str = path_to_onto
+        # Query templates are cached next to the ontology file (see: "RDFGraph" in "B_rdf_graph.py"):
+        self.template_cache_dir: str or None = pathlib.Path(
+            pathlib.Path(path_to_onto).parent, 'template_cache').as_posix() if use_template_cache else None
+        self.rdf_graph: RDFGraph = RDFGraph(path_to_onto=path_to_onto, cache_dir=self.template_cache_dir)
+        self.query_templates: dict[str, tuple] = dict()
         self.label_wikidata_id = "wikidataID"
 
+    def get_query_templates(self, unique_node_keys: dict[str: list[str]], node_value_props: dict[str:str],
+                            unwind_rows: bool) -> tuple[list, dict, dict, list]:
+        """ Returns the query templates of "create_query_templates()" (see: "B_rdf_graph.py"). They are created (or
+        read from the template cache) only once per GraphConstruction, so that the steps in "main.py" that share one
+        GraphConstruction neither parse the ontology nor read the template cache again. """
+        key: str = json.dumps([unique_node_keys, node_value_props, unwind_rows], sort_keys=True)
+        if key not in self.query_templates:
+            self.query_templates[key] = self.rdf_graph.create_query_templates(
+                unique_node_keys=unique_node_keys, node_value_props=node_value_props, unwind_rows=unwind_rows)
+        return self.query_templates[key]
+
+    def bump_generation(self) -> int:
+        """ Increases the generation of the KG after its data was changed, so that cached query results of
+        GraphQueries are not used anymore (see: "bump_graph_generation()" in "neo4j_connection.py"). """
+        return Neo4jConnection.bump_graph_generation(neo4j_db_name=self.neo4j_db_name)
+
     def init_graph(self, handle_vocab_uris: str = "MAP", handle_mult_vals: str = "ARRAY",
                    multi_val_prop_list: list = None, handle_rdf_types: str = "LABELS",
                    keep_lang_tag: bool = False, keep_cust_dtypes: bool = False, apply_neo4j_naming: bool = False):
@@ -56,12 +187,52 @@ class GraphConstruction:
         query_drop_constr = f"""DROP CONSTRAINT n10s_unique_uri IF EXISTS"""
         self.driver.execute_query(query_=query_delete, database_=self.neo4j_db_name)
         self.driver.execute_query(query_=query_drop_constr, database_=self.neo4j_db_name)
-        constraints: list[Record] = self.driver.execute_query("SHOW CONSTRAINT", database_=self.neo4j_db_name).records
-        for constraint in constraints:
-            self.driver.execute_query(query_="DROP CONSTRAINT " + constraint['name'], database_=self.neo4j_db_name)
-        indexes: list[Record] = self.driver.execute_query("SHOW INDEXES", database_=self.neo4j_db_name).records
-        for index in indexes:
-            self.driver.execute_query("DROP INDEX " + index['name'], database_=self.neo4j_db_name)
+        self.drop_constraints_and_indexes()
+        self.bump_generation()
+
+    def drop_constraints_and_indexes(self):
+        """ Drops all constraints and then all remaining indexes within one session. """
+        with self.driver.session(database=self.neo4j_db_name) as session:
+            constraints: list[Record] = list(session.run("SHOW CONSTRAINTS YIELD name"))
+            for constraint in constraints:
+                session.run(f"DROP CONSTRAINT `{constraint['name']}` IF EXISTS").consume()
+            # Indexes backing a constraint are dropped with the constraint:
+            indexes: list[Record] = list(session.run("SHOW INDEXES YIELD name"))
+            for index in indexes:
+                session.run(f"DROP INDEX `{index['name']}` IF EXISTS").consume()
+
+    def delete_graph_in_chunks(self, chunk_size: int = 10000, labels: list[str] = None, periods: list[str] = None,
+                               chunks_per_round: int = 10, show_progress: bool = True):
+        """ Deletes Nodes (and their relationships) with "CALL { ... } IN TRANSACTIONS OF chunk_size ROWS", so that
+        no single transaction has to hold the whole graph. The deletion can be restricted to Nodes with one of the given
+        "labels" and/or to Nodes of the given "periods" (such as ["2023"]), e.g. to replace one reporting year. Progress is
+        printed after each round of "chunks_per_round" chunks. Constraints and indexes are only dropped if the whole graph
+        is deleted (i.e. neither "labels" nor "periods" are provided). """
+        if chunk_size < 1:
+            raise ValueError(f'"chunk_size" must be a positive integer but is: "{chunk_size}"')
+        where_clause: str = """
+            WHERE ($labels IS NULL OR any(label IN labels(n) WHERE label IN $labels))
+            AND ($periods IS NULL OR n.period IN $periods)"""
+        query_count = f"""MATCH (n){where_clause} RETURN count(n) AS total"""
+        query_delete = f"""
+            MATCH (n){where_clause}
+            WITH n LIMIT $round_size
+            CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {int(chunk_size)} ROWS"""
+        parameters: dict = {'labels': labels, 'periods': periods, 'round_size': chunk_size * chunks_per_round}
+        # "CALL { ... } IN TRANSACTIONS" can only be executed in an auto-commit transaction, i.e. with "session.run()":
+        with self.driver.session(database=self.neo4j_db_name) as session:
+            total: int = session.run(query_count, parameters=parameters).single()['total']
+            deleted: int = 0
+            while deleted < total:
+                nodes_deleted: int = session.run(query_delete, parameters=parameters).consume().counters.nodes_deleted
+                if nodes_deleted == 0:
+                    break
+                deleted += nodes_deleted
+                if show_progress:
+                    print(f'INFO: Deleted {deleted} of {total} Nodes.')
+        if labels is None and periods is None:
+            self.drop_constraints_and_indexes()
+        self.bump_generation()
 
     def load_onto_or_rdf(self, path: str, path_is_url: bool = False,
                          load_onto_only: bool = True, serialization_type: str = "Turtle"):
@@ -70,6 +241,7 @@ class GraphConstruction:
         "{serialization_type}")
         """
         self.driver.execute_query(query_=query_load, database_=self.neo4j_db_name)
+        self.bump_generation()
 
     def import_wikidata_id(self):
         query = rf"""
@@ -93,6 +265,7 @@ class GraphConstruction:
                 SET n.{self.label_wikidata_id} = new_prop_val;
                 """
         self.driver.execute_query(query_=query, database_=self.neo4j_db_name)
+        self.bump_generation()
 
     def import_data_from_wikidata(self, node_label: str, prop_name: str, prop_wiki_id: str,
                                   new_prop_name: str, new_prop_wiki_id: str,
@@ -121,6 +294,7 @@ class GraphConstruction:
         SET n.{new_prop_name} = new_prop_val;
         """
         self.driver.execute_query(query_=query, database_=self.neo4j_db_name)
+        self.bump_generation()
 
     def import_data_from_dbpedia(self, node_label: str, prop_name: str, prop_dbp_id: str,
                                  new_prop_name: str, new_prop_dbp_id: str,
@@ -149,46 +323,69 @@ class GraphConstruction:
         SET n.{new_prop_name} = new_prop_val;
         """
         self.driver.execute_query(query_=query, database_=self.neo4j_db_name)
+        self.bump_generation()
 
     def create_text_embedding(self, node_label: str, node_primary_prop_name: str, prop_to_embed: str,
                               vector_size: int = 768,
-                              similarity_method: str = "cosine"):
+                              similarity_method: str = "cosine", page_size: int = 1000, batch_size: int = 16,
+                              embedding_cache_dir: str = None):
+        """ Creates text embeddings for the property "prop_to_embed" of all Nodes "node_label". The Nodes are read in
+        pages of "page_size" Nodes (ordered by "node_primary_prop_name"), their texts are embedded in padded
+        mini-batches of "batch_size" texts and the embeddings of each page are written back with one parameterized
+        "UNWIND $rows"-query. If "embedding_cache_dir" is set, unchanged texts are read from the embedding cache (see:
+        "EmbeddingCache" in "embedding_cache.py") instead of being embedded again. """
         name_embedded_prop = prop_to_embed + "_embedding"
         query_index = f"""CALL db.index.vector.createNodeIndex('{"NodeIndex" + "_" + node_label + "_" + prop_to_embed}',
                           '{node_label}', '{name_embedded_prop}', {vector_size}, '{similarity_method}' ) ; """
         query_prop_to_embed = f"""
-        MATCH (n:{node_label})     
-        RETURN n.{node_primary_prop_name} AS {node_primary_prop_name}, n.{prop_to_embed} AS {prop_to_embed}
+        MATCH (n:{node_label})
+        WHERE n.{prop_to_embed} IS NOT NULL AND ($last_key IS NULL OR n.{node_primary_prop_name} > $last_key)
+        RETURN n.{node_primary_prop_name} AS key, n.{prop_to_embed} AS text
+        ORDER BY key
+        LIMIT $page_size
+        """
+        query_set_embed_prop = f"""
+        UNWIND $rows AS row
+        MATCH (n:{node_label} {{ {node_primary_prop_name}: row.key }})
+        SET n.{name_embedded_prop} = row.embedding
         """
-        session = self.driver.session(database=self.neo4j_db_name)
         try:
             res = self.driver.execute_query(query_=query_index, database_=self.neo4j_db_name)
         except Exception as e:
             print(f'INFO: Index not created again as index already exists: {e}.')
-        embed_nodes_and_props: list[dict] = session.run(query=query_prop_to_embed).data()
-
-        embedder = Embedder()
-        for item in embed_nodes_and_props:
-            embedding = embedder.get_embedding(text=item[f'{prop_to_embed}'])
-            query_set_embed_prop = f"""
-            MATCH (n:{node_label})
-            WHERE n.{node_primary_prop_name} = '{item[f'{node_primary_prop_name}']}'
-            SET n.{name_embedded_prop} = {embedding} ;
-            """
-            session.run(query=query_set_embed_prop)
+
+        # The embedding model (torch, transformers) is only imported when it is needed:
+        from src.E_embeddings import Embedder
+        embedder = Embedder(cache_dir=embedding_cache_dir)
+        last_key = None
+        with self.driver.session(database=self.neo4j_db_name) as session:
+            while True:
+                page: list[dict] = session.run(query_prop_to_embed,
+                                               parameters={'last_key': last_key, 'page_size': page_size}).data()
+                if not page:
+                    break
+                embeddings: list[list] = embedder.get_embeddings(texts=[item['text'] for item in page],
+                                                                 batch_size=batch_size)
+                rows: list[dict] = [{'key': item['key'], 'embedding': embedding}
+                                    for item, embedding in zip(page, embeddings)]
+                session.run(query_set_embed_prop, parameters={'rows': rows}).consume()
+                last_key = page[-1]['key']
+        self.bump_generation()
 
     def load_data_into_knowledge_graph(self, unique_node_keys: dict[str:str] = None,
                                        node_value_props: dict[str:str] = None,
                                        nodes_data: list[dict] = None, rels_data: list[dict] = None,
-                                       show_queries: bool = False):
+                                       show_queries: bool = False, batch_size: int = None):
+        """ Loads the node_data/rel_data dictionaries into the KG. If "batch_size" is set, the dictionaries are grouped
+        by their key (Node label or relationship) and each group is loaded with "UNWIND $rows"-queries of at most
+        "batch_size" rows each instead of one query per dictionary. """
         # if nodes_data is None:
         #     nodes_data = {}
         # if rels_data is None:
         #     rels_data = {}
 
-        g = RDFGraph(path_to_onto=self.path_to_onto)
-        constraint_queries, node_queries, rel_queries, ns_queries = g.create_query_templates(
-            unique_node_keys=unique_node_keys, node_value_props=node_value_props)
+        constraint_queries, node_queries, rel_queries, ns_queries = self.get_query_templates(
+            unique_node_keys=unique_node_keys, node_value_props=node_value_props, unwind_rows=batch_size is not None)
 
         session = self.driver.session(database=self.neo4j_db_name)
 
@@ -202,6 +399,18 @@ class GraphConstruction:
                 print('Constraint_Query: ', constraint_query)
             res0 = session.run(constraint_query)
 
+        if batch_size is not None:
+            for key, query, batch in create_batches(nodes_data=nodes_data, rels_data=rels_data,
+                                                    node_queries=node_queries, rel_queries=rel_queries,
+                                                    batch_size=batch_size):
+                if show_queries:
+                    print('key:', key)
+                    print('Batch_Query:', query)
+                session.run(query, parameters={'rows': batch}).consume()
+            session.close()
+            self.bump_generation()
+            return
+
         for node_data in nodes_data:
             node = list(node_data.keys())[0]
             node_query = node_queries[node]
@@ -219,6 +428,221 @@ class GraphConstruction:
             res2 = session.run(rel_query, parameters={'rel_data': rel_data})
 
         session.close()
+        self.bump_generation()
+
+    def load_data_in_transactions(self, unique_node_keys: dict[str:str], node_value_props: dict[str:str],
+                                  nodes_data: list[dict], rels_data: list[dict], all_json_paths: list[str],
+                                  path_to_checkpoint: str, batch_size: int = 1000, show_queries: bool = False):
+        """ Loads the node_data/rel_data dictionaries into the KG like "load_data_into_knowledge_graph(batch_size=...)"
+        but every batch of at most "batch_size" rows is written in its own managed write transaction
+        ("execute_write"). After each committed batch, the batch index and a hash of the input files ("all_json_paths")
+        are stored in the checkpoint-file "path_to_checkpoint". If the method is run again with the same input files,
+        it resumes after the last committed batch. The checkpoint-file is removed once all batches are committed. """
+        constraint_queries, node_queries, rel_queries, ns_queries = self.get_query_templates(
+            unique_node_keys=unique_node_keys, node_value_props=node_value_props, unwind_rows=True)
+        batches = create_batches(nodes_data=nodes_data, rels_data=rels_data, node_queries=node_queries,
+                                 rel_queries=rel_queries, batch_size=batch_size)
+        input_hash: str = hash_input_files(all_json_paths=all_json_paths, batch_size=batch_size)
+        last_committed_batch: int = read_checkpoint(path_to_checkpoint=path_to_checkpoint, input_hash=input_hash)
+        if last_committed_batch >= 0:
+            print(f'INFO: Resuming after batch {last_committed_batch} of {len(batches)} batches.')
+
+        def run_batch(tx, query: str, rows: list[dict]):
+            tx.run(query, parameters={'rows': rows}).consume()
+
+        with self.driver.session(database=self.neo4j_db_name) as session:
+            for query in ns_queries + constraint_queries:
+                if show_queries:
+                    print('Query:', query)
+                session.run(query).consume()
+            for batch_index, (key, query, batch) in enumerate(batches):
+                if batch_index <= last_committed_batch:
+                    continue
+                if show_queries:
+                    print('key:', key)
+                    print('Batch_Query:', query)
+                session.execute_write(run_batch, query, batch)
+                write_checkpoint(path_to_checkpoint=path_to_checkpoint, input_hash=input_hash,
+                                 last_committed_batch=batch_index)
+        pathlib.Path(path_to_checkpoint).unlink(missing_ok=True)
+        self.bump_generation()
+
+    def load_batches(self, unique_node_keys: dict[str:str], node_value_props: dict[str:str],
+                     batches: Iterable[tuple[str, list[dict]]], show_queries: bool = False) -> int:
+        """ Loads (key, rows)-batches of node_data/rel_data dictionaries, e.g. from "ColumnarData.iter_batches()" of
+        the module "C_read_data.py", with the "UNWIND $rows"-query templates. Every batch is written in its own
+        managed write transaction as soon as it is created, so that the batches can be created lazily while loading.
+        All Node batches must come before the relationship batches that MATCH on these Nodes.
+        Returns the number of rows loaded. """
+        constraint_queries, node_queries, rel_queries, ns_queries = self.get_query_templates(
+            unique_node_keys=unique_node_keys, node_value_props=node_value_props, unwind_rows=True)
+        queries: dict[str:str] = {**node_queries, **rel_queries}
+
+        def run_batch(tx, query: str, rows: list[dict]):
+            tx.run(query, parameters={'rows': rows}).consume()
+
+        number_of_rows: int = 0
+        with self.driver.session(database=self.neo4j_db_name) as session:
+            for query in ns_queries + constraint_queries:
+                if show_queries:
+                    print('Query:', query)
+                session.run(query).consume()
+            for key, rows in batches:
+                if key not in queries:
+                    raise ValueError(f'No query template for "{key}" in the ontology "{self.path_to_onto}"!')
+                if show_queries:
+                    print('key:', key)
+                    print('Batch_Query:', queries[key])
+                session.execute_write(run_batch, queries[key], rows)
+                number_of_rows += len(rows)
+        self.bump_generation()
+        return number_of_rows
+
+    def load_data_incrementally(self, unique_node_keys: dict[str:str], node_value_props: dict[str:str],
+                                nodes_data: list[dict], rels_data: list[dict], batch_size: int = 1000,
+                                delete_missing: bool = False, show_queries: bool = False) -> dict[str:int]:
+        """ Writes only the differences between the node_data/rel_data dictionaries and the KG. The existing
+        relationships of the relationship types in "rels_data" are read with one query and compared with "rels_data"
+        (see: "diff_relationships()"). Then only new relationships (and their Nodes) are inserted, relationships with a
+        changed value are updated and relationships of the companies and periods in "rels_data" that are not in
+        "rels_data" anymore (e.g. a data point that became null) are deleted. If "delete_missing" is set, the
+        relationships of all other companies and periods are deleted as well, so "delete_missing" must only be set if
+        "rels_data" contains the complete dataset.
+        Returns the number of inserted, updated and deleted relationships. """
+        constraint_queries, node_queries, rel_queries, ns_queries = self.get_query_templates(
+            unique_node_keys=unique_node_keys, node_value_props=node_value_props, unwind_rows=True)
+
+        rel_types: dict[str, tuple[str, str, str]] = dict()
+        for relation, rel_props in [list(rel_data.items())[0] for rel_data in rels_data]:
+            if relation not in rel_types:
+                rel_types[relation] = split_relation(relation=relation, rel_data=rel_props)
+        # Only the relationships of the companies in "rels_data" are read, unless all of them may be deleted:
+        query_existing = f"""
+            MATCH (source:Company)-[r:{'|'.join(sorted({rel for _, rel, _ in rel_types.values()}))}]->(target)
+            WHERE $leis IS NULL OR source.LEI IN $leis
+            WITH source, r, target,
+                 [label IN labels(source) WHERE label IN $sources][0] AS source_label,
+                 [label IN labels(target) WHERE label IN $targets][0] AS target_label
+            WHERE source_label IS NOT NULL AND target_label IS NOT NULL
+            RETURN source_label + '|' + type(r) + '|' + target_label AS relation,
+                   properties(source) AS source, properties(target) AS target,
+                   r[$value_props[target_label]] AS value
+            """
+        leis: list[str] = sorted({list(rel_data.values())[0]['source']['Company']['LEI'] for rel_data in rels_data})
+        parameters: dict = {'leis': None if delete_missing else leis,
+                            'sources': list({source for source, _, _ in rel_types.values()}),
+                            'targets': list({target for _, _, target in rel_types.values()}),
+                            'value_props': node_value_props}
+        existing_rels: list[dict] = [record.data() for record in self.driver.execute_query(
+            query_=query_existing, parameters_=parameters, database_=self.neo4j_db_name).records] if rel_types else []
+        # Only relationships of the relationship types in "rels_data" are compared:
+        existing_rels = [row for row in existing_rels
+                         if tuple(row['relation'].split('|')) in rel_types.values()]
+        inserts, updates, deletes = diff_relationships(rels_data=rels_data, existing_rels=existing_rels,
+                                                       unique_node_keys=unique_node_keys,
+                                                       node_value_props=node_value_props,
+                                                       delete_missing=delete_missing)
+
+        # Nodes that already have a relationship in the KG exist and need not be written again:
+        existing_nodes: set = set()
+        for row in existing_rels:
+            source, _, target = row['relation'].split('|')
+            for node, node_props in [(source, row['source']), (target, row['target'])]:
+                existing_nodes.add((node, tuple(node_props.get(key) for key in unique_node_keys.get(node, []))))
+        new_nodes_data: list[dict] = list()
+        for node_data in nodes_data:
+            node, node_props = list(node_data.items())[0]
+            if (node, tuple(node_props.get(key) for key in unique_node_keys.get(node, []))) not in existing_nodes:
+                new_nodes_data.append(node_data)
+
+        def create_match_query(relation: str, action: str) -> str:
+            source, rel, target = relation.split('|')
+            source_keys = ', '.join(f'{key}: row.source.{key}' for key in unique_node_keys[source])
+            target_keys = ', '.join(f'{key}: row.target.{key}' for key in unique_node_keys[target])
+            return f"""
+                UNWIND $rows AS row
+                MATCH (source:{source} {{ {source_keys} }})-[r:{rel}]->(target:{target} {{ {target_keys} }})
+                {action.format(value_prop=node_value_props.get(target))}
+                """
+
+        with self.driver.session(database=self.neo4j_db_name) as session:
+            for query in ns_queries + constraint_queries:
+                session.run(query).consume()
+            for key, query, batch in create_batches(nodes_data=new_nodes_data, rels_data=inserts,
+                                                    node_queries=node_queries, rel_queries=rel_queries,
+                                                    batch_size=batch_size):
+                if show_queries:
+                    print('key:', key)
+                    print('Batch_Query:', query)
+                session.run(query, parameters={'rows': batch}).consume()
+            for rows, action in [(updates, 'SET r.{value_prop} = row.value'), (deletes, 'DELETE r')]:
+                rows_by_relation: dict[str, list[dict]] = dict()
+                for row in rows:
+                    rows_by_relation.setdefault(row['relation'], list()).append(row)
+                for relation, relation_rows in rows_by_relation.items():
+                    query = create_match_query(relation=relation, action=action)
+                    if show_queries:
+                        print('Query:', query)
+                    for batch in chunk_rows(rows=relation_rows, batch_size=batch_size):
+                        session.run(query, parameters={'rows': batch}).consume()
+        self.bump_generation()
+        return {'inserts': len(inserts), 'updates': len(updates), 'deletes': len(deletes)}
+
+
+class AsyncGraphConstruction:
+    """ Loads the node_data/rel_data dictionaries into the KG with the asynchronous NEO4J driver. Nodes of different
+    labels are independent of each other and are loaded concurrently first. Relationships of different types only
+    depend on their (already existing) source and target Nodes and are loaded concurrently afterwards. The batches of
+    one Node label or relationship type are written one after another to avoid concurrent MERGEs of the same Node. """
+
+    def __init__(self, path_to_onto: str, neo4j_db_name: str = 'neo4j', max_concurrency: int = 4,
+                 max_connection_pool_size: int = 10, use_template_cache: bool = True):
+        self.neo4j_db_name: str = neo4j_db_name
+        self.driver = Neo4jConnection.get_async_driver(max_connection_pool_size=max_connection_pool_size)
+        if not pathlib.Path(path_to_onto).is_file():
+            raise ValueError(f"Provided path to Ontology '{path_to_onto}' does not exist!")
+        self.path_to_onto: str = path_to_onto
+        self.template_cache_dir: str or None = pathlib.Path(
+            pathlib.Path(path_to_onto).parent, 'template_cache').as_posix() if use_template_cache else None
+        self.max_concurrency: int = max_concurrency
+
+    async def close(self):
+        await self.driver.close()
+
+    async def load_data_into_knowledge_graph(self, unique_node_keys: dict[str:str], node_value_props: dict[str:str],
+                                             nodes_data: list[dict], rels_data: list[dict], batch_size: int = 1000,
+                                             show_queries: bool = False):
+        g = RDFGraph(path_to_onto=self.path_to_onto, cache_dir=self.template_cache_dir)
+        constraint_queries, node_queries, rel_queries, ns_queries = g.create_query_templates(
+            unique_node_keys=unique_node_keys, node_value_props=node_value_props, unwind_rows=True)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(tx, query: str, rows: list[dict]):
+            result = await tx.run(query, parameters={'rows': rows})
+            await result.consume()
+
+        async def load_group(query: str, rows: list[dict]):
+            async with semaphore:
+                async with self.driver.session(database=self.neo4j_db_name) as session:
+                    for batch in chunk_rows(rows=rows, batch_size=batch_size):
+                        await session.execute_write(run_batch, query, batch)
+
+        async with self.driver.session(database=self.neo4j_db_name) as session:
+            for query in ns_queries + constraint_queries:
+                if show_queries:
+                    print('Query:', query)
+                result = await session.run(query)
+                await result.consume()
+
+        # All Nodes must exist before the relationship queries MATCH on them:
+        for data, queries in [(nodes_data, node_queries), (rels_data, rel_queries)]:
+            groups: dict[str, list[dict]] = group_data_by_key(data=data)
+            if show_queries:
+                for key in groups:
+                    print('key:', key)
+                    print('Batch_Query:', queries[key])
+            await asyncio.gather(*[load_group(query=queries[key], rows=rows) for key, rows in groups.items()])
+        Neo4jConnection.bump_graph_generation(neo4j_db_name=self.neo4j_db_name)
 
 
 if __name__ == '__main__':
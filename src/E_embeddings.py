@@ -1,14 +1,42 @@
 import torch
 from transformers import AutoTokenizer, AutoModel
 
+from src.embedding_cache import EmbeddingCache
+
 
 class Embedder:
+    """ Creates text embeddings with a pretrained transformer model. The tokenizer and model are only loaded when an
+    embedding must actually be computed. If "cache_dir" is set, embeddings are read from/written to an EmbeddingCache,
+    so that cached texts need neither model loading nor inference. """
 
-    def __init__(self, model_name: str = "bert-base-uncased", return_tensor: bool = False):
-        self.tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name_or_path=model_name)
-        self.model = AutoModel.from_pretrained(pretrained_model_name_or_path=model_name,
-                                               output_hidden_states=True)
+    def __init__(self, model_name: str = "bert-base-uncased", return_tensor: bool = False, cache_dir: str = None):
+        self.model_name: str = model_name
+        self._tokenizer = None
+        self._model = None
         self.return_tensor: bool = return_tensor
+        self.cache_dir: str = cache_dir
+        self.caches: dict[int, EmbeddingCache] = dict()
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name_or_path=self.model_name)
+        return self._tokenizer
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = AutoModel.from_pretrained(pretrained_model_name_or_path=self.model_name,
+                                                    output_hidden_states=True)
+        return self._model
+
+    def get_cache(self, num_last_layers: int) -> EmbeddingCache or None:
+        if self.cache_dir is None:
+            return None
+        if num_last_layers not in self.caches:
+            self.caches[num_last_layers] = EmbeddingCache(cache_dir=self.cache_dir, model_name=self.model_name,
+                                                          num_last_layers=num_last_layers)
+        return self.caches[num_last_layers]
 
     def tokenize_text(self, text: str, add_special_tokens: bool, padding: bool,
                       truncation: bool, return_tensors: str):
@@ -17,6 +45,11 @@ class Embedder:
 
     def get_embedding(self, text: str, num_last_layers: int = 12, add_special_tokens: bool = True, padding: bool = True,
                       truncation: bool = True, return_tensors: str = "pt") -> list or torch.Tensor:
+        cache: EmbeddingCache = self.get_cache(num_last_layers=num_last_layers)
+        if cache is not None:
+            cached_embedding: list = cache.get(text=text)
+            if cached_embedding is not None:
+                return torch.tensor([cached_embedding]) if self.return_tensor else cached_embedding
         tokenized_text = self.tokenize_text(text=text, add_special_tokens=add_special_tokens,
                                             truncation=truncation, padding=padding, return_tensors=return_tensors)
         with torch.no_grad():
@@ -43,9 +76,46 @@ class Embedder:
         else:
             # For calculating Graph-Embeddings:
             embedding_list: list = embedding.flatten().tolist()
+        if cache is not None:
+            cache.put(texts=[text], vectors=[embedding.flatten().tolist()])
 
         return embedding_list
 
+    def get_embeddings(self, texts: list[str], num_last_layers: int = 12, batch_size: int = 16,
+                       truncation: bool = True) -> list[list] or list[torch.Tensor]:
+        """ Batched variant of "get_embedding()": The texts are embedded in padded mini-batches of "batch_size" texts.
+        Texts are sorted by length before batching to keep the padding small, the embeddings are returned in the order
+        of "texts". Padding tokens are excluded from the mean over the tokens via the attention mask, so that the
+        embeddings equal those of "get_embedding()". Cached texts (see: "EmbeddingCache") are not embedded again. """
+        cache: EmbeddingCache = self.get_cache(num_last_layers=num_last_layers)
+        embeddings: list = [None] * len(texts)
+        if cache is not None:
+            for idx, text in enumerate(texts):
+                cached_embedding: list = cache.get(text=text)
+                if cached_embedding is not None:
+                    embeddings[idx] = torch.tensor([cached_embedding]) if self.return_tensor else cached_embedding
+        missing: list[int] = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+        order: list[int] = sorted(missing, key=lambda idx: len(texts[idx]))
+        for start in range(0, len(order), batch_size):
+            batch_idx: list[int] = order[start:start + batch_size]
+            encoded = self.tokenizer([texts[idx] for idx in batch_idx], add_special_tokens=True, max_length=512,
+                                     truncation=truncation, padding=True, return_tensors="pt")
+            with torch.no_grad():
+                output = self.model(**encoded)
+            if num_last_layers > 0:
+                layers = [no for no in range(-num_last_layers, 0, 1)]
+                hidden_states = torch.stack([output.hidden_states[i] for i in layers]).mean(dim=0)
+                mask = encoded['attention_mask'].unsqueeze(-1).to(hidden_states.dtype)
+                batch_embedding = (hidden_states * mask).sum(dim=1) / mask.sum(dim=1)
+            else:
+                batch_embedding = output.pooler_output
+            for row, idx in enumerate(batch_idx):
+                embeddings[idx] = batch_embedding[row:row + 1] if self.return_tensor else batch_embedding[row].tolist()
+            if cache is not None:
+                cache.put(texts=[texts[idx] for idx in batch_idx],
+                          vectors=[batch_embedding[row].tolist() for row in range(len(batch_idx))])
+        return embeddings
+
 
 if __name__ == '__main__':
     emb = Embedder(return_tensor=True)
@@ -1,13 +1,32 @@
 import os
-import pathlib
-from dotenv import load_dotenv
 
 from langchain.chains import GraphCypherQAChain
 from langchain_openai.chat_models import ChatOpenAI
 from langchain_core.prompts.prompt import PromptTemplate
 from langchain_community.graphs import Neo4jGraph
 
-from settings import path_base
+from src.neo4j_connection import Neo4jConnection
+
+
+class PooledNeo4jGraph(Neo4jGraph):
+    """ Neo4jGraph of langchain that runs its queries (including the schema queries of "refresh_schema()") with the
+    shared, pooled driver of Neo4jConnection instead of creating its own driver. The driver is owned by
+    Neo4jConnection, so "close()" does not close it (see: "Neo4jConnection.close_all()"). """
+
+    def __init__(self, neo4j_db_name: str = 'neo4j'):
+        self.driver = Neo4jConnection.get_driver(neo4j_db_name=neo4j_db_name)
+        self.neo4j_db_name: str = neo4j_db_name
+        self.schema: str = ""
+        self.structured_schema: dict = dict()
+        self.refresh_schema()
+
+    def query(self, query: str, params: dict = None) -> list[dict]:
+        records, summary, keys = self.driver.execute_query(query_=query, parameters_=params or dict(),
+                                                           database_=self.neo4j_db_name)
+        return [record.data() for record in records]
+
+    def close(self):
+        pass
 
 
 class GraphBot:
@@ -132,20 +151,11 @@ class GraphBot:
     DESC LIMIT 1
     """
 
-    def __init__(self):
-        path_to_secrets: pathlib.Path = pathlib.Path(path_base, 'secrets.env')
-        try:
-            load_dotenv(dotenv_path=path_to_secrets)  # Load secrets/env variables
-        except:
-            print('secrets could not be loaded!')
-        uri = "neo4j://localhost:7687"
-        neo4j_user = os.getenv('NEO4J_USER')
-        neo4j_pw = os.getenv('NEO4J_PW')
+    def __init__(self, neo4j_db_name: str = 'neo4j'):
         """ We need an OpenAI access key that is available for free (3 months) on: 
         website: https://platform.openai.com/docs/quickstart?context=python """
         openai_key = os.getenv("OPENAI_API_KEY")
-        self.graph = Neo4jGraph(url=uri, username=neo4j_user, password=neo4j_pw)
-        self.graph.refresh_schema()
+        self.graph = PooledNeo4jGraph(neo4j_db_name=neo4j_db_name)
         """ In order to use 'ChatOpenAI' as the LLM, we need to install OpenAI first: 'pip install openai' """
         self.chat_llm = ChatOpenAI(temperature=0, openai_api_key=openai_key)
 
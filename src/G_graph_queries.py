@@ -1,12 +1,12 @@
-import os
-import pathlib
-from dotenv import load_dotenv
+import threading
+import time
+from collections import OrderedDict
 from enum import Enum, StrEnum, auto
 
 import pandas as pd
-from neo4j import GraphDatabase, Result, Record, ResultSummary
+from neo4j import Result, Record, ResultSummary
 
-from settings import path_base
+from src.neo4j_connection import Neo4jConnection
 
 
 class Company(StrEnum):
@@ -70,153 +70,277 @@ def check_periods_length_and_order(periods: object or None, required_len: int =
     return sorted(periods)
 
 
+def quote_name(name: str) -> str:
+    """ Quotes a variable/column name with backticks, so that values (such as periods) in a name can not change the
+    query. """
+    return '`' + name.replace('`', '``') + '`'
+
+
+def normalise_parameter(value: object) -> object:
+    """ Returns a hashable value for a query parameter, in which the order of lists does not matter. """
+    if isinstance(value, dict):
+        return tuple(sorted((key, normalise_parameter(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted((normalise_parameter(item) for item in value), key=repr))
+    return value
+
+
+class ResultCache:
+    """ Thread-safe LRU-cache for query results with at most "max_size" entries. Entries expire after "ttl" seconds
+    and are not used anymore once the generation of the KG changed (see: "bump_graph_generation()" in
+    "neo4j_connection.py"), i.e. after every load or enrichment. """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600.0):
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.entries: OrderedDict[tuple, tuple[int, float, object]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: tuple, generation: int) -> object or None:
+        with self.lock:
+            entry: tuple = self.entries.get(key)
+            if entry is None or entry[0] != generation or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: tuple, generation: int, result: object):
+        with self.lock:
+            self.entries[key] = (generation, time.monotonic() + self.ttl, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
 class GraphQueries:
+    """ The values of the queries (ESRS label, company, periods, limit) are passed as query parameters ("$periods"),
+    so that NEO4J only plans each query once and reuses the plan for other values. Only Node labels, relationship
+    types and property names are part of the query text. The query texts are cached in "query_cache" per method,
+    ESRS and Stats (and the options that change the query text).
+    If "result_cache_size" is set, the results are cached as well (see: "ResultCache") for at most "result_cache_ttl"
+    seconds or until the KG is changed by GraphConstruction or SparqlEnrichment. """
+    query_cache: dict[tuple:str] = dict()
 
-    def __init__(self, neo4j_db_name: str = 'neo4j', print_queries: bool = False):
-        path_to_secrets: pathlib.Path = pathlib.Path(path_base, 'secrets.env')
-        try:
-            load_dotenv(dotenv_path=path_to_secrets)  # Load secrets/env variables
-        except:
-            print('secrets could not be loaded!')
-        uri = "neo4j://localhost:7687"
+    def __init__(self, neo4j_db_name: str = 'neo4j', print_queries: bool = False, result_cache_size: int = None,
+                 result_cache_ttl: float = 3600.0):
         self.neo4j_db_name: str = neo4j_db_name
-        auth = (os.getenv('NEO4J_USER'), os.getenv('NEO4J_PW'))
-        self.driver = GraphDatabase.driver(uri, auth=auth)
+        self.driver = Neo4jConnection.get_driver(neo4j_db_name=neo4j_db_name)
         self.print_queries = print_queries
+        self.result_cache: ResultCache or None = None if not result_cache_size \
+            else ResultCache(max_size=result_cache_size, ttl=result_cache_ttl)
 
-    def _query(self, query: str) -> tuple[Record, ResultSummary, list[str]]:
+    def _query(self, query: str, parameters: dict = None) -> tuple[Record, ResultSummary, list[str]]:
         """ Returns: tuple[Record, ResultSummary, list[keys]] """
-        records, summary, keys = self.driver.execute_query(query_=query, database_=self.neo4j_db_name)
+        records, summary, keys = self.driver.execute_query(query_=query, parameters_=parameters,
+                                                           database_=self.neo4j_db_name)
         return records, summary, keys
 
-    def _query_df(self, query: str) -> pd.DataFrame:
+    def _query_df(self, query: str, parameters: dict = None) -> pd.DataFrame:
         """ Return pandas DataFrame """
         df: pd.DataFrame = self.driver.execute_query(query_=query,
+                                                     parameters_=parameters,
                                                      database_=self.neo4j_db_name,
                                                      result_transformer_=Result.to_df)
         return df
 
+    def _execute(self, query: str, parameters: dict, return_df: bool) -> list[Record] or pd.DataFrame:
+        if self.print_queries:
+            print(query)
+            print('Parameters:', parameters)
+        if self.result_cache is None:
+            return self._query_df(query=query, parameters=parameters) if return_df \
+                else self._query(query=query, parameters=parameters)[0]
+        # The query text identifies the method, ESRS and Stats, the parameters the values. The order of the periods
+        # does not change the result:
+        key: tuple = (query, return_df, normalise_parameter(parameters))
+        generation: int = Neo4jConnection.get_graph_generation(neo4j_db_name=self.neo4j_db_name)
+        result = self.result_cache.get(key=key, generation=generation)
+        if result is None:
+            result = self._query_df(query=query, parameters=parameters) if return_df \
+                else self._query(query=query, parameters=parameters)[0]
+            self.result_cache.put(key=key, generation=generation, result=result)
+        # A copy is returned, so that changes of the caller do not change the cached result:
+        return result.copy() if return_df else list(result)
+
     def get_esrs_data(self, esrs: ESRS, company: Company or None = None, periods: list or None = None,
                       return_df: bool = False, limit: int = 10) -> list[Record] or pd.DataFrame:
         check_periods_type(periods=periods)
-        where_clause: str = '' if periods is None else f'WHERE target.period IN {periods}'
-        company_str: str = '' if company is None else f'{{label: "{company.name}"}}'
-        query = f"""
-            MATCH (source:Company{company_str})-[rel:{esrs.value['REL']}]->(target:{esrs.value['NODE']} {{label: "{esrs.name}"}})
+        key: tuple = ('get_esrs_data', esrs, company is None, periods is None)
+        if key not in self.query_cache:
+            where_clause: str = '' if periods is None else 'WHERE target.period IN $periods'
+            company_str: str = '' if company is None else ' {label: $company}'
+            self.query_cache[key] = f"""
+            MATCH (source:Company{company_str})-[rel:{esrs.value['REL']}]->(target:{esrs.value['NODE']} {{label: $esrs}})
             {where_clause}
             RETURN source.label AS company, target.period AS year, rel.{esrs.value['UNIT']} AS {esrs.value['UNIT']}_{esrs.name}
             ORDER by {esrs.value['UNIT']}_{esrs.name} DESC
-            LIMIT {limit}
+            LIMIT $limit
             """
-        if self.print_queries:
-            print(query)
-        return self._query_df(query=query) if return_df else self._query(query=query)[0]
+        parameters: dict = {'esrs': esrs.name, 'company': None if company is None else company.name,
+                            'periods': periods, 'limit': limit}
+        return self._execute(query=self.query_cache[key], parameters=parameters, return_df=return_df)
 
     def get_statistics_by_company(self, esrs: ESRS, stat: Stats, periods: list or None = None,
                                   return_df: bool = False, limit: int = 10) -> list[Record] or pd.DataFrame:
         check_periods_type(periods=periods)
-        where_clause: str = '' if periods is None else f'WHERE target.period IN {periods}'
-        with_period: str = ', target' if stat in [Stats.MAX, Stats.MIN] else ''
-        return_period: str = 'target.period AS year, ' if stat in [Stats.MAX, Stats.MIN] else ''
-        sort_order: str = "ASC" if stat == Stats.MIN else "DESC"
-        limit_str = f'LIMIT {limit}' if return_df else 'LIMIT 1'
-        query = f"""
-            MATCH (source:Company)-[rel:{esrs.value['REL']}]->(target:{esrs.value['NODE']} {{label: "{esrs.name}"}})
+        key: tuple = ('get_statistics_by_company', esrs, stat, periods is None)
+        if key not in self.query_cache:
+            where_clause: str = '' if periods is None else 'WHERE target.period IN $periods'
+            with_period: str = ', target' if stat in [Stats.MAX, Stats.MIN] else ''
+            return_period: str = 'target.period AS year, ' if stat in [Stats.MAX, Stats.MIN] else ''
+            sort_order: str = "ASC" if stat == Stats.MIN else "DESC"
+            self.query_cache[key] = f"""
+            MATCH (source:Company)-[rel:{esrs.value['REL']}]->(target:{esrs.value['NODE']} {{label: $esrs}})
             {where_clause}
             WITH source, {stat.name}(rel.{esrs.value['UNIT']}) AS {stat.name}_{esrs.name}{with_period}
             RETURN source.label AS company, {return_period} {stat.name}_{esrs.name} 
             ORDER by {stat.name}_{esrs.name} {sort_order}
-            {limit_str}
+            LIMIT $limit
             """
-        if self.print_queries:
-            print(query)
-        return self._query_df(query=query) if return_df else self._query(query=query)[0]
+        parameters: dict = {'esrs': esrs.name, 'periods': periods, 'limit': limit if return_df else 1}
+        return self._execute(query=self.query_cache[key], parameters=parameters, return_df=return_df)
 
     def get_statistics_by_esrs_data(self, esrs: ESRS, stat: Stats, periods: list or None = None,
                                     by_period: bool = False, return_df: bool = False,
                                     limit: int = 10) -> list[Record] or pd.DataFrame:
         check_periods_type(periods=periods)
-        where_clause: str = '' if periods is None else f'WHERE target.period IN {periods}'
-        with_period: str = '' if periods is None or not by_period else ', target.period as year'
-        return_period: str = '' if periods is None or not by_period else 'year,'
-        sort_order: str = "ASC" if stat == Stats.MIN else "DESC"
-        limit_str = f'LIMIT {limit}' if return_df else 'LIMIT 1'
-        query = f"""
-            MATCH (source:Company)-[rel:{esrs.value['REL']}]->(target:{esrs.value['NODE']} {{label: "{esrs.name}"}})
+        key: tuple = ('get_statistics_by_esrs_data', esrs, stat, periods is None, by_period)
+        if key not in self.query_cache:
+            where_clause: str = '' if periods is None else 'WHERE target.period IN $periods'
+            with_period: str = '' if periods is None or not by_period else ', target.period as year'
+            return_period: str = '' if periods is None or not by_period else 'year,'
+            sort_order: str = "ASC" if stat == Stats.MIN else "DESC"
+            self.query_cache[key] = f"""
+            MATCH (source:Company)-[rel:{esrs.value['REL']}]->(target:{esrs.value['NODE']} {{label: $esrs}})
             {where_clause}
             WITH {stat.name}(rel.{esrs.value['UNIT']}) AS {stat.name}_{esrs.name}, target.label AS label{with_period}
             RETURN label, {return_period} {stat.name}_{esrs.name} 
             ORDER by {stat.name}_{esrs.name} {sort_order}
-            {limit_str}
+            LIMIT $limit
             """
-        if self.print_queries:
-            print(query)
-        return self._query_df(query=query) if return_df else self._query(query=query)[0]
+        parameters: dict = {'esrs': esrs.name, 'periods': periods, 'limit': limit if return_df else 1}
+        return self._execute(query=self.query_cache[key], parameters=parameters, return_df=return_df)
 
     def get_ratio_of_two_esrs(self, esrs_numerator: ESRS, esrs_denominator: ESRS, company: Company or None = None,
                               periods: list or None = None, return_df: bool = False, stat: Stats = None, limit: int = 10):
         check_periods_type(periods=periods)
         if stat is not None:
             periods = check_periods_length_and_order(periods=periods)
-        company_str: str = '' if company is None else f'{{label: "{company.name}"}}'
-        period_str: str = f' AND target_1.period IN {periods}' if periods else ''
-        return_label: str = '' if stat is not None else 'source.label AS label, '
-        stat_str: str = stat.name if stat is not None and company is None else ''
-        query = f"""
-        MATCH (source:Company{company_str})-[rel_numerator:{esrs_numerator.value['REL']}]->(target_1:{esrs_numerator.value['NODE']} {{label: "{esrs_numerator.name}"}})
-        MATCH (source:Company{company_str})-[rel_denominator:{esrs_denominator.value['REL']}]->(target_2:{esrs_denominator.value['NODE']} {{label: "{esrs_denominator.name}"}})
+        key: tuple = ('get_ratio_of_two_esrs', esrs_numerator, esrs_denominator, stat, company is None, not periods)
+        if key not in self.query_cache:
+            company_str: str = '' if company is None else ' {label: $company}'
+            period_str: str = ' AND target_1.period IN $periods' if periods else ''
+            return_label: str = '' if stat is not None else 'source.label AS label, '
+            stat_str: str = stat.name if stat is not None and company is None else ''
+            self.query_cache[key] = f"""
+        MATCH (source:Company{company_str})-[rel_numerator:{esrs_numerator.value['REL']}]->(target_1:{esrs_numerator.value['NODE']} {{label: $esrs_numerator}})
+        MATCH (source:Company{company_str})-[rel_denominator:{esrs_denominator.value['REL']}]->(target_2:{esrs_denominator.value['NODE']} {{label: $esrs_denominator}})
         WHERE target_1.period = target_2.period{period_str}
         RETURN {return_label}target_1.period AS year, toFloat( {stat_str}(rel_numerator.{esrs_numerator.value['UNIT']}) / {stat_str}(rel_denominator.{esrs_denominator.value['UNIT']}) ) AS ratio{'_' + stat_str if stat_str != '' else ''}_{esrs_numerator.name}_to{'_' + stat_str if stat_str != '' else ''}_{esrs_denominator.name}
         ORDER BY ratio{'_' + stat_str if stat_str != '' else ''}_{esrs_numerator.name}_to{'_' + stat_str if stat_str != '' else ''}_{esrs_denominator.name} DESC
-        LIMIT {limit}
+        LIMIT $limit
         """
-        if self.print_queries:
-            print(query)
-        return self._query_df(query=query) if return_df else self._query(query=query)[0]
+        parameters: dict = {'esrs_numerator': esrs_numerator.name, 'esrs_denominator': esrs_denominator.name,
+                            'company': None if company is None else company.name, 'periods': periods, 'limit': limit}
+        return self._execute(query=self.query_cache[key], parameters=parameters, return_df=return_df)
 
     def get_difference_of_two_periods(self, esrs: ESRS, periods: list,
                                       company: Company or None = None, stat: Stats = None,
                                       return_df: bool = False, limit: int = 10):
         check_periods_type(periods=periods)
         periods = check_periods_length_and_order(periods=periods, required_len=2)
-        company_str: str = '' if company is None else f'{{label: "{company.name}"}}'
-        return_label: str = '' if stat is not None else 'source.label AS label, '
-        stat_str: str = stat.name if stat is not None and company is None else ''
-        query = f"""
-        MATCH (source:Company{company_str})-[rel_1:{esrs.value['REL']}]->(target_1:{esrs.value['NODE']} {{label: "{esrs.name}"}})
-        MATCH (source:Company{company_str})-[rel_2:{esrs.value['REL']}]->(target_2:{esrs.value['NODE']} {{label: "{esrs.name}"}})
-        WHERE target_1.period = "{periods[0]}" AND target_2.period = "{periods[1]}"
-        RETURN {return_label}( {stat_str}(rel_2.{esrs.value['UNIT']}) - {stat_str}(rel_1.{esrs.value['UNIT']}) ) AS diff{'_' + stat_str if stat_str != '' else ''}_{esrs.value['UNIT']}_{periods[1]}_to_{periods[0]},
-        round( toFloat( toFloat( {stat_str}(rel_2.{esrs.value['UNIT']}) - {stat_str}(rel_1.{esrs.value['UNIT']}) ) / {stat_str}(rel_1.{esrs.value['UNIT']}) ), 5) AS change{'_' + stat_str if stat_str != '' else ''}_pct_{periods[1]}_to_{periods[0]}
-        ORDER BY diff{'_' + stat_str if stat_str != '' else ''}_{esrs.value['UNIT']}_{periods[1]}_to_{periods[0]} DESC
-        LIMIT {limit}
+        # The periods are part of the column names, so there is one query text per pair of periods:
+        key: tuple = ('get_difference_of_two_periods', esrs, stat, company is None, tuple(periods))
+        if key not in self.query_cache:
+            company_str: str = '' if company is None else ' {label: $company}'
+            return_label: str = '' if stat is not None else 'source.label AS label, '
+            stat_str: str = stat.name if stat is not None and company is None else ''
+            diff_name: str = quote_name(f"diff{'_' + stat_str if stat_str != '' else ''}_{esrs.value['UNIT']}_{periods[1]}_to_{periods[0]}")
+            change_name: str = quote_name(f"change{'_' + stat_str if stat_str != '' else ''}_pct_{periods[1]}_to_{periods[0]}")
+            self.query_cache[key] = f"""
+        MATCH (source:Company{company_str})-[rel_1:{esrs.value['REL']}]->(target_1:{esrs.value['NODE']} {{label: $esrs}})
+        MATCH (source:Company{company_str})-[rel_2:{esrs.value['REL']}]->(target_2:{esrs.value['NODE']} {{label: $esrs}})
+        WHERE target_1.period = $period_1 AND target_2.period = $period_2
+        RETURN {return_label}( {stat_str}(rel_2.{esrs.value['UNIT']}) - {stat_str}(rel_1.{esrs.value['UNIT']}) ) AS {diff_name},
+        round( toFloat( toFloat( {stat_str}(rel_2.{esrs.value['UNIT']}) - {stat_str}(rel_1.{esrs.value['UNIT']}) ) / {stat_str}(rel_1.{esrs.value['UNIT']}) ), 5) AS {change_name}
+        ORDER BY {diff_name} DESC
+        LIMIT $limit
         """
-        if self.print_queries:
-            print(query)
-        return self._query_df(query=query) if return_df else self._query(query=query)[0]
+        parameters: dict = {'esrs': esrs.name, 'company': None if company is None else company.name,
+                            'period_1': periods[0], 'period_2': periods[1], 'limit': limit}
+        return self._execute(query=self.query_cache[key], parameters=parameters, return_df=return_df)
 
     def get_esrs_by_company_property(self, esrs: ESRS, comp_prop: CompProp, periods: list, stat: Stats = None,
                                      return_df: bool = False, limit: int = 10):
         check_periods_type(periods=periods)
-        stat_str: str = stat.name if stat is not None else ''
-        var_name: str = f'{(stat_str + "_") if stat else ""}{esrs.name}{ "_" + "_".join(sorted(periods))} '
-        return_str_1: str = f', source.label AS company' if stat is None else ''
-        return_str_2: str = f', target.period AS year' if stat is None else ''
-        return_str_3: str = f', {stat_str}(rel.{esrs.value["UNIT"]}) {"AS " + var_name}'
-        query = f"""
+        # The periods are part of the column name, so there is one query text per set of periods:
+        key: tuple = ('get_esrs_by_company_property', esrs, stat, comp_prop, tuple(sorted(periods)))
+        if key not in self.query_cache:
+            stat_str: str = stat.name if stat is not None else ''
+            var_name: str = quote_name(f'{(stat_str + "_") if stat else ""}{esrs.name}{ "_" + "_".join(sorted(periods))}')
+            return_str_1: str = f', source.label AS company' if stat is None else ''
+            return_str_2: str = f', target.period AS year' if stat is None else ''
+            return_str_3: str = f', {stat_str}(rel.{esrs.value["UNIT"]}) {"AS " + var_name}'
+            self.query_cache[key] = f"""
         MATCH (source:Company) 
         UNWIND source.{comp_prop.value} AS colls 
         WITH collect(DISTINCT colls) AS colls
         UNWIND colls AS coll
-        MATCH (source:Company)-[rel:{esrs.value['REL']}]->(target:{esrs.value['NODE']} {{label: "{esrs.name}"}}) 
-        WHERE coll in source.{comp_prop.value} AND target.period in {periods}
+        MATCH (source:Company)-[rel:{esrs.value['REL']}]->(target:{esrs.value['NODE']} {{label: $esrs}}) 
+        WHERE coll in source.{comp_prop.value} AND target.period in $periods
         RETURN coll{return_str_1}{return_str_2}{return_str_3}
         ORDER by {var_name} DESC
-        LIMIT {limit}
+        LIMIT $limit
         """
-        if self.print_queries:
-            print(query)
-        return self._query_df(query=query) if return_df else self._query(query=query)[0]
+        parameters: dict = {'esrs': esrs.name, 'periods': periods, 'limit': limit}
+        return self._execute(query=self.query_cache[key], parameters=parameters, return_df=return_df)
+
+    def get_esrs_table(self, esrs_list: list[ESRS], companies: list[Company] or None = None,
+                       periods: list or None = None) -> pd.DataFrame:
+        """ Returns the values of several ESRS data points with one query: the relationships of the Company Nodes with
+        the relationship types of the ESRS are matched once and filtered by the Node label and label of each ESRS. The result is a wide
+        DataFrame with one row per company and period ("company", "year") and one column per ESRS, named like in
+        "get_esrs_data()" (e.g. "EUR_NetRevenue"). Missing values are NaN. If "companies" or "periods" are None, all
+        companies or periods in the KG are returned. """
+        check_periods_type(periods=periods)
+        if not esrs_list:
+            raise ValueError('"esrs_list" must contain at least one ESRS')
+        rel_types: tuple = tuple(sorted({esrs.value['REL'] for esrs in esrs_list}))
+        key: tuple = ('get_esrs_table', rel_types)
+        if key not in self.query_cache:
+            self.query_cache[key] = f"""
+            MATCH (source:Company)-[rel:{'|'.join(rel_types)}]->(target)
+            WHERE ($companies IS NULL OR source.label IN $companies)
+            AND target.label IN keys($rels) AND type(rel) = $rels[target.label]
+            AND $nodes[target.label] IN labels(target)
+            AND ($periods IS NULL OR target.period IN $periods)
+            RETURN source.label AS company, target.period AS year, target.label AS label,
+                   rel[$units[target.label]] AS value
+            """
+        parameters: dict = {'rels': {esrs.name: esrs.value['REL'] for esrs in esrs_list},
+                            'nodes': {esrs.name: esrs.value['NODE'] for esrs in esrs_list},
+                            'units': {esrs.name: esrs.value['UNIT'] for esrs in esrs_list},
+                            'companies': None if companies is None else [company.name for company in companies],
+                            'periods': periods}
+        df: pd.DataFrame = self._execute(query=self.query_cache[key], parameters=parameters, return_df=True)
+        columns: dict[str:str] = {esrs.name: f"{esrs.value['UNIT']}_{esrs.name}" for esrs in esrs_list}
+        if df.empty:
+            return pd.DataFrame(columns=['company', 'year'] + list(columns.values()))
+        table: pd.DataFrame = df.pivot_table(index=['company', 'year'], columns='label', values='value',
+                                             aggfunc='first')
+        table = table.reindex(columns=list(columns)).rename(columns=columns).sort_index().reset_index()
+        table.columns.name = None
+        return table
 
 
 if __name__ == '__main__':
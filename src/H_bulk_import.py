@@ -0,0 +1,116 @@
+import csv
+import pathlib
+
+from settings import path_data
+
+
+class BulkImportExporter:
+    """ Writes the node_data/relationship_data lists created by "get_data_dicts()" of the module "C_read_data.py" into
+    header- and data-CSV-files in the format of the offline "neo4j-admin database import"-tool. The IDs of the Nodes are
+    derived from the unique_node_keys (see: "/src/models/Ontologies/onto4/params.py"), each Node label has its own
+    ID-space. The values of the target Nodes are stored in the relationships as set in node_value_props, i.e. the same
+    way as in the query templates of the module "B_rdf_graph.py".
+    Please note: The import-tool only creates Nodes and relationships. The constraints (see: "create_query_templates()"
+    of the module "B_rdf_graph.py") must be created after the import. """
+
+    id_separator: str = "|"
+
+    def __init__(self, unique_node_keys: dict[str: list[str]], node_value_props: dict[str:str]):
+        self.unique_node_keys: dict[str: list[str]] = unique_node_keys
+        self.node_value_props: dict[str:str] = node_value_props
+
+    def get_node_id(self, node: str, node_props: dict) -> str:
+        keys: list[str] = self.unique_node_keys.get(node)
+        if not keys:
+            raise ValueError(f'No key property provided for Node "{node}" in unique_node_keys.')
+        missing_keys = [key for key in keys if key not in node_props]
+        if missing_keys:
+            raise ValueError(f'Key properties {missing_keys} are missing for Node "{node}": {node_props}')
+        return self.id_separator.join(str(node_props[key]) for key in keys)
+
+    @staticmethod
+    def write_csv(path: pathlib.Path, rows: list[list]):
+        with open(file=path, mode="w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerows(rows)
+
+    def export(self, node_data: list[dict], relationship_data: list[dict],
+               target_dir: str = None) -> tuple[list[tuple[str, str]], list[tuple[str, str]]]:
+        """ Writes one header-file and one data-file per Node label and per relationship and returns the lists of
+        (header-file, data-file)-tuples for Nodes and relationships. Duplicate Nodes (same ID) and duplicate relationships
+        (same start ID, end ID and type) are written only once, like "MERGE" does in the query templates. """
+        target_path = pathlib.Path(path_data, 'bulk_import') if target_dir is None else pathlib.Path(target_dir)
+        target_path.mkdir(parents=True, exist_ok=True)
+
+        # Nodes:
+        nodes: dict[str, dict[str, dict]] = dict()
+        for item in node_data:
+            node, node_props = list(item.items())[0]
+            if node not in nodes:
+                nodes[node] = dict()
+            node_id: str = self.get_node_id(node=node, node_props=node_props)
+            if node_id not in nodes[node]:
+                nodes[node][node_id] = node_props
+        node_files: list[tuple[str, str]] = list()
+        for node, node_rows in nodes.items():
+            props: list[str] = list()
+            for node_props in node_rows.values():
+                props += [prop for prop in node_props if prop not in props]
+            header: list[str] = [f':ID({node})'] + props + [':LABEL']
+            rows: list[list] = [[node_id] + [node_props.get(prop, '') for prop in props] + [node]
+                                for node_id, node_props in node_rows.items()]
+            header_path = pathlib.Path(target_path, f'nodes_{node}_header.csv')
+            data_path = pathlib.Path(target_path, f'nodes_{node}.csv')
+            self.write_csv(path=header_path, rows=[header])
+            self.write_csv(path=data_path, rows=rows)
+            node_files.append((header_path.as_posix(), data_path.as_posix()))
+
+        # Relationships:
+        relationships: dict[str, tuple[str, str, dict[tuple, list]]] = dict()
+        for item in relationship_data:
+            relation, rel_data = list(item.items())[0]
+            source, source_props = list(rel_data['source'].items())[0]
+            target, target_props = list(rel_data['target'].items())[0]
+            # The relation key is built as f"{source}_{rel}_{target}" in the module "B_rdf_graph.py":
+            rel: str = relation[len(source) + 1:len(relation) - len(target) - 1]
+            start_id: str = self.get_node_id(node=source, node_props=source_props)
+            end_id: str = self.get_node_id(node=target, node_props=target_props)
+            row: list = [start_id, end_id]
+            if target in self.node_value_props:
+                row.append(target_props[self.node_value_props[target]])
+            row.append(rel)
+            if relation not in relationships:
+                relationships[relation] = (source, target, dict())
+            if (start_id, end_id, rel) not in relationships[relation][2]:
+                relationships[relation][2][(start_id, end_id, rel)] = row
+        rel_files: list[tuple[str, str]] = list()
+        for relation, (source, target, rel_rows) in relationships.items():
+            rows: list[list] = list(rel_rows.values())
+            value_prop: list[str] = [f'{self.node_value_props[target]}:double'] if target in self.node_value_props else []
+            header: list[str] = [f':START_ID({source})', f':END_ID({target})'] + value_prop + [':TYPE']
+            header_path = pathlib.Path(target_path, f'rels_{relation}_header.csv')
+            data_path = pathlib.Path(target_path, f'rels_{relation}.csv')
+            self.write_csv(path=header_path, rows=[header])
+            self.write_csv(path=data_path, rows=rows)
+            rel_files.append((header_path.as_posix(), data_path.as_posix()))
+
+        return node_files, rel_files
+
+    @staticmethod
+    def get_import_command(node_files: list[tuple[str, str]], rel_files: list[tuple[str, str]],
+                           neo4j_db_name: str = 'neo4j') -> str:
+        """ Returns the "neo4j-admin database import full"-command for the files written by "export()". The database
+        must be stopped (or not exist yet) when the command is executed. """
+        nodes: list[str] = [f'--nodes={header},{data}' for header, data in node_files]
+        rels: list[str] = [f'--relationships={header},{data}' for header, data in rel_files]
+        return ' '.join(['neo4j-admin database import full', neo4j_db_name, '--overwrite-destination'] + nodes + rels)
+
+
+if __name__ == '__main__':
+    from src.C_read_data import get_data_dicts
+    from src.models.Ontologies.onto4.params import unique_node_keys, node_value_props
+    json_paths = ['./data/JSONs/Adidas_2022.json', './data/JSONs/BASF_2022.json']
+    n_data, r_data = get_data_dicts(all_json_paths=json_paths)
+    exporter = BulkImportExporter(unique_node_keys=unique_node_keys, node_value_props=node_value_props)
+    n_files, r_files = exporter.export(node_data=n_data, relationship_data=r_data)
+    print(exporter.get_import_command(node_files=n_files, rel_files=r_files))
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import requests
+from neo4j import Driver
+
+from src.neo4j_connection import Neo4jConnection
+
+
+class SparqlResponseCache:
+    """ Persistent SQLite-cache for the results of SPARQL queries. Entries are keyed by the endpoint URL and the
+    normalised query text (whitespace collapsed). Each endpoint ("source") can have its own time-to-live in seconds
+    ("ttls"), all other endpoints use "default_ttl". Expired entries are only returned if "allow_expired" is set, e.g. in
+    offline mode. Every access opens its own connection (committed and closed afterwards), so that the cache can be
+    used by several threads. """
+
+    def __init__(self, path_to_db: str, ttls: dict[str, int] = None, default_ttl: int = 30 * 24 * 3600):
+        self.path_to_db: str = str(path_to_db)
+        self.ttls: dict[str, int] = dict() if ttls is None else ttls
+        self.default_ttl: int = default_ttl
+        self.lock = threading.Lock()
+        with self.lock, closing(sqlite3.connect(self.path_to_db)) as connection, connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                  key TEXT PRIMARY KEY, endpoint TEXT, query TEXT, bindings TEXT, created REAL)""")
+
+    @staticmethod
+    def normalise_query(query: str) -> str:
+        return ' '.join(query.split())
+
+    def get_key(self, endpoint: str, query: str) -> str:
+        return hashlib.sha256(f'{endpoint}\n{self.normalise_query(query=query)}'.encode('utf-8')).hexdigest()
+
+    def get(self, endpoint: str, query: str, allow_expired: bool = False) -> list[dict] or None:
+        with self.lock, closing(sqlite3.connect(self.path_to_db)) as connection, connection:
+            row = connection.execute("SELECT bindings, created FROM responses WHERE key = ?",
+                                     (self.get_key(endpoint=endpoint, query=query),)).fetchone()
+        if row is None:
+            return None
+        bindings, created = row
+        if not allow_expired and time.time() - created > self.ttls.get(endpoint, self.default_ttl):
+            return None
+        return json.loads(bindings)
+
+    def put(self, endpoint: str, query: str, bindings: list[dict]):
+        with self.lock, closing(sqlite3.connect(self.path_to_db)) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (self.get_key(endpoint=endpoint, query=query), endpoint,
+                                self.normalise_query(query=query), json.dumps(bindings), time.time()))
+
+
+class SparqlEnrichment:
+    """ Enriches Nodes of the NEO4J Knowledge Graph ("KG") with external data from wikidata/dbpedia. In contrast to the
+    "import_..."-methods of the class GraphConstruction (module "D_graph_construction.py"), which send one SPARQL
+    request per Node from within NEO4J ("apoc.load.jsonParams"), the keys of all Nodes are collected in Python and sent
+    in chunks of "chunk_size" keys per SPARQL query (with a "VALUES"-clause). The chunks are requested concurrently by
+    at most "max_workers" threads and the results are written back with one "UNWIND $rows"-query per property.
+    The endpoint URLs can be replaced, e.g. by a local SPARQL server for testing.
+    If a SparqlResponseCache is provided ("cache"), SPARQL results are read from and written to the cache. In "offline"
+    mode, results are only replayed from the cache (regardless of their age) and the endpoints are never called. """
+
+    wikidata_endpoint: str = "https://query.wikidata.org/sparql"
+    dbpedia_endpoint: str = "https://dbpedia.org/sparql"
+
+    def __init__(self, driver: Driver, neo4j_db_name: str = 'neo4j', wikidata_endpoint: str = None,
+                 dbpedia_endpoint: str = None, chunk_size: int = 50, max_workers: int = 4, timeout: int = 60,
+                 cache: SparqlResponseCache = None, offline: bool = False):
+        self.driver: Driver = driver
+        self.neo4j_db_name: str = neo4j_db_name
+        self.wikidata_endpoint = self.wikidata_endpoint if wikidata_endpoint is None else wikidata_endpoint
+        self.dbpedia_endpoint = self.dbpedia_endpoint if dbpedia_endpoint is None else dbpedia_endpoint
+        if chunk_size < 1:
+            raise ValueError(f'"chunk_size" must be a positive integer but is: "{chunk_size}"')
+        self.chunk_size: int = chunk_size
+        self.max_workers: int = max_workers
+        self.timeout: int = timeout
+        if offline and cache is None:
+            raise ValueError('A "cache" must be provided in "offline" mode!')
+        self.cache: SparqlResponseCache = cache
+        self.offline: bool = offline
+        self.label_wikidata_id = "wikidataID"
+
+    @staticmethod
+    def to_sparql_term(value: str) -> str:
+        """ URIs (such as wikidata entities) are written as <URI>, all other values as string literals. """
+        if value.startswith('http://') or value.startswith('https://'):
+            return f'<{value}>'
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    def run_sparql(self, endpoint: str, query: str) -> list[dict]:
+        """ Sends one SPARQL query and returns the bindings of the result. """
+        if self.cache is not None:
+            bindings: list[dict] = self.cache.get(endpoint=endpoint, query=query, allow_expired=self.offline)
+            if bindings is not None:
+                return bindings
+            if self.offline:
+                raise ValueError(f'Offline mode: No cached response for SPARQL query to "{endpoint}": {query}')
+        response = requests.get(endpoint, params={'query': query}, timeout=self.timeout,
+                                headers={'Accept': 'application/sparql-results+json',
+                                         'User-Agent': 'UASFRA-MS-KnowledgeGraph'})
+        response.raise_for_status()
+        bindings: list[dict] = response.json()['results']['bindings']
+        if self.cache is not None:
+            self.cache.put(endpoint=endpoint, query=query, bindings=bindings)
+        return bindings
+
+    def run_sparql_in_chunks(self, endpoint: str, query_template: str, keys: list[str]) -> list[dict]:
+        """ Inserts the SPARQL terms of "chunk_size" keys at a time into the "{values}"-placeholder of "query_template"
+        and sends the queries concurrently. The bindings of all chunks are returned in the order of the chunks. """
+        chunks: list[list[str]] = [keys[i:i + self.chunk_size] for i in range(0, len(keys), self.chunk_size)]
+        queries: list[str] = [query_template.replace('{values}', ' '.join(self.to_sparql_term(key) for key in chunk))
+                              for chunk in chunks]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda query: self.run_sparql(endpoint=endpoint, query=query), queries)
+        return [binding for bindings in results for binding in bindings]
+
+    def get_node_keys(self, node_label: str, prop_name: str, missing_prop_name: str = None) -> list[str]:
+        """ Returns the distinct values of "prop_name" of all Nodes "node_label". If "missing_prop_name" is set, only
+        Nodes without this property are considered. """
+        missing_clause: str = '' if missing_prop_name is None else f' AND n.{missing_prop_name} IS NULL'
+        query = f"""
+        MATCH (n:{node_label})
+        WHERE n.{prop_name} IS NOT NULL{missing_clause}
+        RETURN DISTINCT n.{prop_name} AS key
+        """
+        records = self.driver.execute_query(query_=query, database_=self.neo4j_db_name).records
+        return [record['key'] for record in records]
+
+    @staticmethod
+    def get_rows(bindings: list[dict], key_var: str, value_var: str, is_list: bool) -> list[dict]:
+        """ Converts SPARQL bindings into {"key": ..., "value": ...}-rows. For list properties all (distinct) values of
+        a key are collected, otherwise the last value of a key is used. """
+        values: dict[str, list or str] = dict()
+        for binding in bindings:
+            if key_var not in binding or value_var not in binding:
+                continue
+            key, value = binding[key_var]['value'], binding[value_var]['value']
+            if is_list:
+                values.setdefault(key, list())
+                if value not in values[key]:
+                    values[key].append(value)
+            else:
+                values[key] = value
+        return [{'key': key, 'value': value} for key, value in values.items()]
+
+    def write_rows(self, node_label: str, prop_name: str, new_prop_name: str, rows: list[dict]):
+        query = f"""
+        UNWIND $rows AS row
+        MATCH (n:{node_label} {{ {prop_name}: row.key }})
+        SET n.{new_prop_name} = row.value
+        """
+        for i in range(0, len(rows), 1000):
+            self.driver.execute_query(query_=query, parameters_={'rows': rows[i:i + 1000]},
+                                      database_=self.neo4j_db_name)
+        Neo4jConnection.bump_graph_generation(neo4j_db_name=self.neo4j_db_name)
+
+    def import_wikidata_id(self, skip_existing: bool = True):
+        """ Sets the "wikidataID" of Company Nodes. If "skip_existing" is set, Company Nodes that already have a
+        "wikidataID" are not looked up again. """
+        query_template = f"""
+        SELECT ?LEI ?{self.label_wikidata_id}
+        WHERE {{
+            VALUES ?LEI {{ {{values}} }}
+            ?{self.label_wikidata_id}   wdt:P1278   ?LEI .
+        }}"""
+        bindings = self.run_sparql_in_chunks(endpoint=self.wikidata_endpoint, query_template=query_template,
+                                             keys=self.get_node_keys(
+                                                 node_label="Company", prop_name="LEI",
+                                                 missing_prop_name=self.label_wikidata_id if skip_existing else None))
+        rows = self.get_rows(bindings=bindings, key_var="LEI", value_var=self.label_wikidata_id, is_list=False)
+        self.write_rows(node_label="Company", prop_name="LEI", new_prop_name=self.label_wikidata_id, rows=rows)
+
+    def import_data_from_wikidata(self, node_label: str, prop_name: str, prop_wiki_id: str,
+                                  new_prop_name: str, new_prop_wiki_id: str,
+                                  use_new_prop_label: bool, new_prop_is_list: bool):
+        """ Same parameters as "import_data_from_wikidata()" of the class GraphConstruction. """
+        new_prop_var: str = f'{new_prop_name}{"Label" if use_new_prop_label else ""}'
+        query_template = f"""
+        SELECT ?{prop_name} ?{new_prop_var}
+        WHERE {{
+            VALUES ?{prop_name} {{ {{values}} }}
+            ?company wdt:{prop_wiki_id}     ?{prop_name} ;
+                     wdt:{new_prop_wiki_id} ?{new_prop_name} .
+            SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
+        }}"""
+        bindings = self.run_sparql_in_chunks(endpoint=self.wikidata_endpoint, query_template=query_template,
+                                             keys=self.get_node_keys(node_label=node_label, prop_name=prop_name))
+        rows = self.get_rows(bindings=bindings, key_var=prop_name, value_var=new_prop_var, is_list=new_prop_is_list)
+        self.write_rows(node_label=node_label, prop_name=prop_name, new_prop_name=new_prop_name, rows=rows)
+
+    def import_multiple_data_from_wikidata(self, props: list[dict]):
+        """ Imports several wikidata properties with one combined SPARQL query per chunk of Nodes (one "OPTIONAL"-block
+        per property) instead of one pass per property. "props" is a list of dictionaries with the same keys as the
+        parameters of "import_data_from_wikidata()", such as:
+            {"node_label": "Company", "prop_name": "LEI", "prop_wiki_id": "P1278", "new_prop_name": "country",
+             "new_prop_wiki_id": "P17", "use_new_prop_label": True, "new_prop_is_list": False}
+        All dictionaries must have the same "node_label", "prop_name" and "prop_wiki_id". """
+        if not props:
+            return
+        node_label, prop_name, prop_wiki_id = props[0]['node_label'], props[0]['prop_name'], props[0]['prop_wiki_id']
+        if any((prop['node_label'], prop['prop_name'], prop['prop_wiki_id']) != (node_label, prop_name, prop_wiki_id)
+               for prop in props):
+            raise ValueError('"node_label", "prop_name" and "prop_wiki_id" must be the same for all "props"!')
+        new_prop_vars: list[str] = [f'{prop["new_prop_name"]}{"Label" if prop["use_new_prop_label"] else ""}'
+                                    for prop in props]
+        optional_blocks: str = '\n            '.join(
+            f'OPTIONAL {{ ?company wdt:{prop["new_prop_wiki_id"]} ?{prop["new_prop_name"]} . }}' for prop in props)
+        query_template = f"""
+        SELECT ?{prop_name} {' '.join('?' + new_prop_var for new_prop_var in new_prop_vars)}
+        WHERE {{
+            VALUES ?{prop_name} {{ {{values}} }}
+            ?company wdt:{prop_wiki_id} ?{prop_name} .
+            {optional_blocks}
+            SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
+        }}"""
+        bindings = self.run_sparql_in_chunks(endpoint=self.wikidata_endpoint, query_template=query_template,
+                                             keys=self.get_node_keys(node_label=node_label, prop_name=prop_name))
+        new_props: dict[str, dict] = dict()
+        for prop, new_prop_var in zip(props, new_prop_vars):
+            for row in self.get_rows(bindings=bindings, key_var=prop_name, value_var=new_prop_var,
+                                     is_list=prop['new_prop_is_list']):
+                new_props.setdefault(row['key'], dict())[prop['new_prop_name']] = row['value']
+        query = f"""
+        UNWIND $rows AS row
+        MATCH (n:{node_label} {{ {prop_name}: row.key }})
+        SET n += row.props
+        """
+        rows: list[dict] = [{'key': key, 'props': key_props} for key, key_props in new_props.items()]
+        for i in range(0, len(rows), 1000):
+            self.driver.execute_query(query_=query, parameters_={'rows': rows[i:i + 1000]},
+                                      database_=self.neo4j_db_name)
+        Neo4jConnection.bump_graph_generation(neo4j_db_name=self.neo4j_db_name)
+
+    def import_data_from_dbpedia(self, node_label: str, prop_name: str, prop_dbp_id: str,
+                                 new_prop_name: str, new_prop_dbp_id: str,
+                                 new_prop_is_list: bool):
+        """ Same parameters as "import_data_from_dbpedia()" of the class GraphConstruction. """
+        query_template = f"""
+        SELECT ?{prop_name} ?{new_prop_name}
+        WHERE {{
+            VALUES ?{prop_name} {{ {{values}} }}
+            ?dbpcomp   {prop_dbp_id}   ?{prop_name} ;
+                       {new_prop_dbp_id} ?{new_prop_name} .
+            FILTER langMatches( lang(?{new_prop_name}), "en" )
+        }}"""
+        bindings = self.run_sparql_in_chunks(endpoint=self.dbpedia_endpoint, query_template=query_template,
+                                             keys=self.get_node_keys(node_label=node_label, prop_name=prop_name))
+        rows = self.get_rows(bindings=bindings, key_var=prop_name, value_var=new_prop_name, is_list=new_prop_is_list)
+        self.write_rows(node_label=node_label, prop_name=prop_name, new_prop_name=new_prop_name, rows=rows)
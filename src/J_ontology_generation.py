@@ -0,0 +1,358 @@
+import json
+import pathlib
+import pprint
+import re
+import time
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+from rdflib import Graph, Namespace
+from rdflib.namespace import RDFS, RDF, OWL, XSD
+
+from settings import path_data, path_research
+from src.B_rdf_graph import RDFGraph
+
+
+# Units (i.e. the names of the value properties, see: "node_value_props") for the ESRS data types ("Data Type"-column
+# in the ESRS_Draft_10_2023.xlsx). Narrative and semi-narrative data points have no unit and are skipped:
+units_for_data_types: dict[str:str] = {"monetary": "EUR",
+                                       "ghgemissions": "tonsCO2Eq",
+                                       "energy": "MWh",
+                                       "mass": "tons",
+                                       "volume": "cubicmetres",
+                                       "area": "hectares",
+                                       "percent": "percent",
+                                       "percentage": "percent",
+                                       "intensity": "intensity",
+                                       "integer": "count",
+                                       "decimal": "value",
+                                       "numerical": "value"}
+
+# Units for the item types of the XBRL taxonomy ("type"-attribute of the concepts in "esrs-cor.xsd"):
+units_for_item_types: dict[str:str] = {"monetaryItemType": "EUR",
+                                       "ghgEmissionsItemType": "tonsCO2Eq",
+                                       "energyItemType": "MWh",
+                                       "massItemType": "tons",
+                                       "volumeItemType": "cubicmetres",
+                                       "areaItemType": "hectares",
+                                       "percentItemType": "percent",
+                                       "intensityItemType": "intensity",
+                                       "integerItemType": "count",
+                                       "nonNegativeIntegerItemType": "count",
+                                       "decimalItemType": "value"}
+
+xbrl_namespaces: dict[str:str] = {"xsd": "http://www.w3.org/2001/XMLSchema",
+                                  "link": "http://www.xbrl.org/2003/linkbase",
+                                  "xlink": "http://www.w3.org/1999/xlink"}
+
+
+def to_camel_case(text: str) -> str:
+    """ Converts a data point name such as "Gross Scope 1 greenhouse gas emissions" into a label such as
+    "GrossScope1GreenhouseGasEmissions". Abbreviations such as "GHG" are kept. """
+    words = re.findall(r'[A-Za-z0-9]+', text)
+    return ''.join(word[0].upper() + word[1:] for word in words)
+
+
+def get_unit_for_data_type(data_type: str) -> str or None:
+    """ Returns the unit for a "Data Type" of the ESRS_Draft_10_2023.xlsx such as "monetary", "Table/mass" or
+    "Table D Decimal/Integer" (the last part counts) or None for non-numeric data types. """
+    if not isinstance(data_type, str) or not data_type.strip():
+        return None
+    return units_for_data_types.get(data_type.split('/')[-1].strip().lower().replace(' ', ''))
+
+
+class OntologyGenerator:
+    """ Generates an ontology, its parameters ("unique_node_keys", "node_value_props") and its query templates for all
+    numeric ESRS data points in bulk instead of by hand (as was done for "Ontology4.ttl"). The data points are read
+    from the ESRS_Draft_10_2023.xlsx ("read_data_points_from_xlsx()") and/or from the ESRS XBRL taxonomy
+    ("read_data_points_from_taxonomy()"). Every data point becomes a "label" of a Node class:
+        - Data points that are mapped to a Node in the xlsx (column "Node" or tab "InNeo4j") keep this Node and label.
+        - All other data points are grouped into one Node class per disclosure requirement and unit, e.g. "E1_6_tons",
+          which is a subclass of its standard, e.g. "E1".
+    If a base ontology (e.g. "Ontology4.ttl") is provided, its classes, properties and relationships are kept and the
+    new Node classes are linked to the Company with the relationship "reports". Each Node class has exactly one value
+    property (its unit), so that the same query templates as for "Ontology4.ttl" can be created (see: "B_rdf_graph.py").
+    """
+
+    namespace: str = "http://www.semanticweb.org/rainergo/ontologies/2023/10/Ontology4#"
+    relationship: str = "reports"
+
+    def __init__(self, path_to_base_onto: str = None):
+        self.path_to_base_onto: str = path_to_base_onto
+        self.data_points: dict[str, dict] = dict()
+
+    def add_data_point(self, label: str, node: str, unit: str, standard: str, disclosure: str, name: str,
+                       parent: str = None):
+        """ Adds a data point unless a data point with this label already exists (the first one wins). """
+        if not label or label in self.data_points:
+            return
+        self.data_points[label] = {"label": label, "node": node, "relationship": self.relationship, "unit": unit,
+                                   "standard": standard, "disclosure": disclosure, "name": name,
+                                   "parent": parent or standard}
+
+    @staticmethod
+    def get_node_name(disclosure: str, unit: str) -> str:
+        return f"{re.sub(r'[^A-Za-z0-9]+', '_', disclosure).strip('_') or 'ESRS'}_{unit}"
+
+    def read_data_points_from_xlsx(self, path_to_xlsx: str = None) -> int:
+        """ Reads all numeric data points of the tabs with the columns "ESRS", "DR", "Name" and "Data Type" of the
+        ESRS_Draft_10_2023.xlsx. The tab "InNeo4j" maps the data points of "Ontology4.ttl" to their Nodes and labels.
+        Returns the number of data points read. Needs the "openpyxl"-package (see: "pandas.read_excel()"). """
+        path_to_xlsx = pathlib.Path(path_research, 'ESRS/ESRS_Draft_10_2023.xlsx') if path_to_xlsx is None \
+            else pathlib.Path(path_to_xlsx)
+        if not path_to_xlsx.is_file():
+            raise ValueError(f"Path to xlsx '{path_to_xlsx}' does not exist!")
+        sheets: dict[str, pd.DataFrame] = pd.read_excel(path_to_xlsx, sheet_name=None, dtype=str)
+        number_before: int = len(self.data_points)
+
+        # Data points that are already in the Knowledge Graph (Node, label and unit are given, header in 2nd row):
+        mapped: dict[str, dict] = dict()
+        if "InNeo4j" in sheets:
+            in_neo4j: pd.DataFrame = pd.read_excel(path_to_xlsx, sheet_name="InNeo4j", header=1, dtype=str)
+            for row in in_neo4j.dropna(subset=["Node", "Label"]).to_dict(orient="records"):
+                mapped[str(row["Original Variable"]).strip().lower()] = row
+        node_units: dict[str:str] = {data_point["node"]: data_point["unit"] for data_point in self.data_points.values()}
+
+        for sheet_name, df in sheets.items():
+            if not {"ESRS", "DR", "Name", "Data Type"}.issubset(df.columns):
+                continue
+            for row in df.dropna(subset=["Name"]).to_dict(orient="records"):
+                name: str = str(row["Name"]).strip()
+                standard: str = str(row["ESRS"]).strip().replace(' ', '')
+                disclosure: str = str(row["DR"]).strip()
+                if name.lower() in mapped:
+                    item: dict = mapped[name.lower()]
+                    node_units.setdefault(str(item["Node"]).strip(), str(item["Unit"]).strip())
+                    self.add_data_point(label=str(item["Label"]).strip(), node=str(item["Node"]).strip(),
+                                        unit=str(item["Unit"]).strip(), standard=standard, disclosure=disclosure,
+                                        name=name, parent=str(item["ParentNode"]).strip())
+                    continue
+                unit: str = get_unit_for_data_type(row["Data Type"])
+                if unit is None:
+                    continue
+                # The "Node"-column (if any) is only used if all data points of the Node have the same unit:
+                node: str = str(row.get("Node") or '').strip()
+                if not node or node == 'nan' or node_units.setdefault(node, unit) != unit:
+                    node = self.get_node_name(disclosure, unit)
+                self.add_data_point(label=to_camel_case(name), node=node, unit=unit, standard=standard,
+                                    disclosure=disclosure, name=name)
+        return len(self.data_points) - number_before
+
+    def read_data_points_from_taxonomy(self, path_to_taxonomy: str = None) -> int:
+        """ Reads all numeric, non-abstract concepts of the ESRS XBRL taxonomy ("esrs-cor.xsd") with their english
+        labels ("esrs-all-label-en.xml") and their disclosure requirements (the extended link roles of
+        "esrs-all-presentation.xml", defined in "esrs-all.xsd"). Returns the number of data points read. """
+        path_to_taxonomy = pathlib.Path(path_data, 'XBRLs/raw/efrag.org/xbrl/esrs/2022') if path_to_taxonomy is None \
+            else pathlib.Path(path_to_taxonomy)
+        if not pathlib.Path(path_to_taxonomy, 'esrs-cor.xsd').is_file():
+            raise ValueError(f"Path to taxonomy '{path_to_taxonomy}' does not contain 'esrs-cor.xsd'!")
+        number_before: int = len(self.data_points)
+        xlink: str = '{' + xbrl_namespaces["xlink"] + '}'
+
+        # Concepts:
+        concepts: dict[str, dict] = dict()
+        for element in ET.parse(pathlib.Path(path_to_taxonomy, 'esrs-cor.xsd')).getroot().iter(
+                '{' + xbrl_namespaces["xsd"] + '}element'):
+            unit: str = units_for_item_types.get(element.get('type', '').split(':')[-1])
+            if unit is not None and element.get('abstract') != 'true':
+                concepts[element.get('id')] = {"name": element.get('name'), "unit": unit}
+
+        # Disclosure requirements ("E1 - DR E1-07.0 - Scope 1 ...") of the extended link roles:
+        roles: dict[str, str] = dict()
+        path_to_all = pathlib.Path(path_to_taxonomy, 'esrs-all.xsd')
+        if path_to_all.is_file():
+            for role_type in ET.parse(path_to_all).getroot().iter('{' + xbrl_namespaces["link"] + '}roleType'):
+                definition = role_type.find('link:definition', xbrl_namespaces)
+                parts: list[str] = definition.text.split(' - ') if definition is not None and definition.text else []
+                roles[role_type.get('roleURI')] = parts[1].replace('DR', '').strip() if len(parts) > 1 else ''
+        disclosures: dict[str, str] = dict()
+        path_to_presentation = pathlib.Path(path_to_taxonomy, 'esrs-all-presentation.xml')
+        if path_to_presentation.is_file():
+            for link in ET.parse(path_to_presentation).getroot().iter('{' + xbrl_namespaces["link"] + '}presentationLink'):
+                for loc in link.iter('{' + xbrl_namespaces["link"] + '}loc'):
+                    disclosures.setdefault(loc.get(xlink + 'href').split('#')[-1], roles.get(link.get(xlink + 'role'), ''))
+
+        # English labels (via locator -> label arcs):
+        labels: dict[str, str] = dict()
+        path_to_labels = pathlib.Path(path_to_taxonomy, 'esrs-all-label-en.xml')
+        if path_to_labels.is_file():
+            root = ET.parse(path_to_labels).getroot()
+            locators = {loc.get(xlink + 'label'): loc.get(xlink + 'href').split('#')[-1]
+                        for loc in root.iter('{' + xbrl_namespaces["link"] + '}loc')}
+            texts = {label.get(xlink + 'label'): label.text for label in root.iter('{' + xbrl_namespaces["link"] + '}label')
+                     if label.get(xlink + 'role', '').endswith('/label')}
+            for arc in root.iter('{' + xbrl_namespaces["link"] + '}labelArc'):
+                concept_id, text = locators.get(arc.get(xlink + 'from')), texts.get(arc.get(xlink + 'to'))
+                if concept_id is not None and text is not None:
+                    labels.setdefault(concept_id, text.strip())
+
+        for concept_id, concept in concepts.items():
+            disclosure: str = disclosures.get(concept_id, '')
+            self.add_data_point(label=concept["name"], node=self.get_node_name(disclosure, concept["unit"]),
+                                unit=concept["unit"], standard=disclosure.split('-')[0], disclosure=disclosure,
+                                name=labels.get(concept_id, concept["name"]))
+        return len(self.data_points) - number_before
+
+    def get_params(self) -> tuple[dict[str: list[str]], dict[str:str]]:
+        """ Returns "unique_node_keys" and "node_value_props" for all Node classes of the data points (and of the base
+        ontology, if its parameters are passed to "write()"). """
+        unique_node_keys: dict[str: list[str]] = {"Company": ["LEI"]}
+        node_value_props: dict[str:str] = dict()
+        for data_point in self.data_points.values():
+            unique_node_keys[data_point["node"]] = ["period", "label"]
+            node_value_props.setdefault(data_point["node"], data_point["unit"])
+        return unique_node_keys, node_value_props
+
+    def create_ontology(self) -> Graph:
+        """ Returns the base ontology (or an empty ontology) extended by the Node classes, value properties and
+        relationships of all data points. """
+        graph = Graph()
+        if self.path_to_base_onto is not None:
+            graph.parse(self.path_to_base_onto, format="ttl")
+        ns = Namespace(self.namespace)
+        graph.bind("rainergo", ns)
+        graph.add((ns[''], RDF.type, OWL.Ontology))
+        existing_targets: set = {obj for (subj, pred, obj) in graph.triples((None, RDFS.range, None))
+                                 if (subj, RDF.type, OWL.ObjectProperty) in graph}
+        graph.add((ns.Company, RDF.type, OWL.Class))
+        for prop, range_ in [("LEI", XSD.string), ("label", XSD.string)]:
+            graph.add((ns[prop], RDF.type, OWL.DatatypeProperty))
+            graph.add((ns[prop], RDFS.domain, ns.Company))
+            graph.add((ns[prop], RDFS.range, range_))
+        graph.add((ns[self.relationship], RDF.type, OWL.ObjectProperty))
+        graph.add((ns[self.relationship], RDFS.domain, ns.Company))
+        for prop in ["period", "label"]:
+            graph.add((ns[prop], RDF.type, OWL.DatatypeProperty))
+            graph.add((ns[prop], RDFS.range, XSD.string))
+
+        unique_node_keys, node_value_props = self.get_params()
+        parents: dict[str:str] = {data_point["node"]: data_point["parent"] for data_point in self.data_points.values()}
+        for node, unit in node_value_props.items():
+            graph.add((ns[node], RDF.type, OWL.Class))
+            if parents.get(node) and parents[node] != node:
+                graph.add((ns[parents[node]], RDF.type, OWL.Class))
+                graph.add((ns[node], RDFS.subClassOf, ns[parents[node]]))
+            for prop in ["period", "label"]:
+                graph.add((ns[prop], RDFS.domain, ns[node]))
+            graph.add((ns[unit], RDF.type, OWL.DatatypeProperty))
+            graph.add((ns[unit], RDFS.domain, ns[node]))
+            graph.add((ns[unit], RDFS.range, XSD.decimal))
+            if ns[node] not in existing_targets:
+                graph.add((ns[self.relationship], RDFS.range, ns[node]))
+        # The relationship of each data point ("reports" or the relationship of the Node in the base ontology):
+        relationships: dict[str:str] = {str(obj).split('#')[-1]: str(subj).split('#')[-1]
+                                        for (subj, pred, obj) in graph.triples((None, RDFS.range, None))
+                                        if (subj, RDF.type, OWL.ObjectProperty) in graph}
+        for data_point in self.data_points.values():
+            data_point["relationship"] = relationships.get(data_point["node"], self.relationship)
+        return graph
+
+    def write(self, target_dir: str, onto_name: str = "Ontology", unique_node_keys: dict[str: list[str]] = None,
+              node_value_props: dict[str:str] = None) -> dict[str:str]:
+        """ Writes the ontology ("<onto_name>.ttl"), its parameters ("params.py"), the data points ("data_points.json",
+        label -> Node, unit, standard, disclosure requirement and name) and the query templates (into the folder
+        "template_cache", where GraphConstruction looks for them) into "target_dir". The parameters of the base
+        ontology (e.g. "/src/models/Ontologies/onto4/params.py") must be passed if a base ontology is used.
+        Returns the paths of the written files. """
+        target_path = pathlib.Path(target_dir)
+        target_path.mkdir(parents=True, exist_ok=True)
+        new_unique_node_keys, new_node_value_props = self.get_params()
+        unique_node_keys = {**new_unique_node_keys, **(unique_node_keys or dict())}
+        node_value_props = {**new_node_value_props, **(node_value_props or dict())}
+
+        path_to_onto = pathlib.Path(target_path, f'{onto_name}.ttl')
+        self.create_ontology().serialize(destination=path_to_onto.as_posix(), format="ttl")
+        path_to_params = pathlib.Path(target_path, 'params.py')
+        with open(file=path_to_params, mode="w", encoding="utf-8") as file:
+            file.write(f'""" Parameters for {onto_name}.ttl, generated by "OntologyGenerator" (see: '
+                       f'"/src/J_ontology_generation.py"). Please also read the README-models.md-file. """\n\n')
+            file.write(f'unique_node_keys = {pprint.pformat(unique_node_keys, sort_dicts=False)}\n\n')
+            file.write(f'node_value_props = {pprint.pformat(node_value_props, sort_dicts=False)}\n')
+        path_to_data_points = pathlib.Path(target_path, 'data_points.json')
+        with open(file=path_to_data_points, mode="w", encoding="utf-8") as file:
+            json.dump(self.data_points, file, indent=1)
+
+        g = RDFGraph(path_to_onto=path_to_onto.as_posix(), cache_dir=pathlib.Path(target_path, 'template_cache'))
+        for unwind_rows in [False, True]:
+            g.create_query_templates(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                     unwind_rows=unwind_rows)
+        print(f'INFO: {len(self.data_points)} data points in {len(node_value_props)} Node classes written to '
+              f'"{target_path}".')
+        return {"onto": path_to_onto.as_posix(), "params": path_to_params.as_posix(),
+                "data_points": path_to_data_points.as_posix()}
+
+
+def create_sample_data(data_points: dict[str, dict], n_companies: int, periods: list[str]) -> tuple[list, list]:
+    """ Creates node_data/rel_data dictionaries in the format of "get_data_dicts()" (see: "C_read_data.py") for
+    "n_companies" fictitious companies that report all data points in all "periods". """
+    node_data: list = list()
+    rel_data: list = list()
+    for period in periods:
+        for data_point in data_points.values():
+            node_data.append({data_point["node"]: {"label": data_point["label"], "period": period}})
+    for number in range(n_companies):
+        lei: str = f"BENCHMARK{number:011d}"
+        node_data.append({"Company": {"LEI": lei, "label": f"Company {number}"}})
+        for period in periods:
+            for value, data_point in enumerate(data_points.values()):
+                node, unit = data_point["node"], data_point["unit"]
+                rel_data.append({f"Company_{data_point['relationship']}_{node}": {
+                    "source": {"Company": {"LEI": lei}},
+                    "target": {node: {"period": period, "label": data_point["label"], unit: float(value)}}}})
+    return node_data, rel_data
+
+
+def benchmark(path_to_xlsx: str = None, path_to_taxonomy: str = None, target_dir: str = None, n_companies: int = 100,
+              periods: list[str] = None, batch_size: int = 1000, neo4j_db_name: str = None) -> dict[str:float]:
+    """ Measures the generation of the ontology and its query templates for all ESRS data points (cold: with parsing
+    of the ontology, warm: from the template cache), the creation of the node_data/rel_data dictionaries and of the
+    "UNWIND"-batches for "n_companies" companies and, if "neo4j_db_name" is set, the load into the KG. Note: The KG
+    is NOT deleted before the load. Returns the durations in seconds and the numbers of data points and rows. """
+    from src.D_graph_construction import GraphConstruction, create_batches
+    periods = ["2022", "2023"] if periods is None else periods
+    target_dir = pathlib.Path(path_data, 'benchmark_ontology').as_posix() if target_dir is None else target_dir
+    results: dict[str:float] = dict()
+
+    start = time.perf_counter()
+    generator = OntologyGenerator()
+    if path_to_xlsx is not None or path_to_taxonomy is None:
+        generator.read_data_points_from_xlsx(path_to_xlsx=path_to_xlsx)
+    if path_to_taxonomy is not None:
+        generator.read_data_points_from_taxonomy(path_to_taxonomy=path_to_taxonomy)
+    results["read_data_points"] = time.perf_counter() - start
+    unique_node_keys, node_value_props = generator.get_params()
+
+    start = time.perf_counter()
+    paths: dict = generator.write(target_dir=target_dir, onto_name="OntologyESRS")
+    results["write_onto_and_templates_cold"] = time.perf_counter() - start
+    start = time.perf_counter()
+    g = RDFGraph(path_to_onto=paths["onto"], cache_dir=pathlib.Path(target_dir, 'template_cache'))
+    constraint_queries, node_queries, rel_queries, ns_queries = g.create_query_templates(
+        unique_node_keys=unique_node_keys, node_value_props=node_value_props, unwind_rows=True)
+    results["templates_warm"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    node_data, rel_data = create_sample_data(data_points=generator.data_points, n_companies=n_companies,
+                                             periods=periods)
+    results["create_data_dicts"] = time.perf_counter() - start
+    start = time.perf_counter()
+    batches = create_batches(nodes_data=node_data, rels_data=rel_data, node_queries=node_queries,
+                             rel_queries=rel_queries, batch_size=batch_size)
+    results["create_batches"] = time.perf_counter() - start
+
+    if neo4j_db_name is not None:
+        kg = GraphConstruction(path_to_onto=paths["onto"], neo4j_db_name=neo4j_db_name)
+        start = time.perf_counter()
+        kg.load_data_into_knowledge_graph(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                          nodes_data=node_data, rels_data=rel_data, batch_size=batch_size)
+        results["load"] = time.perf_counter() - start
+        results["load_rows_per_second"] = (len(node_data) + len(rel_data)) / results["load"]
+
+    results.update({"data_points": len(generator.data_points), "node_classes": len(node_value_props),
+                    "node_rows": len(node_data), "rel_rows": len(rel_data), "batches": len(batches)})
+    return results
+
+
+if __name__ == '__main__':
+    for key, val in benchmark(n_companies=100).items():
+        print(f'{key}: {val:.3f}' if isinstance(val, float) else f'{key}: {val}')
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import pathlib
+
+from settings import path_data
+
+
+class Manifest:
+    """ Records the content hashes of the inputs (XHTML-reports, JSON-files, ontology, params) of the stages in
+    "main.py" and the outputs each stage produced, so that stages and individual files whose inputs have not changed
+    are skipped (see: "run_incremental_pipeline()" in "main.py"). The manifest is a JSON-file:
+    {'hashes': {path: {'size', 'mtime_ns', 'sha256'}},
+     'stages': {stage: {'inputs_hash': str, 'files': {path: {'sha256': str, 'outputs': [path, ...]}}}}} """
+
+    def __init__(self, path_to_manifest: str = None):
+        self.path_to_manifest: str = pathlib.Path(path_data, 'pipeline_manifest.json').as_posix() \
+            if path_to_manifest is None else path_to_manifest
+        self.data: dict = {'hashes': dict(), 'stages': dict()}
+        if pathlib.Path(self.path_to_manifest).is_file():
+            with open(file=self.path_to_manifest, mode="r", encoding="utf-8") as file:
+                self.data = json.load(file)
+
+    def save(self):
+        """ Writes the manifest atomically, so that an interrupted run never leaves a half written manifest behind. """
+        pathlib.Path(self.path_to_manifest).parent.mkdir(parents=True, exist_ok=True)
+        path_tmp: str = self.path_to_manifest + '.tmp'
+        with open(file=path_tmp, mode="w", encoding="utf-8") as file:
+            json.dump(self.data, file, indent=2)
+        os.replace(path_tmp, self.path_to_manifest)
+
+    def hash_file(self, path: str) -> str:
+        """ Returns the sha256-hash of the content of the file. The file is only read again if its size or
+        modification time differ from the ones stored with the hash in the manifest. """
+        path = pathlib.Path(path).as_posix()
+        stat = os.stat(path)
+        known: dict = self.data['hashes'].get(path)
+        if known is not None and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        sha = hashlib.sha256()
+        with open(file=path, mode="rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                sha.update(block)
+        self.data['hashes'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+        return sha.hexdigest()
+
+    def hash_inputs(self, paths: list[str] = None, values: object = None) -> str:
+        """ Returns one sha256-hash of the names and contents of the files in "paths" and of the JSON-serializable
+        "values" (e.g. parameters of a stage). """
+        sha = hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode('utf-8'))
+        for path in sorted(pathlib.Path(path).as_posix() for path in paths or list()):
+            sha.update(path.encode('utf-8'))
+            sha.update(self.hash_file(path=path).encode('utf-8'))
+        return sha.hexdigest()
+
+    def get_stage(self, stage: str) -> dict:
+        return self.data['stages'].setdefault(stage, {'inputs_hash': None, 'files': dict()})
+
+    def is_up_to_date(self, stage: str, inputs_hash: str) -> bool:
+        """ Returns True if the stage was completed with the same inputs before. """
+        return self.get_stage(stage=stage)['inputs_hash'] == inputs_hash
+
+    def set_up_to_date(self, stage: str, inputs_hash: str):
+        self.get_stage(stage=stage)['inputs_hash'] = inputs_hash
+        self.save()
+
+    def get_changed_files(self, stage: str, paths: list[str]) -> list[str]:
+        """ Returns the files in "paths" that are new or changed since the stage processed them or whose outputs
+        do not exist anymore. """
+        files: dict = self.get_stage(stage=stage)['files']
+        changed: list[str] = list()
+        for path in paths:
+            record: dict = files.get(pathlib.Path(path).as_posix())
+            if record is None or record['sha256'] != self.hash_file(path=path) or \
+                    not all(pathlib.Path(output).exists() for output in record['outputs']):
+                changed.append(path)
+        return changed
+
+    def get_removed_files(self, stage: str, paths: list[str]) -> list[str]:
+        """ Returns the files the stage processed before that are not in "paths" anymore. """
+        current: set[str] = {pathlib.Path(path).as_posix() for path in paths}
+        return [path for path in self.get_stage(stage=stage)['files'] if path not in current]
+
+    def set_file_done(self, stage: str, path: str, outputs: list[str] = None):
+        """ Records that the stage processed the current content of the file and produced "outputs". """
+        path = pathlib.Path(path).as_posix()
+        self.get_stage(stage=stage)['files'][path] = {'sha256': self.hash_file(path=path),
+                                                      'outputs': list() if outputs is None else outputs}
+        self.save()
+
+    def remove_files(self, stage: str, paths: list[str]):
+        files: dict = self.get_stage(stage=stage)['files']
+        for path in paths:
+            files.pop(pathlib.Path(path).as_posix(), None)
+        self.save()
+
+    def reset_stage(self, stage: str):
+        """ Forgets everything the stage did before, e.g. if the KG is rebuilt from scratch. """
+        self.data['stages'][stage] = {'inputs_hash': None, 'files': dict()}
+        self.save()
+
+
+if __name__ == '__main__':
+    manifest = Manifest()
+    json_paths: list[str] = sorted(pathlib.Path(path_data, 'JSONs').glob('*.json'))
+    print('Changed JSON-files:', manifest.get_changed_files(stage='graph', paths=json_paths))
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """ Content-addressed on-disk cache for text embeddings. There is one cache folder per model configuration
+    (model name, number of last layers and pooling mode) within "cache_dir". In this folder, the vectors are stored as
+    float32-rows in the memory-mappable file "vectors.f32" and the file "index.json" maps the sha256-hash of a text to
+    its row (and the vector size). """
+
+    def __init__(self, cache_dir: str, model_name: str, num_last_layers: int):
+        pooling: str = "mean" if num_last_layers > 0 else "pooler"
+        config: str = f'{model_name}_{num_last_layers if num_last_layers > 0 else 0}_{pooling}'.replace('/', '--')
+        self.path: pathlib.Path = pathlib.Path(cache_dir, config)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.path_vectors: pathlib.Path = pathlib.Path(self.path, 'vectors.f32')
+        self.path_index: pathlib.Path = pathlib.Path(self.path, 'index.json')
+        self.vector_size: int or None = None
+        self.index: dict[str, int] = dict()
+        if self.path_index.is_file():
+            with open(file=self.path_index, mode="r", encoding="utf-8") as file:
+                index: dict = json.load(file)
+            self.vector_size, self.index = index['vector_size'], index['rows']
+        self.vectors: np.ndarray = self._open_vectors()
+
+    def _open_vectors(self) -> np.ndarray:
+        if not self.index or not self.path_vectors.is_file():
+            return np.empty((0, 0), dtype=np.float32)
+        return np.memmap(self.path_vectors, dtype=np.float32, mode="r", shape=(len(self.index), self.vector_size))
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, text: str) -> list or None:
+        row: int = self.index.get(self.hash_text(text=text))
+        return None if row is None else self.vectors[row].tolist()
+
+    def put(self, texts: list[str], vectors: list[list]):
+        """ Appends the vectors of texts that are not yet cached and then stores the index. """
+        rows_before: int = len(self.index)
+        new_rows: list[list] = list()
+        for text, vector in zip(texts, vectors):
+            text_hash: str = self.hash_text(text=text)
+            if text_hash not in self.index:
+                self.index[text_hash] = len(self.index)
+                new_rows.append(vector)
+        if not new_rows:
+            return
+        self.vector_size = len(new_rows[0]) if self.vector_size is None else self.vector_size
+        # The memory map must be closed before the file is truncated (on Windows):
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        with open(file=self.path_vectors, mode="ab") as file:
+            # Vectors of an interrupted "put()" that never made it into the index are cut off, so that the rows of
+            # the new vectors match the rows in the index:
+            file.truncate(rows_before * self.vector_size * np.dtype(np.float32).itemsize)
+            file.write(np.asarray(new_rows, dtype=np.float32).tobytes())
+        path_tmp: str = self.path_index.as_posix() + '.tmp'
+        with open(file=path_tmp, mode="w", encoding="utf-8") as file:
+            json.dump({'vector_size': self.vector_size, 'rows': self.index}, file)
+        os.replace(path_tmp, self.path_index)
+        self.vectors = self._open_vectors()
@@ -0,0 +1,113 @@
+import os
+import pathlib
+import threading
+from dotenv import load_dotenv
+
+from neo4j import AsyncDriver, AsyncGraphDatabase, Driver, GraphDatabase
+
+import settings
+
+
+class Neo4jConnection:
+    """ Process-wide connection manager that owns one pooled NEO4J driver per (uri, database). The classes
+    GraphConstruction, GraphQueries and GraphBot get their driver from here, so that multi-step pipelines (see:
+    "main.py") do not create a new driver (and new connections) for every step.
+    The connection settings are read from "settings.py" and can be overridden by the environment variables NEO4J_URI,
+    NEO4J_MAX_CONNECTION_POOL_SIZE, NEO4J_CONNECTION_ACQUISITION_TIMEOUT and NEO4J_MAX_CONNECTION_LIFETIME (e.g. in
+    "secrets.env"). The credentials are read from NEO4J_USER and NEO4J_PW. """
+
+    _drivers: dict[tuple[str, str], Driver] = dict()
+    _lock = threading.Lock()
+    _secrets_loaded: bool = False
+    # Last read graph generation per database: {neo4j_db_name: ((inode, size, mtime_ns), generation)}
+    _generations: dict[str, tuple[tuple, int]] = dict()
+
+    @classmethod
+    def load_secrets(cls):
+        if not cls._secrets_loaded:
+            path_to_secrets: pathlib.Path = pathlib.Path(settings.path_base, 'secrets.env')
+            try:
+                load_dotenv(dotenv_path=path_to_secrets)  # Load secrets/env variables
+            except:
+                print('secrets could not be loaded!')
+            cls._secrets_loaded = True
+
+    @classmethod
+    def get_uri(cls) -> str:
+        cls.load_secrets()
+        return os.getenv('NEO4J_URI', settings.neo4j_uri)
+
+    @classmethod
+    def get_auth(cls) -> tuple[str, str]:
+        cls.load_secrets()
+        return os.getenv('NEO4J_USER'), os.getenv('NEO4J_PW')
+
+    @classmethod
+    def get_driver_config(cls) -> dict:
+        cls.load_secrets()
+        return {'max_connection_pool_size': int(os.getenv('NEO4J_MAX_CONNECTION_POOL_SIZE',
+                                                          settings.neo4j_max_connection_pool_size)),
+                'connection_acquisition_timeout': float(os.getenv('NEO4J_CONNECTION_ACQUISITION_TIMEOUT',
+                                                                  settings.neo4j_connection_acquisition_timeout)),
+                'max_connection_lifetime': float(os.getenv('NEO4J_MAX_CONNECTION_LIFETIME',
+                                                           settings.neo4j_max_connection_lifetime))}
+
+    @classmethod
+    def get_driver(cls, uri: str = None, neo4j_db_name: str = 'neo4j') -> Driver:
+        """ Returns the shared driver for (uri, neo4j_db_name) and creates it on first use. """
+        uri = cls.get_uri() if uri is None else uri
+        with cls._lock:
+            if (uri, neo4j_db_name) not in cls._drivers:
+                cls._drivers[(uri, neo4j_db_name)] = GraphDatabase.driver(uri, auth=cls.get_auth(),
+                                                                          **cls.get_driver_config())
+            return cls._drivers[(uri, neo4j_db_name)]
+
+    @classmethod
+    def get_async_driver(cls, uri: str = None, **driver_config) -> AsyncDriver:
+        """ Returns a new asynchronous driver with the same settings. Asynchronous drivers are bound to their event
+        loop and are therefore not shared. "driver_config" overrides single settings. """
+        uri = cls.get_uri() if uri is None else uri
+        return AsyncGraphDatabase.driver(uri, auth=cls.get_auth(), **{**cls.get_driver_config(), **driver_config})
+
+    @classmethod
+    def get_generation_path(cls, neo4j_db_name: str = 'neo4j') -> pathlib.Path:
+        return pathlib.Path(settings.path_data, f'graph_generation_{neo4j_db_name}.txt')
+
+    @classmethod
+    def get_graph_generation(cls, neo4j_db_name: str = 'neo4j') -> int:
+        """ Returns the generation of the KG, i.e. a counter that is increased by "bump_graph_generation()" after
+        every load or enrichment (see: GraphConstruction, SparqlEnrichment). The counter is stored in a file in
+        "/src/data/", so that it is shared between processes (e.g. a nightly load and a dashboard). The file is only
+        read again if its size or modification time changed. """
+        path: pathlib.Path = cls.get_generation_path(neo4j_db_name=neo4j_db_name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 0
+        known: tuple = cls._generations.get(neo4j_db_name)
+        if known is not None and known[0] == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            return known[1]
+        generation: int = int(path.read_text(encoding='utf-8') or 0)
+        cls._generations[neo4j_db_name] = ((stat.st_ino, stat.st_size, stat.st_mtime_ns), generation)
+        return generation
+
+    @classmethod
+    def bump_graph_generation(cls, neo4j_db_name: str = 'neo4j') -> int:
+        """ Increases the generation of the KG after its data was changed, which invalidates all cached query
+        results (see: "GraphQueries"). The file is replaced atomically. Returns the new generation. """
+        with cls._lock:
+            path: pathlib.Path = cls.get_generation_path(neo4j_db_name=neo4j_db_name)
+            generation: int = cls.get_graph_generation(neo4j_db_name=neo4j_db_name) + 1
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path_tmp: pathlib.Path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+            path_tmp.write_text(str(generation), encoding='utf-8')
+            os.replace(path_tmp, path)
+            cls._generations.pop(neo4j_db_name, None)
+            return generation
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            for driver in cls._drivers.values():
+                driver.close()
+            cls._drivers = dict()
@@ -0,0 +1,53 @@
+import csv
+import pathlib
+
+from conftest import path_jsons
+from src.C_read_data import get_data_dicts
+from src.H_bulk_import import BulkImportExporter
+from src.models.Ontologies.onto4.params import unique_node_keys, node_value_props
+
+
+def read_csv(path: str) -> list[list[str]]:
+    with open(file=path, mode="r", encoding="utf-8", newline="") as file:
+        return list(csv.reader(file))
+
+
+def export(tmp_path: pathlib.Path, json_names: list[str]) -> tuple[dict, dict]:
+    node_data, rel_data = get_data_dicts(all_json_paths=[pathlib.Path(path_jsons, name).as_posix()
+                                                         for name in json_names])
+    exporter = BulkImportExporter(unique_node_keys=unique_node_keys, node_value_props=node_value_props)
+    node_files, rel_files = exporter.export(node_data=node_data, relationship_data=rel_data, target_dir=tmp_path)
+    nodes = {pathlib.Path(data).stem: (read_csv(header)[0], read_csv(data)) for header, data in node_files}
+    rels = {pathlib.Path(data).stem: (read_csv(header)[0], read_csv(data)) for header, data in rel_files}
+    return nodes, rels
+
+
+def test_export_headers(tmp_path):
+    nodes, rels = export(tmp_path=tmp_path, json_names=['Adidas_2022.json'])
+    assert nodes['nodes_Company'][0] == [':ID(Company)', 'LEI', 'label', ':LABEL']
+    assert nodes['nodes_Scope1'][0] == [':ID(Scope1)', 'label', 'period', ':LABEL']
+    assert rels['rels_Company_emits_Scope1'][0] == [':START_ID(Company)', ':END_ID(Scope1)', 'tonsCO2Eq:double',
+                                                    ':TYPE']
+
+
+def test_export_rows(tmp_path):
+    nodes, rels = export(tmp_path=tmp_path, json_names=['Adidas_2022.json'])
+    lei: str = nodes['nodes_Company'][1][0][0]
+    assert nodes['nodes_Company'][1] == [[lei, lei, 'Adidas', 'Company']]
+    assert nodes['nodes_Scope1'][1] == [['2022|GrossScope1GHGEmissions', 'GrossScope1GHGEmissions', '2022', 'Scope1']]
+    [row] = rels['rels_Company_emits_Scope1'][1]
+    assert row[0] == lei and row[1] == '2022|GrossScope1GHGEmissions' and row[3] == 'emits'
+    assert float(row[2]) > 0
+
+
+def test_export_deduplicates_nodes_and_relationships(tmp_path):
+    """ The same period of two companies shares the target Nodes, the same JSON-file twice yields the same
+    relationships. Both are written only once. """
+    nodes, rels = export(tmp_path=tmp_path, json_names=['Adidas_2022.json', 'BASF_2022.json', 'BASF_2022.json'])
+    assert len(nodes['nodes_Company'][1]) == 2
+    assert [row[0] for row in nodes['nodes_Waste'][1]] == ['2022|EmissionsToAirByPollutant',
+                                                           '2022|EmissionsToSoilByPollutant',
+                                                           '2022|EmissionsToWaterByPollutant']
+    assert len(rels['rels_Company_emits_Scope1'][1]) == 2
+    assert len(rels['rels_Company_disposes_Waste'][1]) == 6
+    assert len({tuple(row[:2]) for row in rels['rels_Company_disposes_Waste'][1]}) == 6
@@ -0,0 +1,45 @@
+import json
+
+import numpy as np
+
+from src.embedding_cache import EmbeddingCache
+
+
+def create_cache(tmp_path, num_last_layers: int = 4) -> EmbeddingCache:
+    return EmbeddingCache(cache_dir=tmp_path.as_posix(), model_name='org/model', num_last_layers=num_last_layers)
+
+
+def test_put_and_get(tmp_path):
+    cache = create_cache(tmp_path)
+    assert cache.get(text='a') is None
+    cache.put(texts=['a', 'b', 'a'], vectors=[[1.0, 2.0], [3.0, 4.0], [9.0, 9.0]])
+    assert cache.get(text='a') == [1.0, 2.0] and cache.get(text='b') == [3.0, 4.0]
+    cache.put(texts=['b', 'c'], vectors=[[0.0, 0.0], [5.0, 6.0]])
+    assert cache.get(text='b') == [3.0, 4.0] and cache.get(text='c') == [5.0, 6.0]
+    assert cache.path.name == 'org--model_4_mean' and create_cache(tmp_path, num_last_layers=0).path.name \
+        == 'org--model_0_pooler'
+
+
+def test_reopen_after_restart(tmp_path):
+    create_cache(tmp_path).put(texts=['a', 'b'], vectors=[[1.0, 2.0], [3.0, 4.0]])
+    cache = create_cache(tmp_path)
+    assert cache.vector_size == 2 and cache.vectors.shape == (2, 2)
+    assert cache.get(text='b') == [3.0, 4.0]
+    # Another configuration has its own (empty) cache:
+    assert create_cache(tmp_path, num_last_layers=1).get(text='b') is None
+
+
+def test_vectors_of_interrupted_put_are_cut_off(tmp_path):
+    create_cache(tmp_path).put(texts=['a'], vectors=[[1.0, 2.0]])
+    cache = create_cache(tmp_path)
+    # An interrupted "put()" appended vectors, but did not store the index:
+    with open(file=cache.path_vectors, mode="ab") as file:
+        file.write(np.asarray([[7.0, 7.0], [8.0, 8.0]], dtype=np.float32).tobytes())
+    cache = create_cache(tmp_path)
+    assert cache.vectors.shape == (1, 2) and cache.get(text='a') == [1.0, 2.0]
+    cache.put(texts=['b'], vectors=[[3.0, 4.0]])
+    assert cache.path_vectors.stat().st_size == 2 * 2 * np.dtype(np.float32).itemsize
+    cache = create_cache(tmp_path)
+    assert cache.get(text='a') == [1.0, 2.0] and cache.get(text='b') == [3.0, 4.0]
+    with open(file=cache.path_index, mode="r", encoding="utf-8") as file:
+        assert sorted(json.load(file)['rows'].values()) == [0, 1]
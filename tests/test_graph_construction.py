@@ -0,0 +1,197 @@
+import json
+import pathlib
+
+import pytest
+
+import settings
+from conftest import path_jsons, path_onto
+from src.C_read_data import get_data_dicts
+from src.D_graph_construction import GraphConstruction, chunk_rows, diff_relationships, split_relation
+from src.neo4j_connection import Neo4jConnection
+from src.models.Ontologies.onto4.params import unique_node_keys, node_value_props
+
+
+def create_rel_data(lei: str, period: str, label: str, value: float) -> dict:
+    return {"Company_emits_Scope1": {"source": {"Company": {"LEI": lei}},
+                                     "target": {"Scope1": {"period": period, "label": label, "tonsCO2Eq": value}}}}
+
+
+def create_existing_rel(lei: str, period: str, label: str, value: float) -> dict:
+    return {'relation': 'Company|emits|Scope1', 'source': {'LEI': lei},
+            'target': {'period': period, 'label': label}, 'value': value}
+
+
+def test_chunk_rows():
+    assert chunk_rows(rows=list(range(5)), batch_size=2) == [[0, 1], [2, 3], [4]]
+    assert chunk_rows(rows=list(range(4)), batch_size=4) == [[0, 1, 2, 3]]
+    assert chunk_rows(rows=[], batch_size=3) == []
+    with pytest.raises(ValueError):
+        chunk_rows(rows=[1], batch_size=0)
+
+
+def test_split_relation():
+    rel_data: dict = create_rel_data(lei='LEI1', period='2022', label='GrossScope1GHGEmissions', value=1.0)
+    assert split_relation(relation='Company_emits_Scope1', rel_data=rel_data['Company_emits_Scope1']) == \
+        ('Company', 'emits', 'Scope1')
+    rel_data = {"source": {"Company": {"LEI": "LEI1"}},
+                "target": {"EnergyFromFossilSources": {"period": "2022", "label": "X", "MWh": 1.0}}}
+    assert split_relation(relation='Company_consumes_EnergyFromFossilSources', rel_data=rel_data) == \
+        ('Company', 'consumes', 'EnergyFromFossilSources')
+
+
+def test_diff_relationships():
+    rels_data: list[dict] = [create_rel_data(lei='LEI1', period='2022', label='GrossScope1GHGEmissions', value=1.0),
+                             create_rel_data(lei='LEI1', period='2023', label='GrossScope1GHGEmissions', value=2.0),
+                             create_rel_data(lei='LEI2', period='2023', label='GrossScope1GHGEmissions', value=3.0)]
+    existing_rels: list[dict] = [
+        create_existing_rel(lei='LEI1', period='2022', label='GrossScope1GHGEmissions', value=1.0),
+        create_existing_rel(lei='LEI1', period='2023', label='GrossScope1GHGEmissions', value=5.0),
+        create_existing_rel(lei='LEI3', period='2022', label='GrossScope1GHGEmissions', value=4.0)]
+    inserts, updates, deletes = diff_relationships(rels_data=rels_data, existing_rels=existing_rels,
+                                                   unique_node_keys=unique_node_keys,
+                                                   node_value_props=node_value_props)
+    assert inserts == [rels_data[2]]
+    assert updates == [{**existing_rels[1], 'value': 2.0}]
+    assert deletes == [existing_rels[2]]
+
+
+def test_diff_relationships_without_changes():
+    rels_data: list[dict] = [create_rel_data(lei='LEI1', period='2022', label='GrossScope1GHGEmissions', value=1.0)]
+    existing_rels: list[dict] = [
+        create_existing_rel(lei='LEI1', period='2022', label='GrossScope1GHGEmissions', value=1.0)]
+    assert diff_relationships(rels_data=rels_data, existing_rels=existing_rels, unique_node_keys=unique_node_keys,
+                              node_value_props=node_value_props) == ([], [], [])
+    inserts, updates, deletes = diff_relationships(rels_data=rels_data, existing_rels=[],
+                                                   unique_node_keys=unique_node_keys,
+                                                   node_value_props=node_value_props)
+    assert (inserts, updates, deletes) == (rels_data, [], [])
+
+
+def test_diff_relationships_deletes_only_in_scope():
+    """ Without "delete_missing", only missing relationships of the (company, period)-pairs in "rels_data" are
+    deleted. """
+    rels_data: list[dict] = [create_rel_data(lei='LEI1', period='2023', label='GrossScope1GHGEmissions', value=2.0)]
+    existing_rels: list[dict] = [
+        create_existing_rel(lei='LEI1', period='2023', label='GrossScope1GHGEmissions', value=2.0),
+        create_existing_rel(lei='LEI1', period='2023', label='OtherScope1', value=1.0),
+        create_existing_rel(lei='LEI1', period='2022', label='OtherScope1', value=1.0),
+        create_existing_rel(lei='LEI2', period='2023', label='OtherScope1', value=1.0)]
+    inserts, updates, deletes = diff_relationships(rels_data=rels_data, existing_rels=existing_rels,
+                                                   unique_node_keys=unique_node_keys,
+                                                   node_value_props=node_value_props, delete_missing=False)
+    assert (inserts, updates, deletes) == ([], [], [existing_rels[1]])
+    inserts, updates, deletes = diff_relationships(rels_data=rels_data, existing_rels=existing_rels,
+                                                   unique_node_keys=unique_node_keys,
+                                                   node_value_props=node_value_props, delete_missing=True)
+    assert deletes == existing_rels[1:]
+
+
+def test_diff_relationships_value_became_null(tmp_path):
+    """ A data point that became null in a changed JSON-file gets no relationship from "get_data_dicts()", so the
+    relationship that is still in the KG is deleted. """
+    company: dict = {'period': '2023', 'label': 'Company1', 'LEI': 'LEI1', 'GrossScope1GHGEmissions': None,
+                     'GrossScope3GHGEmissions': 3.0}
+    json_path = pathlib.Path(tmp_path, 'Company1_2023.json')
+    json_path.write_text(json.dumps(company), encoding='utf-8')
+    node_data, rels_data = get_data_dicts(all_json_paths=[json_path.as_posix()])
+    existing_rels: list[dict] = [
+        create_existing_rel(lei='LEI1', period='2023', label='GrossScope1GHGEmissions', value=1.0),
+        {'relation': 'Company|indirectlyEmits|Scope3', 'source': {'LEI': 'LEI1'},
+         'target': {'period': '2023', 'label': 'GrossScope3GHGEmissions'}, 'value': 3.0}]
+    inserts, updates, deletes = diff_relationships(rels_data=rels_data, existing_rels=existing_rels,
+                                                   unique_node_keys=unique_node_keys,
+                                                   node_value_props=node_value_props, delete_missing=False)
+    assert (inserts, updates, deletes) == ([], [], [existing_rels[0]])
+
+
+class RecordingSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def run(self, query: str, parameters: dict = None):
+        self.driver.runs.append((query, parameters))
+        return self
+
+    def consume(self):
+        pass
+
+    def execute_write(self, transaction_function, *args):
+        if len(self.driver.writes) == self.driver.fail_at_write:
+            raise RuntimeError('Connection lost')
+        self.driver.writes.append(args)
+        return transaction_function(self, *args)
+
+
+class RecordingDriver:
+    """ Stands in for the NEO4J driver: returns "existing_rels" for the read query and records all writes. The write
+    transaction number "fail_at_write" (counted from 0) fails. """
+
+    def __init__(self, existing_rels: list[dict], fail_at_write: int = None):
+        self.existing_rels: list[dict] = existing_rels
+        self.fail_at_write: int or None = fail_at_write
+        self.queries: list[tuple[str, dict]] = list()
+        self.runs: list[tuple[str, dict]] = list()
+        self.writes: list[tuple] = list()
+
+    def execute_query(self, query_: str, parameters_: dict = None, database_: str = None):
+        self.queries.append((query_, parameters_))
+        records = [type('Record', (), {'data': lambda self, row=row: row})() for row in self.existing_rels]
+        return type('EagerResult', (), {'records': records})()
+
+    def session(self, database: str = None) -> RecordingSession:
+        return RecordingSession(driver=self)
+
+
+def test_load_data_incrementally_deletes_null_value(monkeypatch, tmp_path):
+    existing_rels: list[dict] = [
+        create_existing_rel(lei='LEI1', period='2023', label='GrossScope1GHGEmissions', value=1.0),
+        create_existing_rel(lei='LEI1', period='2023', label='OtherScope1', value=1.0)]
+    driver = RecordingDriver(existing_rels=existing_rels)
+    monkeypatch.setattr(Neo4jConnection, 'get_driver', classmethod(lambda cls, uri=None, neo4j_db_name='neo4j': driver))
+    monkeypatch.setattr(settings, 'path_data', tmp_path)
+    kg = GraphConstruction(path_to_onto=path_onto.as_posix(), use_template_cache=False)
+    rels_data: list[dict] = [create_rel_data(lei='LEI1', period='2023', label='GrossScope1GHGEmissions', value=1.0)]
+    changes: dict = kg.load_data_incrementally(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                               nodes_data=[], rels_data=rels_data)
+    assert changes == {'inserts': 0, 'updates': 0, 'deletes': 1}
+    [(query, parameters)] = driver.queries
+    assert 'MATCH (source:Company)-[r:emits]->(target)' in query and parameters['leis'] == ['LEI1']
+    [(delete_query, delete_parameters)] = [run for run in driver.runs if 'DELETE r' in run[0]]
+    assert delete_parameters == {'rows': [existing_rels[1]]}
+
+
+def test_load_data_in_transactions_resumes_at_checkpoint(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'path_data', tmp_path)
+    json_paths: list[str] = [pathlib.Path(path_jsons, name).as_posix() for name in ['Adidas_2022.json', 'BASF_2022.json']]
+    nodes_data, rels_data = get_data_dicts(all_json_paths=json_paths)
+    path_to_checkpoint: str = pathlib.Path(tmp_path, 'checkpoint.json').as_posix()
+
+    def load(driver: RecordingDriver, checkpoint: str):
+        monkeypatch.setattr(Neo4jConnection, 'get_driver',
+                            classmethod(lambda cls, uri=None, neo4j_db_name='neo4j': driver))
+        kg = GraphConstruction(path_to_onto=path_onto.as_posix(), use_template_cache=False)
+        kg.load_data_in_transactions(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                     nodes_data=nodes_data, rels_data=rels_data, all_json_paths=json_paths,
+                                     path_to_checkpoint=checkpoint, batch_size=5)
+
+    complete = RecordingDriver(existing_rels=[])
+    load(driver=complete, checkpoint=pathlib.Path(tmp_path, 'other_checkpoint.json').as_posix())
+    assert len(complete.writes) > 4
+
+    interrupted = RecordingDriver(existing_rels=[], fail_at_write=3)
+    with pytest.raises(RuntimeError):
+        load(driver=interrupted, checkpoint=path_to_checkpoint)
+    assert interrupted.writes == complete.writes[:3]
+    with open(file=path_to_checkpoint, mode="r", encoding="utf-8") as file:
+        assert json.load(file)['last_committed_batch'] == 2
+
+    resumed = RecordingDriver(existing_rels=[])
+    load(driver=resumed, checkpoint=path_to_checkpoint)
+    assert resumed.writes == complete.writes[3:]
+    assert not pathlib.Path(path_to_checkpoint).exists()
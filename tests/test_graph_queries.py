@@ -0,0 +1,156 @@
+import pandas as pd
+import pytest
+
+import settings
+from src.G_graph_queries import Company, ESRS, GraphQueries, ResultCache, Stats, normalise_parameter
+from src.neo4j_connection import Neo4jConnection
+
+
+class RecordingDriver:
+    """ Stands in for the NEO4J driver: records the queries and returns one row per call, or "df" if it is set. """
+
+    def __init__(self):
+        self.calls: list[tuple[str, dict]] = list()
+        self.df: pd.DataFrame or None = None
+
+    def execute_query(self, query_: str, parameters_: dict = None, database_: str = None, result_transformer_=None):
+        self.calls.append((query_, parameters_))
+        if result_transformer_ is not None:
+            return pd.DataFrame({'call': [len(self.calls)]}) if self.df is None else self.df.copy()
+        return [{'call': len(self.calls)}], None, ['call']
+
+
+@pytest.fixture
+def driver(monkeypatch, tmp_path) -> RecordingDriver:
+    driver = RecordingDriver()
+    monkeypatch.setattr(Neo4jConnection, 'get_driver', classmethod(lambda cls, uri=None, neo4j_db_name='neo4j': driver))
+    # The generation of the KG is stored in "path_data":
+    monkeypatch.setattr(settings, 'path_data', tmp_path)
+    monkeypatch.setattr(Neo4jConnection, '_generations', dict())
+    return driver
+
+
+def test_values_are_passed_as_parameters(driver):
+    gq = GraphQueries()
+    gq.get_esrs_data(esrs=ESRS.NetRevenue, company=Company.Adidas, periods=['2022'], limit=5)
+    gq.get_esrs_data(esrs=ESRS.NetRevenue, company=Company.BASF, periods=['2023', '2022'], limit=3)
+    (query_1, parameters_1), (query_2, parameters_2) = driver.calls
+    assert query_1 is query_2
+    assert parameters_1 == {'esrs': 'NetRevenue', 'company': 'Adidas', 'periods': ['2022'], 'limit': 5}
+    assert parameters_2 == {'esrs': 'NetRevenue', 'company': 'BASF', 'periods': ['2023', '2022'], 'limit': 3}
+    for value in ['Adidas', '2022', 'LIMIT 5']:
+        assert value not in query_1
+    assert '$company' in query_1 and '$periods' in query_1 and '$limit' in query_1
+
+
+def test_query_texts_are_cached_per_method_esrs_and_stat(driver):
+    gq = GraphQueries()
+    gq.get_statistics_by_company(esrs=ESRS.NetRevenue, stat=Stats.SUM, periods=['2022'])
+    gq.get_statistics_by_company(esrs=ESRS.NetRevenue, stat=Stats.SUM, periods=['2023'])
+    gq.get_statistics_by_company(esrs=ESRS.NetRevenue, stat=Stats.AVG, periods=['2023'])
+    gq.get_statistics_by_company(esrs=ESRS.TotalGHGEmissions, stat=Stats.SUM, periods=['2023'])
+    queries: list[str] = [query for query, parameters in driver.calls]
+    assert queries[0] is queries[1]
+    assert len({id(query) for query in queries}) == 3
+    assert 'SUM(rel.EUR)' in queries[0] and 'AVG(rel.EUR)' in queries[2]
+
+
+def test_column_names_with_periods_are_quoted(driver):
+    gq = GraphQueries()
+    gq.get_difference_of_two_periods(esrs=ESRS.NetRevenue, periods=['2023', '2022`) RETURN 1 //'])
+    query, parameters = driver.calls[0]
+    assert '`diff_EUR_2023_to_2022``) RETURN 1 //`' in query
+    assert parameters['period_1'] == '2022`) RETURN 1 //' and parameters['period_2'] == '2023'
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_size=2)
+    cache.put(key=('a',), generation=0, result=1)
+    cache.put(key=('b',), generation=0, result=2)
+    assert cache.get(key=('a',), generation=0) == 1
+    cache.put(key=('c',), generation=0, result=3)
+    assert cache.get(key=('b',), generation=0) is None
+    assert cache.get(key=('a',), generation=0) == 1 and cache.get(key=('c',), generation=0) == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_result_cache_ttl(monkeypatch):
+    now: list[float] = [100.0]
+    monkeypatch.setattr('src.G_graph_queries.time.monotonic', lambda: now[0])
+    cache = ResultCache(max_size=10, ttl=60.0)
+    cache.put(key=('a',), generation=0, result=1)
+    now[0] = 160.0
+    assert cache.get(key=('a',), generation=0) == 1
+    now[0] = 160.1
+    assert cache.get(key=('a',), generation=0) is None
+    assert len(cache.entries) == 0
+
+
+def test_result_cache_generation():
+    cache = ResultCache(max_size=10)
+    cache.put(key=('a',), generation=1, result=1)
+    assert cache.get(key=('a',), generation=2) is None
+    assert cache.get(key=('a',), generation=1) is None
+
+
+def test_normalise_parameter():
+    assert normalise_parameter({'periods': ['2023', '2022'], 'limit': 1}) == \
+        normalise_parameter({'limit': 1, 'periods': ['2022', '2023']})
+    assert normalise_parameter({'periods': ['2022']}) != normalise_parameter({'periods': ['2023']})
+    hash(normalise_parameter({'rels': {'NetRevenue': 'receives'}, 'periods': None}))
+
+
+def test_results_are_cached_until_the_graph_changes(driver):
+    gq = GraphQueries(result_cache_size=10)
+    df_1: pd.DataFrame = gq.get_esrs_data(esrs=ESRS.NetRevenue, periods=['2022', '2023'], return_df=True)
+    df_1.loc[0, 'call'] = 99
+    df_2: pd.DataFrame = gq.get_esrs_data(esrs=ESRS.NetRevenue, periods=['2023', '2022'], return_df=True)
+    records: list = gq.get_esrs_data(esrs=ESRS.NetRevenue, periods=['2022', '2023'])
+    assert len(driver.calls) == 2 and list(df_2['call']) == [1] and records == [{'call': 2}]
+    gq.get_esrs_data(esrs=ESRS.NetRevenue, periods=['2022'], return_df=True)
+    assert len(driver.calls) == 3
+    # Every load or enrichment of the KG increases its generation, which invalidates all cached results:
+    Neo4jConnection.bump_graph_generation()
+    df_3: pd.DataFrame = gq.get_esrs_data(esrs=ESRS.NetRevenue, periods=['2022', '2023'], return_df=True)
+    assert len(driver.calls) == 4 and list(df_3['call']) == [4]
+    assert (gq.result_cache.hits, gq.result_cache.misses) == (1, 4)
+
+
+def test_results_are_not_cached_by_default(driver):
+    gq = GraphQueries()
+    gq.get_esrs_data(esrs=ESRS.NetRevenue)
+    gq.get_esrs_data(esrs=ESRS.NetRevenue)
+    assert gq.result_cache is None and len(driver.calls) == 2
+
+
+def test_esrs_table_matches_only_the_relationship_types_of_the_esrs(driver):
+    gq = GraphQueries()
+    driver.df = pd.DataFrame(columns=['company', 'year', 'label', 'value'])
+    gq.get_esrs_table(esrs_list=[ESRS.NetRevenue, ESRS.TotalGHGEmissions, ESRS.GrossScope1GHGEmissions])
+    gq.get_esrs_table(esrs_list=[ESRS.GrossScope1GHGEmissions, ESRS.NetRevenue])
+    gq.get_esrs_table(esrs_list=[ESRS.NetRevenue])
+    queries: list[str] = [query for query, parameters in driver.calls]
+    assert queries[0] is queries[1] and queries[0] is not queries[2]
+    assert '-[rel:emits|receives]->' in queries[0] and '-[rel:receives]->' in queries[2]
+
+
+def test_esrs_table_of_empty_result(driver):
+    driver.df = pd.DataFrame(columns=['company', 'year', 'label', 'value'])
+    table: pd.DataFrame = GraphQueries().get_esrs_table(esrs_list=[ESRS.NetRevenue, ESRS.TotalGHGEmissions],
+                                                        periods=['2022'])
+    assert table.empty
+    assert list(table.columns) == ['company', 'year', 'EUR_NetRevenue', 'tonsCO2Eq_TotalGHGEmissions']
+
+
+def test_esrs_table_with_missing_esrs_and_duplicate_facts(driver):
+    driver.df = pd.DataFrame({'company': ['BASF', 'Adidas', 'Adidas', 'Adidas'],
+                              'year': ['2022', '2023', '2022', '2022'],
+                              'label': ['NetRevenue', 'NetRevenue', 'NetRevenue', 'NetRevenue'],
+                              'value': [3.0, 2.0, 1.0, 5.0]})
+    table: pd.DataFrame = GraphQueries().get_esrs_table(esrs_list=[ESRS.NetRevenue, ESRS.TotalGHGEmissions])
+    assert list(table.columns) == ['company', 'year', 'EUR_NetRevenue', 'tonsCO2Eq_TotalGHGEmissions']
+    assert list(zip(table['company'], table['year'])) == [('Adidas', '2022'), ('Adidas', '2023'), ('BASF', '2022')]
+    # Of duplicate facts of a company and year, the first one is kept:
+    assert list(table['EUR_NetRevenue']) == [1.0, 2.0, 3.0]
+    # An ESRS without any rows is still a column, with NaN values:
+    assert table['tonsCO2Eq_TotalGHGEmissions'].isna().all()
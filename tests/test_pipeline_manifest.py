@@ -0,0 +1,76 @@
+import os
+import pathlib
+
+import pytest
+
+from src.K_pipeline_manifest import Manifest
+
+
+@pytest.fixture
+def files(tmp_path) -> list[str]:
+    paths: list[str] = list()
+    for name in ['a.json', 'b.json']:
+        path = pathlib.Path(tmp_path, name)
+        path.write_text(f'{{"name": "{name}"}}', encoding='utf-8')
+        paths.append(path.as_posix())
+    return paths
+
+
+@pytest.fixture
+def manifest(tmp_path) -> Manifest:
+    return Manifest(path_to_manifest=pathlib.Path(tmp_path, 'manifest.json').as_posix())
+
+
+def test_changed_files(manifest, files):
+    assert manifest.get_changed_files(stage='graph', paths=files) == files
+    manifest.set_file_done(stage='graph', path=files[0])
+    assert manifest.get_changed_files(stage='graph', paths=files) == files[1:]
+    manifest.set_file_done(stage='graph', path=files[1])
+    assert manifest.get_changed_files(stage='graph', paths=files) == []
+    pathlib.Path(files[0]).write_text('{"name": "changed"}', encoding='utf-8')
+    assert manifest.get_changed_files(stage='graph', paths=files) == files[:1]
+    # Other stages are independent:
+    assert manifest.get_changed_files(stage='xbrl', paths=files) == files
+
+
+def test_touched_file_with_same_content_is_unchanged(manifest, files):
+    manifest.set_file_done(stage='graph', path=files[0])
+    stat = os.stat(files[0])
+    os.utime(files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert manifest.get_changed_files(stage='graph', paths=files[:1]) == []
+
+
+def test_missing_outputs_and_removed_files(manifest, files, tmp_path):
+    output = pathlib.Path(tmp_path, 'output.json')
+    output.write_text('{}', encoding='utf-8')
+    manifest.set_file_done(stage='xbrl', path=files[0], outputs=[output.as_posix()])
+    manifest.set_file_done(stage='xbrl', path=files[1])
+    assert manifest.get_changed_files(stage='xbrl', paths=files) == []
+    output.unlink()
+    assert manifest.get_changed_files(stage='xbrl', paths=files) == files[:1]
+    assert manifest.get_removed_files(stage='xbrl', paths=files[:1]) == files[1:]
+    manifest.remove_files(stage='xbrl', paths=files[1:])
+    assert manifest.get_removed_files(stage='xbrl', paths=files[:1]) == []
+
+
+def test_stage_inputs_hash(manifest, files):
+    inputs_hash: str = manifest.hash_inputs(paths=files, values={'LEIs': ['LEI1']})
+    assert inputs_hash == manifest.hash_inputs(paths=files[::-1], values={'LEIs': ['LEI1']})
+    assert inputs_hash != manifest.hash_inputs(paths=files, values={'LEIs': ['LEI1', 'LEI2']})
+    assert not manifest.is_up_to_date(stage='schema', inputs_hash=inputs_hash)
+    manifest.set_up_to_date(stage='schema', inputs_hash=inputs_hash)
+    assert manifest.is_up_to_date(stage='schema', inputs_hash=inputs_hash)
+    pathlib.Path(files[1]).write_text('{"name": "changed"}', encoding='utf-8')
+    assert not manifest.is_up_to_date(stage='schema', inputs_hash=manifest.hash_inputs(paths=files,
+                                                                                       values={'LEIs': ['LEI1']}))
+
+
+def test_manifest_is_saved(manifest, files):
+    manifest.set_file_done(stage='graph', path=files[0])
+    manifest.set_up_to_date(stage='schema', inputs_hash='hash')
+    reloaded = Manifest(path_to_manifest=manifest.path_to_manifest)
+    assert reloaded.get_changed_files(stage='graph', paths=files) == files[1:]
+    assert reloaded.is_up_to_date(stage='schema', inputs_hash='hash')
+    reloaded.reset_stage(stage='graph')
+    assert Manifest(path_to_manifest=manifest.path_to_manifest).get_changed_files(stage='graph', paths=files) == files
+    assert not pathlib.Path(manifest.path_to_manifest + '.tmp').exists()
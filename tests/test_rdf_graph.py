@@ -0,0 +1,35 @@
+import pytest
+from rdflib import Graph
+
+import src.B_rdf_graph
+from conftest import path_onto
+from src.B_rdf_graph import RDFGraph
+from src.models.Ontologies.onto4.params import unique_node_keys, node_value_props
+
+
+def test_warm_start_does_not_parse_the_ontology(tmp_path, monkeypatch):
+    cold = RDFGraph(path_to_onto=path_onto.as_posix(), cache_dir=tmp_path.as_posix())
+    templates: tuple = cold.create_query_templates(unique_node_keys=unique_node_keys,
+                                                   node_value_props=node_value_props, unwind_rows=True)
+    assert cold._rdf_graph is not None and len(list(tmp_path.glob('query_templates_*.json'))) == 1
+
+    def parse(*args, **kwargs):
+        raise AssertionError('The ontology must not be parsed on a warm start!')
+    monkeypatch.setattr(Graph, 'parse', parse)
+    warm = RDFGraph(path_to_onto=path_onto.as_posix(), cache_dir=tmp_path.as_posix())
+    assert warm.create_query_templates(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                       unwind_rows=True) == templates
+    assert warm._rdf_graph is None
+    assert warm.nodes_data_needed == cold.nodes_data_needed and warm.rels_data_needed == cold.rels_data_needed
+
+
+@pytest.mark.parametrize('changed', ['unwind_rows', 'version'])
+def test_template_cache_key(tmp_path, monkeypatch, changed):
+    g = RDFGraph(path_to_onto=path_onto.as_posix(), cache_dir=tmp_path.as_posix())
+    path_1 = g.get_template_cache_path(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                       unwind_rows=True)
+    if changed == 'version':
+        monkeypatch.setattr(src.B_rdf_graph, 'TEMPLATE_CACHE_VERSION', src.B_rdf_graph.TEMPLATE_CACHE_VERSION + 1)
+    path_2 = g.get_template_cache_path(unique_node_keys=unique_node_keys, node_value_props=node_value_props,
+                                       unwind_rows=changed != 'unwind_rows')
+    assert path_1 != path_2 and path_1.parent == path_2.parent == tmp_path
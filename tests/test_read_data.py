@@ -0,0 +1,171 @@
+import json
+import pathlib
+
+import pytest
+
+from conftest import path_jsons, path_data_points
+from src.C_read_data import ColumnarData, get_data_dicts, has_value, iter_data_dicts, iter_json_paths, \
+    load_data_points, read_json_files_parallel, validate_company
+
+json_names: list[str] = ['Adidas_2022.json', 'Adidas_2023.json', 'BASF_2022.json', 'Puma_2022.json']
+
+
+@pytest.fixture(scope='module')
+def data_points() -> dict[str, dict]:
+    return load_data_points(path_to_data_points=path_data_points)
+
+
+@pytest.fixture(scope='module')
+def json_paths() -> list[str]:
+    return [pathlib.Path(path_jsons, name).as_posix() for name in json_names]
+
+
+def normalise(rows: list[dict]) -> set[str]:
+    """ Returns the rows as a set of JSON-strings with all numbers as float, so that dictionaries from different
+    readers can be compared independently of their order and of int/float values in the JSON-files. """
+    def to_float(item):
+        if isinstance(item, dict):
+            return {key: to_float(value) for key, value in item.items()}
+        return float(item) if isinstance(item, (int, float)) and not isinstance(item, bool) else item
+    return {json.dumps(to_float(row), sort_keys=True) for row in rows}
+
+
+def flatten(batches) -> tuple[list[dict], list[dict]]:
+    """ Splits (key, rows)-batches into node_data and rel_data like "get_data_dicts()" returns them. """
+    node_data, rel_data = list(), list()
+    for key, rows in batches:
+        (rel_data if '_' in key else node_data).extend(rows)
+    return node_data, rel_data
+
+
+def test_columnar_data_matches_get_data_dicts(data_points, json_paths):
+    node_data, rel_data = get_data_dicts(all_json_paths=json_paths)
+    data = ColumnarData(data_points=data_points)
+    data.read_json_files(all_json_paths=json_paths)
+    columnar_nodes, columnar_rels = flatten(data.iter_batches(batch_size=7))
+    assert normalise(columnar_nodes) == normalise(node_data)
+    assert normalise(columnar_rels) == normalise(rel_data)
+    assert len(columnar_rels) == len(rel_data) == len(data)
+
+
+def test_columnar_data_batches(data_points, json_paths):
+    data = ColumnarData(data_points=data_points)
+    data.read_json_files(all_json_paths=json_paths)
+    batches = list(data.iter_batches(batch_size=2))
+    assert all(1 <= len(rows) <= 2 for key, rows in batches)
+    assert all(list(row)[0] == key for key, rows in batches for row in rows)
+    keys: list[str] = [key for key, rows in batches]
+    assert keys[0] == 'Company'
+    assert max(i for i, key in enumerate(keys) if '_' not in key) < min(i for i, key in enumerate(keys) if '_' in key)
+    with pytest.raises(ValueError):
+        next(data.iter_batches(batch_size=0))
+
+
+def test_columnar_data_skips_duplicates_and_nulls(data_points):
+    data = ColumnarData(data_points=data_points)
+    company: dict = {'LEI': 'LEI1', 'label': 'Company1', 'period': '2022', 'GrossScope1GHGEmissions': 1.5,
+                     'GrossScope3GHGEmissions': None, 'NotADataPoint': 3.0}
+    assert data.add_company_period(company=company) == 1
+    assert data.add_company_period(company={**company, 'GrossScope1GHGEmissions': 2.5}) == 0
+    company_idx, period_idx, metric_idx, values = data.get_arrays()
+    assert list(values) == [1.5]
+    assert data.metrics[metric_idx[0]] == 'GrossScope1GHGEmissions'
+    assert data.companies == [('LEI1', 'Company1')] and data.periods == ['2022']
+
+
+@pytest.mark.parametrize('batch_size', [1, 5, 1000])
+def test_iter_data_dicts_matches_get_data_dicts(data_points, json_paths, batch_size):
+    node_data, rel_data = get_data_dicts(all_json_paths=json_paths)
+    streamed_nodes, streamed_rels = flatten(iter_data_dicts(json_paths=json_paths, batch_size=batch_size,
+                                                            data_points=data_points))
+    assert normalise(streamed_nodes) == normalise(node_data)
+    assert len(streamed_nodes) == len(normalise(streamed_nodes))
+    assert normalise(streamed_rels) == normalise(rel_data)
+    assert len(streamed_rels) == len(rel_data)
+
+
+def test_iter_data_dicts_yields_nodes_before_their_relationships(data_points, json_paths):
+    nodes_yielded: set[str] = set()
+    for key, rows in iter_data_dicts(json_paths=json_paths, batch_size=3, data_points=data_points):
+        assert 1 <= len(rows) <= 3
+        if '_' not in key:
+            nodes_yielded.update(json.dumps(row, sort_keys=True) for row in rows)
+            continue
+        for row in rows:
+            rel: dict = row[key]
+            source, target = list(rel['source'].items())[0], list(rel['target'].items())[0]
+            target_node: dict = {target[0]: {'label': target[1]['label'], 'period': target[1]['period']}}
+            assert json.dumps(target_node, sort_keys=True) in nodes_yielded
+            assert any(f'"LEI": "{source[1]["LEI"]}"' in node for node in nodes_yielded)
+
+
+def test_get_data_dicts_skips_null_values(data_points, tmp_path, capsys):
+    company: dict = {'LEI': 'LEI1', 'label': 'Company1', 'period': '2022', **dict.fromkeys(data_points, 1.0)}
+    company['GrossScope1GHGEmissions'] = None
+    json_path = pathlib.Path(tmp_path, 'company.json')
+    json_path.write_text(json.dumps(company))
+    node_data, rel_data = get_data_dicts(all_json_paths=[json_path.as_posix()])
+    labels: list[str] = [list(list(row.values())[0]['target'].values())[0]['label'] for row in rel_data]
+    assert sorted(labels) == sorted(label for label in data_points if label != 'GrossScope1GHGEmissions')
+    assert 'INFO' not in capsys.readouterr().out
+
+
+def test_get_data_dicts_reports_missing_data_points(data_points, tmp_path, capsys):
+    company: dict = {'LEI': 'LEI1', 'label': 'Company1', 'period': '2022', 'NetRevenue': 2.0, 'TotalGHGEmissions': 0}
+    json_path = pathlib.Path(tmp_path, 'partial.json')
+    json_path.write_text(json.dumps(company))
+    node_data, rel_data = get_data_dicts(all_json_paths=[json_path.as_posix()])
+    assert normalise(rel_data) == normalise(list(flatten(iter_data_dicts(json_paths=[json_path.as_posix()],
+                                                                         data_points=data_points))[1]))
+    assert len(rel_data) == 2
+    assert {"Company": {"LEI": "LEI1", "label": "Company1"}} in node_data
+    output: str = capsys.readouterr().out
+    assert "'GrossScope1GHGEmissions'" in output and "'NetRevenue'" not in output
+
+
+def test_has_value_uses_node_value_props():
+    rel_data: dict = {"Company_receives_Revenue": {"source": {"Company": {"LEI": "LEI1"}},
+                                                   "target": {"Revenue": {"EUR": 0, "period": "2022", "label": "A"}}}}
+    assert has_value(rel_data=rel_data, node_value_props={"Revenue": "EUR"})
+    rel_data["Company_receives_Revenue"]["target"]["Revenue"]["EUR"] = None
+    assert not has_value(rel_data=rel_data, node_value_props={"Revenue": "EUR"})
+
+
+def test_iter_data_dicts_reads_directory(data_points, json_paths):
+    from_directory = list(iter_data_dicts(json_paths=path_jsons.as_posix(), data_points=data_points))
+    from_glob = list(iter_data_dicts(json_paths=pathlib.Path(path_jsons, '*.json').as_posix(),
+                                     data_points=data_points))
+    assert from_directory == from_glob
+    assert sum(len(rows) for key, rows in from_directory if key == 'Company') == 3
+
+
+def test_read_json_files_parallel_keeps_order(data_points, json_paths):
+    sequential = ColumnarData(data_points=data_points)
+    sequential.read_json_files(all_json_paths=json_paths + json_paths[:1])
+    parallel = ColumnarData(data_points=data_points)
+    parallel.read_json_files(all_json_paths=json_paths + json_paths[:1], parallel=True, max_workers=2, chunk_size=2)
+    assert all((a == b).all() for a, b in zip(sequential.get_arrays(), parallel.get_arrays()))
+    assert sequential.companies == parallel.companies and sequential.periods == parallel.periods
+    companies: list[dict] = read_json_files_parallel(all_json_paths=json_paths, metrics={'NetRevenue'},
+                                                     max_workers=2, chunk_size=1)
+    assert [set(company) for company in companies] == [{'LEI', 'label', 'period', 'NetRevenue'}] * len(json_paths)
+
+
+def test_validate_company():
+    validate_company(company={'LEI': 'LEI1', 'label': 'Company1', 'period': '2022', 'NetRevenue': None},
+                     json_path='valid.json')
+    with pytest.raises(ValueError, match='period'):
+        validate_company(company={'LEI': 'LEI1', 'label': 'Company1'}, json_path='invalid.json')
+    with pytest.raises(ValueError, match='not numeric'):
+        validate_company(company={'LEI': 'LEI1', 'label': 'Company1', 'period': '2022', 'NetRevenue': '1'},
+                         json_path='invalid.json')
+
+
+def test_iter_json_paths_is_sorted(tmp_path):
+    for name in ['c.json', 'a.json', 'b.json', 'd.txt']:
+        pathlib.Path(tmp_path, name).write_text('{}')
+    expected: list[str] = [pathlib.Path(tmp_path, name).as_posix() for name in ['a.json', 'b.json', 'c.json']]
+    assert list(iter_json_paths(json_paths=tmp_path.as_posix())) == expected
+    assert [pathlib.Path(path).as_posix() for path in iter_json_paths(json_paths=f'{tmp_path.as_posix()}/*.json')] \
+        == expected
+    assert list(iter_json_paths(json_paths=expected[::-1])) == expected[::-1]
@@ -0,0 +1,174 @@
+import json
+import pathlib
+import pickle
+
+import pytest
+
+from conftest import path_data_points
+from xbrl.taxonomy import TaxonomySchema
+
+from src.A_read_xbrl import XBRL, extract_ixbrl_facts, merge_taxonomy_snapshots, parse_ixbrl_number
+from src.C_read_data import get_data_dicts, load_data_points
+
+report: str = """<?xml version="1.0" encoding="UTF-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:ix="http://www.xbrl.org/2013/inlineXBRL"
+      xmlns:xbrli="http://www.xbrl.org/2003/instance" xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+      xmlns:iso4217="http://www.xbrl.org/2003/iso4217" xmlns:esrs="https://xbrl.efrag.org/taxonomy/esrs"
+      xmlns:ixt="http://www.xbrl.org/inlineXBRL/transformation/2020-02-12"
+      xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<head><title>Report</title></head>
+<body>
+<div style="display:none"><ix:header><ix:resources>
+  <xbrli:context id="c2023">
+    <xbrli:entity><xbrli:identifier scheme="http://standards.iso.org/iso/17442">LEI1</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2023-01-01</xbrli:startDate><xbrli:endDate>2023-12-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="c2022">
+    <xbrli:entity><xbrli:identifier scheme="http://standards.iso.org/iso/17442">LEI1</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:instant>2022-12-31</xbrli:instant></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="c2023_dim">
+    <xbrli:entity><xbrli:identifier scheme="http://standards.iso.org/iso/17442">LEI1</xbrli:identifier>
+      <xbrli:segment><xbrldi:explicitMember dimension="esrs:Axis">esrs:Member</xbrldi:explicitMember></xbrli:segment>
+    </xbrli:entity>
+    <xbrli:period><xbrli:startDate>2023-01-01</xbrli:startDate><xbrli:endDate>2023-12-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:unit id="EUR"><xbrli:measure>iso4217:EUR</xbrli:measure></xbrli:unit>
+  <xbrli:unit id="tCO2"><xbrli:divide>
+    <xbrli:unitNumerator><xbrli:measure>esrs:tCO2e</xbrli:measure></xbrli:unitNumerator>
+    <xbrli:unitDenominator><xbrli:measure>esrs:year</xbrli:measure></xbrli:unitDenominator>
+  </xbrli:divide></xbrli:unit>
+</ix:resources></ix:header></div>
+<table>
+  <tr><td><ix:nonFraction name="esrs:GrossScope1GHGEmissions" contextRef="c2023" unitRef="tCO2"
+    format="ixt:num-dot-decimal" decimals="0">1,234.5</ix:nonFraction></td></tr>
+  <tr><td><ix:nonFraction name="esrs:GrossScope1GHGEmissions" contextRef="c2023" unitRef="tCO2"
+    format="ixt:num-dot-decimal" decimals="0">9,999</ix:nonFraction></td></tr>
+  <tr><td><ix:nonFraction name="esrs:GrossScope1GHGEmissions" contextRef="c2023_dim" unitRef="tCO2"
+    format="ixt:num-dot-decimal" decimals="0">7</ix:nonFraction></td></tr>
+  <tr><td><ix:nonFraction name="esrs:GrossScope1GHGEmissions" contextRef="c2022" unitRef="tCO2"
+    format="ixt:num-dot-decimal" decimals="0">1,000</ix:nonFraction></td></tr>
+  <tr><td><ix:nonFraction name="esrs:NetRevenue" contextRef="c2023" unitRef="EUR" format="ixt:num-comma-decimal"
+    scale="6" sign="-" decimals="-5">2.345,6</ix:nonFraction></td></tr>
+  <tr><td><ix:nonFraction name="esrs:GrossScope3GHGEmissions" contextRef="c2023" unitRef="tCO2"
+    xsi:nil="true"/></td></tr>
+  <tr><td><ix:nonFraction name="esrs:NotADataPoint" contextRef="c2023" unitRef="EUR">5</ix:nonFraction></td></tr>
+</table>
+</body>
+</html>
+"""
+
+
+@pytest.fixture
+def xhtml_path(tmp_path) -> str:
+    path = pathlib.Path(tmp_path, 'report.xhtml')
+    path.write_text(report, encoding='utf-8')
+    return path.as_posix()
+
+
+@pytest.mark.parametrize('text, number_format, scale, sign, expected', [
+    ('1,234.5', 'ixt:num-dot-decimal', None, None, 1234.5),
+    ('1.234,5', 'ixt:num-comma-decimal', None, None, 1234.5),
+    ("1'234", 'ixt:num-dot-decimal', None, None, 1234.0),
+    (' 1 234 ', None, None, None, 1234.0),
+    ('2.5', 'ixt:num-dot-decimal', '3', None, 2500.0),
+    ('12', None, '-2', None, 0.12),
+    ('7', None, None, '-', -7.0),
+    ('-', 'ixt:fixed-zero', None, '-', 0.0),
+])
+def test_parse_ixbrl_number(text, number_format, scale, sign, expected):
+    value: float = parse_ixbrl_number(text=text, number_format=number_format, scale=scale, sign=sign)
+    assert value == pytest.approx(expected)
+    assert str(value) != '-0.0'
+
+
+def test_extract_ixbrl_facts(xhtml_path):
+    extracted: dict = extract_ixbrl_facts(xhtml_path=xhtml_path,
+                                          concepts={'GrossScope1GHGEmissions', 'GrossScope3GHGEmissions',
+                                                    'NetRevenue'})
+    assert [(fact['concept'], fact['context'], fact['value']) for fact in extracted['facts']] == [
+        ('GrossScope1GHGEmissions', 'c2023', 1234.5), ('GrossScope1GHGEmissions', 'c2023', 9999.0),
+        ('GrossScope1GHGEmissions', 'c2023_dim', 7.0), ('GrossScope1GHGEmissions', 'c2022', 1000.0),
+        ('NetRevenue', 'c2023', pytest.approx(-2345.6e6))]
+    assert extracted['contexts'] == {'c2023': {'lei': 'LEI1', 'period': '2023', 'dimensional': False},
+                                     'c2022': {'lei': 'LEI1', 'period': '2022', 'dimensional': False},
+                                     'c2023_dim': {'lei': 'LEI1', 'period': '2023', 'dimensional': True}}
+    assert extracted['units'] == {'EUR': 'iso4217:EUR', 'tCO2': 'esrs:tCO2e / esrs:year'}
+
+
+def test_extract_facts_to_json(xhtml_path, tmp_path):
+    concepts: list[str] = list(load_data_points(path_to_data_points=path_data_points))
+    json_paths: list[str] = XBRL().extract_facts_to_json(xhtml_path=xhtml_path, label='Company1', concepts=concepts,
+                                                         target_path=tmp_path, periods=['2022', '2023'])
+    assert sorted(pathlib.Path(path).name for path in json_paths) == ['Company1_2022.json', 'Company1_2023.json']
+    with open(file=pathlib.Path(tmp_path, 'Company1_2023.json'), mode="r", encoding="utf-8") as file:
+        company: dict = json.load(file)
+    # Every data point is written, the first of duplicate facts is kept, facts with dimensions are ignored:
+    assert list(company) == ['period', 'label', 'LEI'] + concepts
+    assert company['GrossScope1GHGEmissions'] == 1234.5
+    assert company['NetRevenue'] == pytest.approx(-2345.6e6)
+    assert company['GrossScope3GHGEmissions'] is None
+    # The partial JSON-files can be read by "get_data_dicts()", null values get no relationship:
+    node_data, rel_data = get_data_dicts(all_json_paths=json_paths)
+    assert len(rel_data) == 3
+
+
+def test_extract_facts_to_json_without_facts(xhtml_path, tmp_path):
+    assert XBRL().extract_facts_to_json(xhtml_path=xhtml_path, concepts=['TotalWaterConsumption'],
+                                        target_path=tmp_path) == []
+    assert list(tmp_path.glob('*.json')) == []
+
+
+def create_xbrl(tmp_path, schema_names: list[str]) -> XBRL:
+    """ Returns an XBRL-object with its snapshot in "tmp_path" and one (empty) taxonomy per schema-file in its cache. """
+    xbrl = XBRL()
+    xbrl.source_path = tmp_path.as_posix()
+    xbrl.snapshot_path = pathlib.Path(tmp_path, 'taxonomy_snapshots', 'snapshot.pickle').as_posix()
+    for name in schema_names:
+        schema_path = pathlib.Path(tmp_path, name)
+        if not schema_path.is_file():
+            schema_path.write_text('<schema/>')
+        xbrl.parser.taxParser.taxonomy_cache[schema_path.as_posix()] = TaxonomySchema(
+            schema_url=schema_path.as_posix(), namespace=f'http://example.com/{name}')
+    return xbrl
+
+
+def cached_names(xbrl: XBRL) -> list[str]:
+    return sorted(pathlib.Path(key).name for key in xbrl.parser.taxParser.taxonomy_cache)
+
+
+def test_taxonomy_snapshot_round_trip(tmp_path):
+    create_xbrl(tmp_path, schema_names=['a.xsd', 'b.xsd']).save_taxonomy_snapshot()
+    # The parser of a new XBRL-object loads the snapshot:
+    xbrl = create_xbrl(tmp_path, schema_names=[])
+    assert cached_names(xbrl) == ['a.xsd', 'b.xsd']
+    assert xbrl.parser.taxParser.taxonomy_cache[pathlib.Path(tmp_path, 'a.xsd').as_posix()].namespace \
+        == 'http://example.com/a.xsd'
+    # A changed schema-file invalidates the snapshot:
+    pathlib.Path(tmp_path, 'a.xsd').write_text('<schema>changed</schema>')
+    assert cached_names(create_xbrl(tmp_path, schema_names=[])) == []
+
+
+def test_taxonomy_snapshot_keeps_taxonomies_of_other_processes(tmp_path):
+    xbrl_1 = create_xbrl(tmp_path, schema_names=['a.xsd'])
+    xbrl_2 = create_xbrl(tmp_path, schema_names=['b.xsd'])
+    xbrl_1.save_taxonomy_snapshot()
+    xbrl_2.save_taxonomy_snapshot()
+    assert cached_names(create_xbrl(tmp_path, schema_names=[])) == ['a.xsd', 'b.xsd']
+
+
+def test_taxonomy_snapshot_parts_of_workers_are_merged_once(tmp_path):
+    create_xbrl(tmp_path, schema_names=['a.xsd']).save_taxonomy_snapshot()
+    snapshot_path: str = ''
+    for pid, name in [(1, 'b.xsd'), (2, 'c.xsd')]:
+        worker = create_xbrl(tmp_path, schema_names=[name])
+        worker.snapshot_part_path = f'{worker.snapshot_path}.{pid}.part'
+        worker.save_taxonomy_snapshot()
+        snapshot_path = worker.snapshot_path
+    # The workers do not write the snapshot itself and only the taxonomies they parsed into their part-file:
+    assert cached_names(create_xbrl(tmp_path, schema_names=[])) == ['a.xsd']
+    with open(file=f'{snapshot_path}.1.part', mode='rb') as file:
+        assert [pathlib.Path(key).name for key in pickle.load(file)['taxonomies']] == ['b.xsd']
+    merge_taxonomy_snapshots(snapshot_path=snapshot_path)
+    assert list(pathlib.Path(snapshot_path).parent.glob('*.part')) == []
+    assert cached_names(create_xbrl(tmp_path, schema_names=[])) == ['a.xsd', 'b.xsd', 'c.xsd']
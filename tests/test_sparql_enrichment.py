@@ -0,0 +1,79 @@
+import pytest
+
+from src.I_sparql_enrichment import SparqlEnrichment, SparqlResponseCache
+
+wikidata: str = 'https://query.wikidata.org/sparql'
+dbpedia: str = 'https://dbpedia.org/sparql'
+bindings: list[dict] = [{'key': {'type': 'literal', 'value': 'LEI1'}}]
+
+
+class Response:
+    """ Stands in for the response of "requests.get()". """
+
+    def raise_for_status(self):
+        pass
+
+    def json(self) -> dict:
+        return {'results': {'bindings': bindings}}
+
+
+@pytest.fixture
+def now(monkeypatch) -> list[float]:
+    now: list[float] = [1000.0]
+    monkeypatch.setattr('src.I_sparql_enrichment.time.time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def requests_get(monkeypatch) -> list[str]:
+    queries: list[str] = list()
+
+    def get(endpoint: str, params: dict, timeout: int, headers: dict) -> Response:
+        queries.append(params['query'])
+        return Response()
+    monkeypatch.setattr('src.I_sparql_enrichment.requests.get', get)
+    return queries
+
+
+def test_cache_ttl_per_endpoint(tmp_path, now):
+    cache = SparqlResponseCache(path_to_db=tmp_path / 'cache.sqlite', ttls={dbpedia: 10}, default_ttl=100)
+    cache.put(endpoint=wikidata, query='SELECT ?key  WHERE {}', bindings=bindings)
+    cache.put(endpoint=dbpedia, query='SELECT ?key WHERE {}', bindings=bindings)
+    assert cache.get(endpoint=wikidata, query='SELECT ?key\nWHERE {}') == bindings
+    assert cache.get(endpoint=wikidata, query='SELECT ?other WHERE {}') is None
+    now[0] += 10
+    assert cache.get(endpoint=dbpedia, query='SELECT ?key WHERE {}') == bindings
+    now[0] += 0.1
+    assert cache.get(endpoint=dbpedia, query='SELECT ?key WHERE {}') is None
+    assert cache.get(endpoint=dbpedia, query='SELECT ?key WHERE {}', allow_expired=True) == bindings
+    assert cache.get(endpoint=wikidata, query='SELECT ?key WHERE {}') == bindings
+    now[0] += 90
+    assert cache.get(endpoint=wikidata, query='SELECT ?key WHERE {}') is None
+    # The cache is persistent:
+    reopened = SparqlResponseCache(path_to_db=tmp_path / 'cache.sqlite', ttls={dbpedia: 10}, default_ttl=100)
+    assert reopened.get(endpoint=wikidata, query='SELECT ?key WHERE {}', allow_expired=True) == bindings
+
+
+def test_run_sparql_reads_and_writes_the_cache(tmp_path, now, requests_get):
+    cache = SparqlResponseCache(path_to_db=tmp_path / 'cache.sqlite', default_ttl=100)
+    enrichment = SparqlEnrichment(driver=None, cache=cache)
+    assert enrichment.run_sparql(endpoint=wikidata, query='SELECT ?key WHERE {}') == bindings
+    assert enrichment.run_sparql(endpoint=wikidata, query='SELECT ?key WHERE {}') == bindings
+    assert len(requests_get) == 1
+    now[0] += 101
+    assert enrichment.run_sparql(endpoint=wikidata, query='SELECT ?key WHERE {}') == bindings
+    assert len(requests_get) == 2
+
+
+def test_offline_mode(tmp_path, now, requests_get):
+    cache = SparqlResponseCache(path_to_db=tmp_path / 'cache.sqlite', default_ttl=100)
+    cache.put(endpoint=wikidata, query='SELECT ?key WHERE {}', bindings=bindings)
+    now[0] += 1000
+    enrichment = SparqlEnrichment(driver=None, cache=cache, offline=True)
+    # Expired responses are replayed:
+    assert enrichment.run_sparql(endpoint=wikidata, query='SELECT ?key WHERE {}') == bindings
+    with pytest.raises(ValueError, match='Offline mode'):
+        enrichment.run_sparql(endpoint=dbpedia, query='SELECT ?key WHERE {}')
+    assert requests_get == []
+    with pytest.raises(ValueError, match='cache'):
+        SparqlEnrichment(driver=None, offline=True)